@@ -0,0 +1,269 @@
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from config import Config
+
+class VectorizedBacktester:
+    """
+    Runs the InstitutionalPullbackStrategy rules over a whole candle history at once.
+
+    Indicators and entry conditions are computed as NumPy arrays (one boolean mask
+    per rule), so every bar is evaluated exactly as check_signal would evaluate it
+    as the last candle. Exits are found with a blocked, vectorized first-touch
+    search over the bars following each entry.
+    """
+    def __init__(self, config, slope_threshold=None, sl_atr_buffer=None, reward_ratio=None,
+                 quantity=1, single_position=False, block=256, max_block=4096):
+        self.config = config
+        # Rule parameters default to the live strategy settings
+        self.slope_threshold = config.SLOPE_THRESHOLD_PCT if slope_threshold is None else slope_threshold
+        self.sl_atr_buffer = config.SL_ATR_BUFFER if sl_atr_buffer is None else sl_atr_buffer
+        self.reward_ratio = config.REWARD_RATIO if reward_ratio is None else reward_ratio
+        self.quantity = quantity
+        self.single_position = single_position
+        self.block = block
+        self.max_block = max_block
+        self.logger = logging.getLogger("Backtester")
+
+    def indicators(self, high, low, close, volume, atr_period=14, ema_period=None):
+        """
+        Vectorized EMA / VWAP / ATR / slope with the same conventions as calculate_indicators.
+        """
+        ema, slope = self.ema(close, self.config.EMA_PERIOD if ema_period is None else ema_period)
+
+        tp_v = (high + low + close) / 3 * volume
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = np.cumsum(tp_v) / np.cumsum(volume)
+
+        # ATR: seeded with the mean of the first window, then Wilder smoothing (ta semantics)
+        prev_close = np.r_[np.nan, close[:-1]]
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        atr = np.zeros(len(close))
+        if len(close) >= atr_period:
+            seeded = tr.copy()
+            seeded[:atr_period - 1] = np.nan
+            seeded[atr_period - 1] = tr[:atr_period].mean()
+            atr = pd.Series(seeded).ewm(alpha=1.0 / atr_period, adjust=False).mean().to_numpy(copy=True)
+            atr[:atr_period - 1] = 0.0
+
+        return {'ema_20': ema, 'vwap': vwap, 'atr': atr, 'ema_slope': slope}
+
+    @staticmethod
+    def ema(close, period):
+        """EMA (ewm span=period, adjust=False, min_periods=period) and its per-bar slope."""
+        ema = pd.Series(close).ewm(span=period, min_periods=period, adjust=False).mean().to_numpy()
+        return ema, np.r_[np.nan, np.diff(ema)]
+
+    def signals(self, open_, high, low, close, ind):
+        """
+        Entry masks for every bar. Returns (side, sl, tp) arrays where side is
+        1 for BUY_CALL, -1 for BUY_PUT and 0 for no signal.
+        """
+        ema, vwap, slope = ind['ema_20'], ind['vwap'], ind['ema_slope']
+        atr = np.where(np.isnan(ind['atr']), 10.0, ind['atr'])
+        n = len(close)
+
+        # 1. Trend Filter
+        threshold = close * self.slope_threshold
+        with np.errstate(invalid='ignore'):
+            is_uptrend = (close > vwap) & (slope > threshold)
+            is_downtrend = (close < vwap) & (slope < -threshold)
+
+            # 2. Bounce/Rejection Logic
+            touched_ema = (low <= ema) & (ema <= high)
+
+        warm = np.arange(n) >= 19 # check_signal needs at least 20 candles
+        long_ = warm & touched_ema & is_uptrend & (close > open_)
+        short = warm & touched_ema & ~long_ & is_downtrend & (close < open_)
+
+        # SL beyond candle extreme or EMA plus buffer, TP at reward_ratio x risk
+        long_sl = np.minimum(low, ema) - atr * self.sl_atr_buffer
+        short_sl = np.maximum(high, ema) + atr * self.sl_atr_buffer
+        long_risk = close - long_sl
+        short_risk = short_sl - close
+        long_risk = np.where(long_risk <= 0, atr, long_risk)
+        short_risk = np.where(short_risk <= 0, atr, short_risk)
+
+        side = np.zeros(n, dtype=np.int8)
+        side[long_] = 1
+        side[short] = -1
+        sl = np.where(long_, long_sl, np.where(short, short_sl, np.nan))
+        tp = np.where(long_, close + long_risk * self.reward_ratio,
+                      np.where(short, close - short_risk * self.reward_ratio, np.nan))
+        return side, sl, tp
+
+    def exits(self, open_, high, low, close, entry_idx, side, sl, tp):
+        """
+        Vectorized first-touch search: for every entry, the first later bar whose
+        range reaches SL or TP. SL wins if both are inside the same bar; a gap
+        through the level fills at the open. Unresolved trades exit at the last close.
+        """
+        n = len(close)
+        m = len(entry_idx)
+        exit_idx = np.full(m, n - 1, dtype=np.int64)
+        exit_price = np.full(m, close[-1] if n else np.nan)
+        reason = np.full(m, 'END', dtype=object)
+        side, sl, tp = side[entry_idx], sl[entry_idx], tp[entry_idx] # Per-trade from here on
+
+        pending = np.arange(m)
+        offset = 1
+        width = self.block
+        while pending.size:
+            cols = entry_idx[pending, None] + offset + np.arange(width)[None, :]
+            in_range = cols < n
+            cols_c = np.minimum(cols, n - 1)
+            h, l = high[cols_c], low[cols_c]
+            s = side[pending, None]
+            p_sl, p_tp = sl[pending, None], tp[pending, None]
+
+            sl_hit = np.where(s > 0, l <= p_sl, h >= p_sl) & in_range
+            tp_hit = np.where(s > 0, h >= p_tp, l <= p_tp) & in_range
+            any_hit = sl_hit | tp_hit
+            hit = any_hit.any(axis=1)
+
+            rows = np.nonzero(hit)[0]
+            first = any_hit[rows].argmax(axis=1)
+            trades = pending[rows]
+            bars = cols[rows, first]
+            stopped = sl_hit[rows, first]
+            o = open_[bars]
+            t_side = side[trades]
+            level = np.where(stopped, sl[trades], tp[trades])
+            # Gap fills: long SL / short TP fill at the lower of level and open, and vice versa
+            worse_low = (t_side > 0) == stopped
+            fill = np.where(worse_low, np.minimum(level, o), np.maximum(level, o))
+
+            exit_idx[trades] = bars
+            exit_price[trades] = fill
+            reason[trades] = np.where(stopped, 'SL', 'TP')
+
+            exhausted = ~hit & (cols[:, -1] >= n - 1)
+            pending = pending[~hit & ~exhausted]
+            offset += width
+            width = min(width * 2, self.max_block)
+
+        return exit_idx, exit_price, reason
+
+    def run(self, df, capital=None):
+        """
+        Backtests a candle frame (timestamp/open/high/low/close/volume).
+        Returns {'trades': DataFrame, 'equity': Series, 'stats': dict}.
+        """
+        capital = self.config.CAPITAL if capital is None else capital
+        open_ = df['open'].to_numpy(dtype=np.float64)
+        high = df['high'].to_numpy(dtype=np.float64)
+        low = df['low'].to_numpy(dtype=np.float64)
+        close = df['close'].to_numpy(dtype=np.float64)
+        volume = df['volume'].to_numpy(dtype=np.float64)
+
+        ind = self.indicators(high, low, close, volume)
+        side, sl, tp = self.signals(open_, high, low, close, ind)
+        return self.simulate(df, open_, high, low, close, side, sl, tp, capital)
+
+    def simulate(self, df, open_, high, low, close, side, sl, tp, capital):
+        """
+        Turns per-bar entry arrays into trades, an equity curve and summary stats.
+        """
+        n = len(close)
+        entry_idx, exit_idx, exit_price, reason, pnl = self.trade_arrays(open_, high, low, close, side, sl, tp)
+        t_side = side[entry_idx]
+        entry_price = close[entry_idx]
+
+        timestamps = df['timestamp'].to_numpy() if 'timestamp' in df else np.arange(n)
+        trades = pd.DataFrame({
+            'entry_time': timestamps[entry_idx],
+            'exit_time': timestamps[exit_idx],
+            'side': np.where(t_side > 0, 'BUY_CALL', 'BUY_PUT'),
+            'entry_price': entry_price,
+            'stop_loss': sl[entry_idx],
+            'take_profit': tp[entry_idx],
+            'exit_price': exit_price,
+            'exit_reason': reason,
+            'bars_held': exit_idx - entry_idx,
+            'pnl': pnl,
+        })
+
+        equity = self.equity_curve(n, exit_idx, pnl, capital)
+        stats = self.stats(pnl, equity, capital)
+        return {'trades': trades, 'equity': pd.Series(equity, index=df.index), 'stats': stats}
+
+    def evaluate(self, open_, high, low, close, ind, capital=None):
+        """
+        Stats only (no trade frame) for raw arrays; used by the optimizer's workers.
+        """
+        capital = self.config.CAPITAL if capital is None else capital
+        side, sl, tp = self.signals(open_, high, low, close, ind)
+        _, exit_idx, _, _, pnl = self.trade_arrays(open_, high, low, close, side, sl, tp)
+        return self.stats(pnl, self.equity_curve(len(close), exit_idx, pnl, capital), capital)
+
+    @staticmethod
+    def equity_curve(n, exit_idx, pnl, capital):
+        """Capital plus realised P&L, booked on each trade's exit bar."""
+        return capital + np.cumsum(np.bincount(exit_idx, weights=pnl, minlength=n)) if n else np.array([])
+
+    def trade_arrays(self, open_, high, low, close, side, sl, tp):
+        """
+        Entry/exit indices, exit prices, exit reasons and P&L for every trade taken.
+        """
+        entry_idx = np.nonzero(side)[0]
+        exit_idx, exit_price, reason = self.exits(open_, high, low, close, entry_idx, side, sl, tp)
+
+        if self.single_position and len(entry_idx):
+            # Skip signals that fire while a trade is still open
+            keep = []
+            i = 0
+            while i < len(entry_idx):
+                keep.append(i)
+                i = int(np.searchsorted(entry_idx, exit_idx[i], side='right'))
+            keep = np.asarray(keep)
+            entry_idx, exit_idx, exit_price, reason = entry_idx[keep], exit_idx[keep], exit_price[keep], reason[keep]
+
+        pnl = (exit_price - close[entry_idx]) * side[entry_idx] * self.quantity
+        return entry_idx, exit_idx, exit_price, reason, pnl
+
+    @staticmethod
+    def stats(pnl, equity, capital):
+        equity = np.asarray(equity, dtype=np.float64)
+        wins = pnl[pnl > 0]
+        losses = pnl[pnl < 0]
+        drawdown = (np.maximum.accumulate(equity) - equity).max() if len(equity) else 0.0
+        return {
+            'trades': int(len(pnl)),
+            'win_rate': float(len(wins) / len(pnl)) if len(pnl) else 0.0,
+            'total_pnl': float(pnl.sum()),
+            'avg_pnl': float(pnl.mean()) if len(pnl) else 0.0,
+            'profit_factor': float(wins.sum() / -losses.sum()) if len(losses) else float('inf') if len(wins) else 0.0,
+            'max_drawdown': float(drawdown),
+            'final_equity': float(equity[-1]) if len(equity) else float(capital),
+        }
+
+def reference_signals(strategy, df):
+    """
+    Slow reference: check_signal evaluated with each bar as the last candle.
+    Indicators only look backwards, so computing them once and slicing is equivalent.
+    Returns the side array (1, -1, 0) for comparison with VectorizedBacktester.signals.
+    """
+    full = strategy.calculate_indicators(df.copy())
+    side = np.zeros(len(df), dtype=np.int8)
+    for i in range(len(df)):
+        signal = strategy.check_signal(full.iloc[:i + 1])
+        if signal:
+            side[i] = 1 if signal['side'] == 'BUY_CALL' else -1
+    return side
+
+if __name__ == "__main__":
+    from candle_store import CandleStore
+
+    parser = argparse.ArgumentParser(description="Backtest the pullback strategy on stored candles")
+    parser.add_argument("--instrument", default=Config.INDEX_MAPPINGS["BANKNIFTY"])
+    parser.add_argument("--interval", default="1minute")
+    parser.add_argument("--single-position", action="store_true")
+    args = parser.parse_args()
+
+    df = CandleStore(Config.CANDLE_STORE_DIR).read_frame(args.instrument, args.interval)
+    if df.empty:
+        raise SystemExit(f"No stored candles for {args.instrument} ({args.interval})")
+    result = VectorizedBacktester(Config(), single_position=args.single_position).run(df)
+    for key, value in result['stats'].items():
+        print(f"{key:>15}: {value}")
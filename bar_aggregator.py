@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+
+# Supported resampling targets (bucket length in seconds)
+TIMEFRAME_SECONDS = {
+    "1minute": 60,
+    "3minute": 180,
+    "5minute": 300,
+    "15minute": 900,
+}
+
+class BarRing:
+    """
+    Fixed-capacity OHLCV ring for one instrument/timeframe.
+    Columns are preallocated NumPy arrays; updates write in place and never allocate.
+    The bar at `head` is the one still forming.
+    """
+    def __init__(self, seconds, capacity):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.start = np.zeros(capacity, dtype=np.int64)
+        self.open = np.zeros(capacity)
+        self.high = np.zeros(capacity)
+        self.low = np.zeros(capacity)
+        self.close = np.zeros(capacity)
+        self.volume = np.zeros(capacity)
+        self.head = -1
+        self.count = 0
+
+    def update(self, ts, open_, high, low, close, volume):
+        """
+        Folds a tick or lower-timeframe bar starting at epoch second `ts`.
+        Returns True when it closed the previously forming bar.
+        """
+        bucket = ts - ts % self.seconds
+        h = self.head
+        if h >= 0 and bucket == self.start[h]:
+            if high > self.high[h]: self.high[h] = high
+            if low < self.low[h]: self.low[h] = low
+            self.close[h] = close
+            self.volume[h] += volume
+            return False
+        if h >= 0 and bucket < self.start[h]:
+            return False # Late data for an already closed bucket
+
+        h = (h + 1) % self.capacity
+        self.head = h
+        self.start[h] = bucket
+        self.open[h] = open_
+        self.high[h] = high
+        self.low[h] = low
+        self.close[h] = close
+        self.volume[h] = volume
+        if self.count < self.capacity:
+            self.count += 1
+        return self.count > 1
+
+    def reset(self):
+        self.head = -1
+        self.count = 0
+
+    def last_closed(self):
+        """The most recently closed bar as a dict, or None."""
+        if self.count < 2:
+            return None
+        i = (self.head - 1) % self.capacity
+        return self.bar(i)
+
+    def bar(self, i):
+        return {
+            'timestamp': np.datetime64(int(self.start[i]), 's').astype('datetime64[ns]'),
+            'open': float(self.open[i]), 'high': float(self.high[i]), 'low': float(self.low[i]),
+            'close': float(self.close[i]), 'volume': float(self.volume[i]),
+        }
+
+    def arrays(self, last=None):
+        """
+        Chronological copies of the last `last` bars (all if None), forming bar included.
+        """
+        n = self.count if last is None else min(last, self.count)
+        idx = (self.head - np.arange(n - 1, -1, -1)) % self.capacity
+        return {
+            'timestamp': self.start[idx].astype('datetime64[s]').astype('datetime64[ns]'),
+            'open': self.open[idx], 'high': self.high[idx], 'low': self.low[idx],
+            'close': self.close[idx], 'volume': self.volume[idx],
+        }
+
+class BarAggregator:
+    """
+    Turns ticks or 1-minute bars into 1/3/5/15-minute OHLCV per instrument.
+    Memory per instrument is bounded by `capacity` bars per timeframe.
+    """
+    def __init__(self, timeframes=("1minute", "3minute", "5minute", "15minute"), capacity=2000):
+        for tf in timeframes:
+            if tf not in TIMEFRAME_SECONDS:
+                raise ValueError(f"Unsupported timeframe: {tf}")
+        self.timeframes = tuple(timeframes)
+        self.capacity = capacity
+        self.rings = {}       # instrument_key -> {timeframe: BarRing}
+        self.last_input = {}  # instrument_key -> (timestamp ns, close) of the last folded 1-minute bar
+
+    def _rings(self, key):
+        rings = self.rings.get(key)
+        if rings is None:
+            rings = {tf: BarRing(TIMEFRAME_SECONDS[tf], self.capacity) for tf in self.timeframes}
+            self.rings[key] = rings
+        return rings
+
+    def ring(self, key, timeframe):
+        return self._rings(key)[timeframe]
+
+    def add_tick(self, key, ts, price, volume=0.0):
+        """
+        Folds one tick (epoch seconds). Returns the timeframes whose bar just closed.
+        """
+        ts = int(ts)
+        closed = ()
+        for tf, ring in self._rings(key).items():
+            if ring.update(ts, price, price, price, price, volume):
+                closed += (tf,)
+        return closed
+
+    def add_bar(self, key, ts, open_, high, low, close, volume):
+        """
+        Folds one lower-timeframe bar (epoch seconds of its start).
+        Returns the timeframes whose bar just closed.
+        """
+        ts = int(ts)
+        closed = ()
+        for tf, ring in self._rings(key).items():
+            if ring.update(ts, open_, high, low, close, volume):
+                closed += (tf,)
+        return closed
+
+    def reset(self, key):
+        for ring in self._rings(key).values():
+            ring.reset()
+        self.last_input.pop(key, None)
+
+    def update_from_frame(self, key, df):
+        """
+        Folds the closed 1-minute candles of df (all rows but the last) that are
+        newer than what was already folded for `key`. If df no longer lines up
+        with the folded history the instrument is rebuilt from df.
+        Returns (closed_count, reset) for the first configured timeframe.
+        """
+        timestamps = df['timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+        closes = df['close'].to_numpy(dtype=np.float64)
+        start = 0
+        reset = False
+        last = self.last_input.get(key)
+        if last is not None:
+            pos = int(np.searchsorted(timestamps, last[0]))
+            if pos < len(df) and timestamps[pos] == last[0] and closes[pos] == last[1]:
+                start = pos + 1
+            else:
+                reset = True
+        if reset or last is None:
+            self.reset(key)
+            reset = True
+
+        opens = df['open'].to_numpy(dtype=np.float64)
+        highs = df['high'].to_numpy(dtype=np.float64)
+        lows = df['low'].to_numpy(dtype=np.float64)
+        volumes = df['volume'].to_numpy(dtype=np.float64)
+        primary = self.timeframes[0]
+        closed_count = 0
+        for i in range(start, len(df) - 1):
+            closed = self.add_bar(key, timestamps[i] // 1_000_000_000, opens[i], highs[i], lows[i], closes[i], volumes[i])
+            if primary in closed:
+                closed_count += 1
+        if len(df) > 1 and start < len(df) - 1:
+            self.last_input[key] = (timestamps[-2], closes[-2])
+        return closed_count, reset
+
+    def frame(self, key, timeframe, last=None, preview=None):
+        """
+        DataFrame of the last `last` bars (forming bar last). `preview` is an
+        unclosed lower-timeframe candle merged into the forming bar without
+        being committed.
+        """
+        ring = self.ring(key, timeframe)
+        cols = ring.arrays(last)
+        df = pd.DataFrame(cols)
+        if preview is None:
+            return df
+
+        ts = int(pd.Timestamp(preview['timestamp']).value // 1_000_000_000)
+        bucket = ts - ts % ring.seconds
+        row = {'timestamp': np.datetime64(bucket, 's').astype('datetime64[ns]'),
+               'open': float(preview['open']), 'high': float(preview['high']), 'low': float(preview['low']),
+               'close': float(preview['close']), 'volume': float(preview['volume'])}
+        if ring.count and bucket == ring.start[ring.head]:
+            h = ring.head
+            row.update({'open': float(ring.open[h]),
+                        'high': max(float(ring.high[h]), row['high']),
+                        'low': min(float(ring.low[h]), row['low']),
+                        'volume': float(ring.volume[h]) + row['volume']})
+            df = df.iloc[:-1]
+        elif ring.count and bucket < ring.start[ring.head]:
+            return df
+        return pd.concat([df, pd.DataFrame([row])], ignore_index=True)
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import logging
+import argparse
+import platform
+import statistics
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# main_cloud is imported for the dashboard benchmark; keep it off the real journal and instrument dumps
+os.environ.setdefault("JOURNAL_ENABLED", "False")
+os.environ.setdefault("INSTRUMENT_MASTER_ENABLED", "False")
+os.environ.setdefault("PROFILE_ENABLED", "False")
+
+from config import Config
+from upstox_standin import UpstoxStandIn
+
+BAR_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+POSITION_SIZES = (10, 100, 1_000, 10_000)
+QUICK_BAR_SIZES = (1_000, 10_000)
+QUICK_POSITION_SIZES = (10, 100, 1_000)
+
+DEFAULT_BASELINE = "benchmarks/baseline.json" # Tracked in git (data/ is not); record it on the CI machine
+DEFAULT_THRESHOLD = 0.25 # A median this much slower than the baseline is a regression
+
+def make_bars(n, seed=7, base_price=45000.0):
+    """n one-minute OHLCV bars from a seeded random walk."""
+    rng = np.random.default_rng(seed)
+    close = base_price + np.cumsum(rng.normal(0, 20, n))
+    spread = np.abs(rng.normal(0, 10, (2, n)))
+    return pd.DataFrame({
+        'timestamp': pd.date_range("2024-01-01 09:15", periods=n, freq="min", tz="Asia/Kolkata"),
+        'open': np.r_[close[0], close[:-1]],
+        'high': close + spread[0],
+        'low': close - spread[1],
+        'close': close,
+        'volume': rng.integers(500, 1500, n).astype(float),
+    })
+
+def seeded_broker(positions, seed=7):
+    """MockBroker holding `positions` open paper positions spread over the three indices."""
+    from broker import MockBroker
+    rng = np.random.default_rng(seed)
+    broker = MockBroker(initial_capital=1e9)
+    indices = list(Config.INDEX_MAPPINGS)
+    for i in range(positions):
+        idx_key = indices[i % len(indices)]
+        entry = 45000.0 + rng.normal(0, 100)
+        side = "BUY_CALL" if i % 2 else "BUY_PUT"
+        broker.place_order(f"{idx_key}_W_{int(entry) // 100 * 100}_{'CE' if i % 2 else 'PE'}", "MARKET", 15, side,
+                           price=entry, sl=entry - 5000 if i % 2 else entry + 5000,
+                           tp=entry + 5000 if i % 2 else entry - 5000, underlying=idx_key)
+    return broker
+
+# --- Benchmarks: name -> (sizes, quick sizes, setup(size) -> callable, regression threshold) ---
+
+def bench_calculate_indicators(size):
+    from strategy import InstitutionalPullbackStrategy
+    strategy = InstitutionalPullbackStrategy(Config())
+    bars = make_bars(size)
+    return lambda: strategy.calculate_indicators(bars.copy())
+
+def bench_update_indicators(size):
+    """Cold incremental indicator build over `size` bars (first call for a key)."""
+    from strategy import InstitutionalPullbackStrategy
+    bars = make_bars(size)
+    return lambda: InstitutionalPullbackStrategy(Config()).update_indicators("BENCH", bars)
+
+def bench_check_signal(size):
+    from strategy import InstitutionalPullbackStrategy
+    strategy = InstitutionalPullbackStrategy(Config())
+    df = strategy.calculate_indicators(make_bars(size))
+    return lambda: strategy.check_signal(df)
+
+def bench_generate_mock_data(size):
+    from main_cloud import generate_mock_data
+    return lambda: generate_mock_data(length=size)
+
+def bench_place_order(size):
+    """Opens `size` paper positions on an empty MockBroker."""
+    return lambda: seeded_broker(size)
+
+def bench_on_prices(size):
+    broker = seeded_broker(size)
+    prices = {idx_key: 45000.0 for idx_key in Config.INDEX_MAPPINGS}
+    return lambda: broker.on_prices(prices)
+
+def bench_dashboard_state(size):
+    import main_cloud
+    main_cloud.paper_broker = seeded_broker(size)
+    main_cloud.latest_price = main_cloud.nifty_price = main_cloud.sensex_price = 45000.0
+    return main_cloud.build_dashboard_state
+
+def _standin(candles):
+    if candles not in STANDINS:
+        STANDINS[candles] = UpstoxStandIn(seed=7, max_candles=candles).__enter__()
+    return STANDINS[candles]
+
+def _standin_client(standin):
+    from upstox_client import UpstoxClient
+    from http_transport import HttpTransport
+    return UpstoxClient("bench-token", transport=HttpTransport(max_retries=0), base_url=standin.base_url)
+
+def bench_upstox_candles(size):
+    standin = _standin(size)
+    client = _standin_client(standin)
+    key = Config.INDEX_MAPPINGS["BANKNIFTY"]
+    return lambda: client.get_historical_candles(key, "1minute", "2023-01-01", "2024-06-28")
+
+def bench_upstox_ltps(size):
+    standin = _standin(10)
+    client = _standin_client(standin)
+    keys = list(Config.INDEX_MAPPINGS.values())
+    return lambda: client.get_market_ltps(keys)
+
+def bench_upstox_order(size):
+    standin = _standin(10)
+    client = _standin_client(standin)
+    return lambda: client.place_order("NSE_FO|12345", 15, "BUY")
+
+STANDINS = {} # candles -> running UpstoxStandIn, shared across benchmarks
+
+BENCHMARKS = {
+    'calculate_indicators': (BAR_SIZES, QUICK_BAR_SIZES, bench_calculate_indicators, DEFAULT_THRESHOLD),
+    'update_indicators': (BAR_SIZES, QUICK_BAR_SIZES, bench_update_indicators, DEFAULT_THRESHOLD),
+    'check_signal': (BAR_SIZES, QUICK_BAR_SIZES, bench_check_signal, DEFAULT_THRESHOLD),
+    'generate_mock_data': (BAR_SIZES, QUICK_BAR_SIZES, bench_generate_mock_data, DEFAULT_THRESHOLD),
+    'place_order': (POSITION_SIZES, QUICK_POSITION_SIZES, bench_place_order, DEFAULT_THRESHOLD),
+    'on_prices': (POSITION_SIZES, QUICK_POSITION_SIZES, bench_on_prices, DEFAULT_THRESHOLD),
+    'dashboard_state': (POSITION_SIZES, QUICK_POSITION_SIZES, bench_dashboard_state, DEFAULT_THRESHOLD),
+    # Loopback HTTP is noisier than pure compute
+    'upstox_candles': ((1_000, 10_000), (1_000,), bench_upstox_candles, 0.5),
+    'upstox_ltps': ((1,), (1,), bench_upstox_ltps, 0.5),
+    'upstox_order': ((1,), (1,), bench_upstox_order, 0.5),
+}
+
+def measure(fn, min_time=0.2, min_runs=3, max_runs=1000):
+    """Runs fn after one warm-up until min_time has passed (at least min_runs times); returns run times."""
+    fn()
+    times = []
+    started = time.perf_counter()
+    while len(times) < max_runs and (len(times) < min_runs or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+def run(patterns=("*",), quick=False, min_time=0.2):
+    """Runs the matching benchmarks; returns {"name[size]": result}."""
+    results = {}
+    for name, (sizes, quick_sizes, setup, threshold) in BENCHMARKS.items():
+        if not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+        for size in (quick_sizes if quick else sizes):
+            times = measure(setup(size), min_time=min_time)
+            median = statistics.median(times)
+            results[f"{name}[{size}]"] = {
+                'median_s': median,
+                'min_s': min(times),
+                'runs': len(times),
+                'per_item_us': median / size * 1e6,
+                'threshold': threshold,
+            }
+            print(f"{name + f'[{size}]':<32} median {median * 1000:>10.3f}ms  min {min(times) * 1000:>10.3f}ms  "
+                  f"({len(times)} runs)", flush=True)
+    for standin in STANDINS.values():
+        standin.__exit__(None, None, None)
+    STANDINS.clear()
+    return results
+
+def compare(baseline, results, threshold=None):
+    """
+    Benchmarks whose median exceeds the baseline median by more than their
+    threshold (or `threshold` if given): [(key, baseline s, current s, ratio)].
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            continue
+        limit = threshold if threshold is not None else result.get('threshold', DEFAULT_THRESHOLD)
+        ratio = result['median_s'] / base['median_s']
+        if ratio > 1 + limit:
+            regressions.append((key, base['median_s'], result['median_s'], ratio))
+    return regressions
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor() or platform.platform(),
+        'cpus': os.cpu_count(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+    }
+
+def save(path, results):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    os.replace(tmp, path)
+
+if __name__ == "__main__":
+    # python benchmark.py --quick                  run and compare against the saved baseline
+    # python benchmark.py --save                   run everything and record a new baseline
+    # python benchmark.py --only 'upstox_*' --only place_order
+    parser = argparse.ArgumentParser(description="Benchmark the strategy, data and broker hot paths")
+    parser.add_argument("--only", action="append", help="glob over benchmark names (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="smaller input sizes (up to 10k bars / 1k positions)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds spent per benchmark and size")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--threshold", type=float, help="override every benchmark's regression threshold")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL) # Broker and client log every call
+    results = run(args.only or ("*",), quick=args.quick, min_time=args.min_time)
+    if args.output:
+        save(args.output, results)
+    if args.save:
+        save(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    # Without a baseline the gate cannot pass: a missing file must not look like "no regressions"
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; record one on this machine with --save", file=sys.stderr)
+        sys.exit(2)
+    compared = [key for key in results if key in baseline.get('results', {})]
+    if not compared:
+        print(f"No benchmark in this run is in {args.baseline} (different --only/--quick?)", file=sys.stderr)
+        sys.exit(2)
+    regressions = compare(baseline, results, args.threshold)
+    for key, before, after, ratio in regressions:
+        print(f"REGRESSION {key}: {before * 1000:.3f}ms -> {after * 1000:.3f}ms ({ratio:.2f}x)")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions in {len(compared)}/{len(results)} benchmarks against {args.baseline} "
+          f"({baseline['environment']['date']})")
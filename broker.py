@@ -1,5 +1,37 @@
 from datetime import datetime
+import time
 import logging
+import random
+import threading
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+from position_book import PositionBook
+from candle_store import MARKET_TZ
+from request_scheduler import ORDER
+from metrics import ORDER_ACK_SECONDS, ORDER_FILL_SECONDS, TIME_TO_FLAT_SECONDS
+
+def _submit_all(fn, items, workers):
+    """fn(item) for every item at once on a short-lived pool; results in item order."""
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items))), thread_name_prefix="square-off") as pool:
+        return list(pool.map(fn, items))
+
+def _flat_report(broker, started, positions, sent, retried, remaining):
+    """Square-off summary shared by both brokers; time_to_flat_ms is None while anything is still open."""
+    elapsed = time.perf_counter() - started
+    flat = not remaining
+    if flat and positions:
+        TIME_TO_FLAT_SECONDS.observe(elapsed, broker=broker)
+    return {
+        "positions": positions,
+        "orders": sent,
+        "retries": retried,
+        "flat": flat,
+        "remaining": sorted(remaining),
+        "time_to_flat_ms": round(elapsed * 1000, 1) if flat else None,
+        "elapsed_ms": round(elapsed * 1000, 1),
+    }
 
 class AbstractBroker:
     def get_market_data(self, symbol, timeframe, limit=100):
@@ -12,11 +44,23 @@ class AbstractBroker:
         raise NotImplementedError
 
 class MockBroker(AbstractBroker):
-    def __init__(self, initial_capital=100000):
+    def __init__(self, initial_capital=100000, journal=None, journal_stream="paper", exit_latency=0.0,
+                 exit_reject_rate=0.0, seed=None):
         self.capital = initial_capital
-        self.positions = []
+        # Square-off model: simulated exchange round trip per exit and share of exits rejected
+        self.exit_latency = exit_latency
+        self.exit_reject_rate = exit_reject_rate
+        self.exit_rng = random.Random(seed)
+        self.book = PositionBook() # Columnar open positions with SL/TP
         self.orders = []
+        self.marks = {} # underlying -> last seen price
+        self.lock = threading.RLock() # Orders, ticks and square-off arrive on different threads
         self.logger = logging.getLogger("MockBroker")
+        self.journal = journal
+        self.journal_stream = journal_stream
+        self.journal_events = 0 # Events since the last snapshot
+        if journal:
+            self.restore()
         
     def get_market_data(self, symbol, timeframe, limit=100):
         # In a real app, this connects to an API.
@@ -24,70 +68,246 @@ class MockBroker(AbstractBroker):
         # But to satisfy the interface, we return None or expect data passed to strategy
         pass
 
-    def place_order(self, symbol, order_type, quantity, side, price=None, sl=None, tp=None):
+    def place_order(self, symbol, order_type, quantity, side, price=None, sl=None, tp=None, underlying=None, reason=None):
+        """
+        `underlying` is the instrument SL/TP are expressed in (the index for
+        option signals); it defaults to the symbol itself.
+        """
         self.logger.info(f"MOCK ORDER: {side} {quantity} {symbol} @ {price} | SL: {sl} | TP: {tp}")
+        with self.lock:
+            order = {
+                "id": len(self.orders) + 1,
+                "symbol": symbol,
+                "side": side,
+                "quantity": quantity,
+                "price": price,
+                "sl": sl,
+                "tp": tp,
+                "time": datetime.now(),
+                "status": "FILLED"
+            }
+            if underlying:
+                order["underlying"] = underlying
+            if reason:
+                order["reason"] = reason
+            self._apply(order)
+            self._journal(order)
+        return order
+
+    def _apply(self, order):
+        """
+        Applies one order to the book and capital. Shared by live orders and
+        journal replay, so a restore rebuilds exactly the same state.
+        """
+        self.orders.append(order)
+        side, price = order["side"], order["price"]
+        if side == "BUY" or side == "BUY_CALL" or side == "BUY_PUT":
+            self.book.open(order["symbol"], side, order["quantity"], price if price else 0, sl=order["sl"],
+                           tp=order["tp"], underlying=order.get("underlying"), time=order["time"])
+        elif "SELL" in side:
+            # A stop/target exit names its position; otherwise close the oldest in the symbol (FIFO)
+            if "position_id" in order:
+                position = self.book.close(order["position_id"])
+            else:
+                position = self.book.close_symbol(order["symbol"])
+            if position and price:
+                self.capital += self._pnl(position, price)
+
+    def on_prices(self, prices):
+        """
+        Price update {underlying: price}: fills every open position whose
+        stop-loss or take-profit was crossed. Returns the exit orders.
+        """
+        with self.lock:
+            self.marks.update(prices)
+            fills = []
+            for pid, reason, price in self.book.check(prices):
+                position = self.book.get(pid)
+                self.logger.info(f"MOCK {reason} HIT: {position['symbol']} @ {price:.2f}")
+                fills.append(self._exit(pid, position, price, reason))
+            return fills
+
+    def _exit(self, pid, position, price, reason):
+        """Closes one position by id at `price` (caller holds the lock)."""
         order = {
             "id": len(self.orders) + 1,
-            "symbol": symbol,
-            "side": side,
-            "quantity": quantity,
+            "symbol": position['symbol'],
+            "side": "SELL",
+            "quantity": position['quantity'],
             "price": price,
-            "sl": sl,
-            "tp": tp,
+            "sl": None,
+            "tp": None,
             "time": datetime.now(),
-            "status": "FILLED"
+            "status": "FILLED",
+            "reason": reason,
+            "position_id": pid
         }
-        self.orders.append(order)
-        # Simplified position tracking
-        if side == "BUY" or side == "BUY_CALL" or side == "BUY_PUT":
-            self.positions.append({
-                "symbol": symbol, 
-                "quantity": quantity,
-                "entry_price": price if price else 0,
-                "sl": sl,
-                "tp": tp,
-                "side": side
-            })
-        elif "SELL" in side:
-            # Remove matching position logic (simplified - FIFO)
-            for p in self.positions:
-                if p["symbol"] == symbol:
-                    self.positions.remove(p)
-                    break
+        self._apply(order)
+        self._journal(order)
         return order
+
+    @staticmethod
+    def _pnl(position, price):
+        sign = -1 if position['side'] == "BUY_PUT" else 1
+        return (price - position['entry_price']) * sign * position['quantity']
+
+    def _journal(self, order):
+        if not self.journal:
+            return
+        self.journal.append(self.journal_stream, "order", order)
+        self.journal_events += 1
+        if self.journal_events >= self.journal.compact_every:
+            self.journal.snapshot(self.journal_stream, self._state())
+            self.journal_events = 0
+
+    def _state(self):
+        # Order dicts are never changed once applied: a shallow copy of the list is a stable snapshot
+        return {
+            "capital": self.capital,
+            "next_id": self.book.next_id,
+            "positions": self.book.positions(),
+            "orders": list(self.orders),
+        }
+
+    def restore(self):
+        """Rebuilds capital, positions and orders from the journal's snapshot plus later events."""
+        started = time.perf_counter()
+        state, events = self.journal.load(self.journal_stream)
+        with self.lock:
+            if state:
+                self.capital = state["capital"]
+                self.orders = state["orders"]
+                for p in state["positions"]:
+                    self.book.open(p['symbol'], p['side'], p['quantity'], p['entry_price'], sl=p['sl'], tp=p['tp'],
+                                   underlying=p['underlying'], time=p['time'], pid=p['id'])
+                self.book.next_id = state["next_id"]
+            for kind, order in events:
+                if kind == "order":
+                    self._apply(order)
+            self.journal_events = len(events)
+        if state or events:
+            self.logger.info(f"Restored {len(self.book)} positions and {len(self.orders)} orders "
+                             f"({len(events)} events replayed) in {(time.perf_counter() - started) * 1000:.1f}ms")
         
     def get_positions(self):
-        return self.positions
+        with self.lock:
+            return self.book.positions()
+
+    def square_off_all(self, workers=8, retries=2):
+        """
+        Mock closure of all positions at the last seen price (entry if never
+        priced), following the live flow: every exit is submitted at once
+        (each taking `exit_latency`, a share `exit_reject_rate` rejected), the
+        book is re-checked, and stragglers are retried. Returns the same
+        report as UpstoxBroker.square_off_all.
+        """
+        started = time.perf_counter()
+        pending = self.get_positions()
+        self.logger.info(f"MOCK: Squaring off {len(pending)} positions.")
+        total, sent, retried = len(pending), 0, 0
+
+        def submit(p):
+            if self.exit_latency:
+                time.sleep(self.exit_latency) # Simulated round trip, outside the lock like a real POST
+            with self.lock:
+                if self.exit_rng.random() < self.exit_reject_rate:
+                    self.logger.warning(f"MOCK: exit for {p['symbol']} rejected")
+                    return None
+                if self.book.get(p['id']) is None:
+                    return None # Closed meanwhile by SL/TP
+                return self._exit(p['id'], p, self.marks.get(p['underlying'], p['entry_price']), "SQUARE_OFF")
+
+        for attempt in range(retries + 1):
+            _submit_all(submit, pending, workers)
+            sent += len(pending)
+            retried += len(pending) if attempt else 0
+            # Confirm against the book; whatever is still open gets another exit
+            with self.lock:
+                pending = [p for p in pending if self.book.get(p['id']) is not None]
+            if not pending:
+                break
+
+        report = _flat_report("paper", started, total, sent, retried, {p['symbol'] for p in pending})
+        self.logger.info(f"MOCK: square-off {report}")
+        return report
 
-    def square_off_all(self):
-        """Mock closure of all positions"""
-        self.logger.info("MOCK: Squaring off all positions.")
-        for p in self.positions[:]:
-            self.place_order(p['symbol'], "MARKET", p['quantity'], "SELL", price=p['entry_price']) # Simple exit
-        self.positions = []
-        return True
+def _book_time(entry):
+    """
+    Epoch seconds of an order-book entry's exchange_timestamp (else its
+    order_timestamp), or None if it has neither. Upstox sends exchange-local
+    times without a zone.
+    """
+    for field in ('exchange_timestamp', 'order_timestamp'):
+        value = entry.get(field)
+        if not value:
+            continue
+        try:
+            stamp = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            try:
+                stamp = datetime.strptime(value, "%d-%b-%Y %H:%M:%S")
+            except (TypeError, ValueError):
+                continue
+        if stamp.tzinfo is None:
+            stamp = stamp.replace(tzinfo=ZoneInfo(MARKET_TZ))
+        return stamp.timestamp()
+    return None
+
+# Upstox order statuses that end an order's life
+FILLED_STATUSES = {"complete"}
+DEAD_STATUSES = {"rejected", "cancelled"}
 
 class UpstoxBroker(AbstractBroker):
-    def __init__(self, upstox_client):
+    def __init__(self, upstox_client, journal=None, journal_stream="live", pending_ttl=300.0):
         self.client = upstox_client
         self.logger = logging.getLogger("UpstoxBroker")
         self.orders = [] # Local cache for UI
+        self.pending = {} # order id -> order awaiting a fill from the reconciler
+        self.pending_ttl = pending_ttl # Give up on a pending order missing from the order book this long
+        self.lock = threading.Lock()
         self.capital = 0 # In real mode, we track via account balance
-        
-    def place_order(self, symbol, order_type, quantity, side, price=None, sl=None, tp=None):
+        self.journal = journal
+        self.journal_stream = journal_stream
+        if journal:
+            # Positions live at Upstox; only the local order history needs restoring
+            state, events = journal.load(journal_stream)
+            self.orders = (state or {}).get("orders", [])
+            by_id = {o["id"]: o for o in self.orders}
+            for kind, record in events:
+                if kind == "order" and record["id"] not in by_id: # Skip events a snapshot already holds
+                    self.orders.append(record)
+                    by_id[record["id"]] = record
+                elif kind == "fill" and record["id"] in by_id:
+                    by_id[record["id"]].update(record)
+            # Orders still unfilled from today go back to the reconciler (Upstox's order book is per day)
+            since = time.time() - 86400
+            self.pending = {o["id"]: o for o in self.orders if o.get("status") == "PLACED" and o.get("signal_at", 0) > since}
+
+    def prepare(self, symbol, order_type="MARKET"):
+        """Builds the order payload for `symbol` ahead of the signal."""
+        self.client.order_template(symbol, order_type)
+
+    def place_order(self, symbol, order_type, quantity, side, price=None, sl=None, tp=None, signal_at=None):
         """
-        Places a real order on Upstox.
+        Places a real order on Upstox and returns once it is acknowledged.
+        The fill price arrives later through reconcile(). `price` is the
+        expected fill (for slippage); `signal_at` (time.time() of the signal)
+        starts the signal-to-ack and signal-to-fill clocks.
         """
-        self.logger.info(f"LIVE ORDER: {side} {quantity} {symbol} @ {price}")
-        
+        sent_at = time.time()
+        signal_at = signal_at or sent_at
         upstox_side = "BUY" if "BUY" in side else "SELL"
-        
+
         # In this professional implementation, we fire the real order
         order_id = self.client.place_order(symbol, quantity, upstox_side, order_type)
-        
+        acked_at = time.time()
+
         if not order_id:
             self.logger.error("Failed to place order on Upstox API")
             return None
+        ORDER_ACK_SECONDS.observe(acked_at - signal_at, broker="live")
+        self.logger.info(f"LIVE ORDER: {side} {quantity} {symbol} @ {price} -> {order_id} "
+                         f"({(acked_at - sent_at) * 1000:.1f}ms, {(acked_at - signal_at) * 1000:.1f}ms from signal)")
 
         order = {
             "id": order_id,
@@ -98,28 +318,177 @@ class UpstoxBroker(AbstractBroker):
             "sl": sl,
             "tp": tp,
             "time": datetime.now(),
-            "status": "PLACED"
+            "status": "PLACED",
+            "signal_at": signal_at,
+            "ack_ms": round((acked_at - signal_at) * 1000, 1),
         }
-        self.orders.append(order)
+        with self.lock:
+            self.orders.append(order)
+            self.pending[order_id] = order
+            # Under the lock, so the event is queued before any snapshot that includes the order,
+            # and the snapshot copy cannot see the reconciler half-way through an update
+            if self.journal:
+                self.journal.append(self.journal_stream, "order", order)
+                if len(self.orders) % self.journal.compact_every == 0:
+                    self.journal.snapshot(self.journal_stream, {"orders": [dict(o) for o in self.orders]}) # Flat dicts
         return order
+
+    def reconcile(self):
+        """
+        One pass of the fill reconciler: a single order-book request settles
+        every pending order, writing average fill price, slippage against the
+        expected price and signal-to-fill latency onto it. The fill is timed
+        by the book entry's exchange timestamp when it has one, else by this
+        poll. An order still
+        missing from the day's book `pending_ttl` seconds after its signal
+        (e.g. restored from a previous day) is marked UNCONFIRMED and no
+        longer polled. Returns the number of orders settled.
+        """
+        with self.lock:
+            if not self.pending:
+                return 0
+        book = self.client.get_order_book()
+        if book is None:
+            return 0
+        now = time.time()
+        settled = []
+        with self.lock:
+            listed = {entry.get('order_id') for entry in book}
+            for order in [o for oid, o in self.pending.items() if oid not in listed]:
+                if now - order["signal_at"] >= self.pending_ttl:
+                    update = {"id": order["id"], "status": "UNCONFIRMED",
+                              "status_message": f"not in the order book after {self.pending_ttl:.0f}s"}
+                    order.update(update)
+                    del self.pending[order["id"]]
+                    settled.append(update)
+            for entry in book:
+                order = self.pending.get(entry.get('order_id'))
+                status = (entry.get('status') or "").lower()
+                if order is None or status not in FILLED_STATUSES | DEAD_STATUSES:
+                    continue
+                update = {"id": order["id"], "status": "FILLED" if status in FILLED_STATUSES else status.upper()}
+                if status in FILLED_STATUSES:
+                    fill = float(entry.get('average_price') or 0)
+                    update["fill_price"] = fill
+                    # Timed by the exchange, not by this poll; clamped to the signal..poll window against clock skew
+                    filled_at = min(now, max(order["signal_at"], _book_time(entry) or now))
+                    update["fill_ms"] = round((filled_at - order["signal_at"]) * 1000, 1)
+                    if order.get("price"):
+                        sign = 1 if "BUY" in order["side"] else -1
+                        update["slippage"] = round((fill - float(order["price"])) * sign, 2) # > 0: paid more than expected
+                    ORDER_FILL_SECONDS.observe(filled_at - order["signal_at"], broker="live")
+                else:
+                    update["status_message"] = entry.get('status_message')
+                order.update(update)
+                del self.pending[order["id"]]
+                settled.append(update)
+            if self.journal:
+                for update in settled:
+                    self.journal.append(self.journal_stream, "fill", update)
+        for update in settled:
+            if update["status"] == "UNCONFIRMED":
+                self.logger.warning(f"Order {update['id']} {update['status_message']}; no longer tracked")
+                continue
+            self.logger.info(f"Order {update['id']} {update['status']}: fill {update.get('fill_price')} "
+                             f"slippage {update.get('slippage')} | {update.get('fill_ms')}ms from signal")
+        return len(settled)
+
+    def keep_warm(self, idle_seconds):
+        """Warms the pooled connection if nothing was sent for `idle_seconds`."""
+        if time.monotonic() - self.client.last_sent >= idle_seconds:
+            self.client.warm_up()
         
-    def get_positions(self):
-        return self.client.get_positions()
+    def get_positions(self, priority=ORDER):
+        return self.client.get_positions(priority)
+
+    @staticmethod
+    def _open_quantities(positions, symbols=None):
+        """{instrument_token: (net quantity, product)} for positions that are not flat."""
+        return {p['instrument_token']: (int(p['net_quantity']), p.get('product') or "I") for p in positions
+                if int(p.get('net_quantity') or 0) != 0 and (symbols is None or p['instrument_token'] in symbols)}
 
-    def square_off_all(self):
+    def square_off_all(self, workers=8, retries=2, confirm_timeout=5.0, poll_seconds=0.25):
         """
         Fetches all open positions and closes them.
+
+        Every exit is submitted at once (the request scheduler keeps them
+        within the order rate limit) under one tag for this square-off, so
+        each poll can find them in the order book even when an acknowledgement
+        was lost. A poll reads the order book, then the positions, so the
+        positions include every fill the book shows. An instrument gets
+        another exit only when none of its exits is still working and its
+        position agrees with the filled exits, and then only for the quantity
+        still open; up to `retries` rounds, each confirmed for at most
+        `confirm_timeout`. Returns a report with time_to_flat_ms.
         """
+        started = time.perf_counter()
         positions = self.get_positions()
-        if not positions:
+        if positions is None:
+            self.logger.error("Square-off aborted: could not fetch positions.")
+            return _flat_report("live", started, 0, 0, 0, {"<positions unavailable>"})
+        to_send = self._open_quantities(positions)
+        if not to_send:
             self.logger.info("No open positions to square off.")
-            return True
-
-        self.logger.info(f"LIVE: Squaring off {len(positions)} positions.")
-        for p in positions:
-            symbol = p['instrument_token']
-            qty = abs(int(p['net_quantity']))
-            if qty > 0:
-                side = "SELL" if int(p['net_quantity']) > 0 else "BUY"
-                self.client.place_order(symbol, qty, side, "MARKET")
-        return True
+            return _flat_report("live", started, 0, 0, 0, set())
+
+        symbols = set(to_send)
+        opening = {s: net for s, (net, _) in to_send.items()}
+        products = {s: product for s, (_, product) in to_send.items()}
+        tag = f"SQOFF{time.time_ns() // 1_000_000 % 10**12}" # Unique per square-off, within Upstox's 20 characters
+        self.logger.info(f"LIVE: Squaring off {len(symbols)} positions (tag {tag}).")
+        remaining = set(symbols)
+        sent = retried = rounds = 0
+
+        def submit(item):
+            symbol, (net, product) = item
+            side = "SELL" if net > 0 else "BUY"
+            return self.client.place_order(symbol, abs(net), side, "MARKET", product, tag=tag)
+
+        while to_send:
+            # 1. Fire every exit concurrently
+            _submit_all(submit, list(to_send.items()), workers)
+            sent += len(to_send)
+            retried += len(to_send) if rounds else 0
+            rounds += 1
+            to_send = {}
+
+            # 2. Confirm through batched re-fetches until flat, something can be resent, or the timeout
+            deadline = time.monotonic() + confirm_timeout
+            while time.monotonic() < deadline:
+                time.sleep(poll_seconds)
+                book = self.client.get_order_book()
+                if book is None:
+                    continue
+                positions = self.get_positions() # After the book, so it includes every fill seen there
+                if positions is None:
+                    continue
+                working, filled = set(), {}
+                for o in book:
+                    symbol = o.get('instrument_token')
+                    if o.get('tag') != tag or symbol not in symbols:
+                        continue
+                    if (o.get('status') or "").lower() not in FILLED_STATUSES | DEAD_STATUSES:
+                        working.add(symbol)
+                    sign = 1 if o.get('transaction_type') == "BUY" else -1
+                    filled[symbol] = filled.get(symbol, 0) + sign * int(o.get('filled_quantity') or 0)
+                nets = {s: net for s, (net, _) in self._open_quantities(positions, symbols).items()}
+                remaining = working | set(nets)
+                if not remaining:
+                    break
+                # Positions that do not yet reflect the book's fills are stale, not open
+                stale = {s for s in nets if nets[s] != opening[s] + filled.get(s, 0)}
+                ready = {s: (nets[s], products[s]) for s in set(nets) - working - stale}
+                if ready and rounds <= retries:
+                    to_send = ready
+                    break
+                if not working and not stale:
+                    break # Confirmed open, but out of retries
+            if not remaining:
+                break
+
+        report = _flat_report("live", started, len(symbols), sent, retried, remaining)
+        if report["flat"]:
+            self.logger.info(f"LIVE: flat in {report['time_to_flat_ms']}ms ({sent} exits, {retried} retried)")
+        else:
+            self.logger.error(f"LIVE: square-off incomplete, still open: {report['remaining']}")
+        return report
@@ -0,0 +1,162 @@
+import os
+import re
+import logging
+import numpy as np
+import pandas as pd
+
+# One file per column; timestamps are epoch nanoseconds (UTC), prices float64
+COLUMNS = {
+    'timestamp': np.int64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.float64,
+    'oi': np.float64,
+}
+
+MARKET_TZ = "Asia/Kolkata"
+
+class CandleStore:
+    """
+    Persistent, append-only candle columns per instrument/interval.
+
+    Layout: <root>/<instrument>/<interval>/<column>.bin, each a flat array that is
+    memory-mapped on read, so reads are zero-copy slices of the page cache.
+    The row count is the shortest column, which keeps a torn append harmless.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.logger = logging.getLogger("CandleStore")
+        self._maps = {} # (instrument, interval) -> (rows, {column: memmap})
+
+    def _dir(self, instrument_key, interval):
+        safe_key = re.sub(r'[^A-Za-z0-9]+', '_', instrument_key).strip('_')
+        return os.path.join(self.root, safe_key, interval)
+
+    def _path(self, instrument_key, interval, column):
+        return os.path.join(self._dir(instrument_key, interval), f"{column}.bin")
+
+    def count(self, instrument_key, interval):
+        sizes = []
+        for col, dtype in COLUMNS.items():
+            path = self._path(instrument_key, interval, col)
+            if not os.path.exists(path):
+                return 0
+            sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize)
+        return min(sizes)
+
+    def columns(self, instrument_key, interval):
+        """
+        Memory-mapped views of every stored column (read-only).
+        """
+        key = (instrument_key, interval)
+        rows = self.count(instrument_key, interval)
+        cached = self._maps.get(key)
+        if cached and cached[0] == rows:
+            return cached[1]
+
+        maps = {}
+        for col, dtype in COLUMNS.items():
+            if rows == 0:
+                maps[col] = np.empty(0, dtype=dtype)
+            else:
+                maps[col] = np.memmap(self._path(instrument_key, interval, col), dtype=dtype, mode='r', shape=(rows,))
+        self._maps[key] = (rows, maps)
+        return maps
+
+    def last_timestamp(self, instrument_key, interval):
+        ts = self.columns(instrument_key, interval)['timestamp']
+        return int(ts[-1]) if len(ts) else None
+
+    def read(self, instrument_key, interval, start_ns=None, end_ns=None):
+        """
+        Zero-copy, read-only column slices with start_ns <= timestamp < end_ns.
+        Drop them before the next append(): on Windows a mapped file cannot be
+        truncated or extended.
+        """
+        cols = self.columns(instrument_key, interval)
+        ts = cols['timestamp']
+        lo = 0 if start_ns is None else int(np.searchsorted(ts, start_ns, side='left'))
+        hi = len(ts) if end_ns is None else int(np.searchsorted(ts, end_ns, side='left'))
+        return {col: arr[lo:hi] for col, arr in cols.items()}
+
+    def read_frame(self, instrument_key, interval, start_ns=None, end_ns=None):
+        """
+        Same slice as read(), copied into the DataFrame shape get_historical_candles
+        returns. The copy is writable (calculate_indicators assigns into it) and
+        keeps no reference to the maps, so later appends can truncate and grow
+        the files (Windows refuses while a file is mapped).
+        """
+        cols = self.read(instrument_key, interval, start_ns, end_ns)
+        data = {col: np.array(arr) for col, arr in cols.items() if col != 'timestamp'}
+        df = pd.DataFrame(data, copy=False)
+        df.insert(0, 'timestamp', pd.to_datetime(cols['timestamp'], utc=True).tz_convert(MARKET_TZ))
+        return df
+
+    def append(self, instrument_key, interval, candles):
+        """
+        Appends raw Upstox candle rows ([timestamp, open, high, low, close, volume, oi]).
+        Rows at or before the last stored bar are skipped, except that a newer
+        version of the last bar overwrites it in place. Returns rows appended.
+        """
+        if not candles:
+            return 0
+
+        ts = pd.to_datetime([c[0] for c in candles], utc=True).as_unit('ns').asi8
+        values = np.zeros((len(candles), len(COLUMNS) - 1), dtype=np.float64)
+        for i, c in enumerate(candles):
+            fields = [v or 0 for v in c[1:len(COLUMNS)]]
+            values[i, :len(fields)] = fields
+        order = np.argsort(ts, kind='stable')
+        ts, values = ts[order], values[order]
+
+        os.makedirs(self._dir(instrument_key, interval), exist_ok=True)
+        rows = self.count(instrument_key, interval)
+        last = self.last_timestamp(instrument_key, interval)
+        self._release(instrument_key, interval) # Unmap before writing
+
+        if last is not None:
+            # Refresh the last stored bar if the API sent a newer version of it
+            same = np.nonzero(ts == last)[0]
+            if len(same):
+                row = values[same[-1]]
+                for i, col in enumerate(list(COLUMNS)[1:]):
+                    mm = np.memmap(self._path(instrument_key, interval, col), dtype=COLUMNS[col], mode='r+', shape=(rows,))
+                    mm[-1] = row[i]
+                    mm.flush()
+                    del mm
+            keep = ts > last
+            ts, values = ts[keep], values[keep]
+
+        if len(ts) == 0:
+            return 0
+
+        # Drop duplicate timestamps within the batch (keep the latest)
+        uniq = np.r_[ts[1:] != ts[:-1], True]
+        ts, values = ts[uniq], values[uniq]
+
+        # Truncate any torn tail so all columns stay aligned
+        for col, dtype in COLUMNS.items():
+            path = self._path(instrument_key, interval, col)
+            if os.path.exists(path):
+                size = rows * np.dtype(dtype).itemsize
+                if os.path.getsize(path) != size:
+                    os.truncate(path, size)
+
+        with open(self._path(instrument_key, interval, 'timestamp'), 'ab') as f:
+            f.write(ts.astype(np.int64).tobytes())
+        for i, col in enumerate(list(COLUMNS)[1:]):
+            with open(self._path(instrument_key, interval, col), 'ab') as f:
+                f.write(np.ascontiguousarray(values[:, i]).tobytes())
+
+        return len(ts)
+
+    def _release(self, instrument_key, interval):
+        """
+        Drops the cached read maps so the files are unmapped before they are
+        rewritten, truncated or extended: Windows fails those on a mapped file.
+        """
+        cached = self._maps.pop((instrument_key, interval), None)
+        if cached:
+            cached[1].clear() # Last references: read_frame copies, so each map closes here
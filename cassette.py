@@ -0,0 +1,233 @@
+import os
+import gzip
+import json
+import time
+import bisect
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+# Never recorded: credentials (token exchange, feed authorization) and the multi-MB instrument dump
+DEFAULT_SKIP = ('login/authorization/token', 'feed/authorize', 'instruments')
+
+class RecordedResponse:
+    """The parts of requests.Response the Upstox client reads, rebuilt from a cassette entry."""
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+class CassetteRecorder:
+    """
+    Transport wrapper that writes every Upstox request and its response to a
+    gzipped JSON-lines cassette: wall time, duration, method, URL, endpoint,
+    JSON body, status and response text. Headers (the bearer token) are not
+    kept. Drop-in for HttpTransport: request/get/post/stats/close.
+    """
+    def __init__(self, transport, path, skip=DEFAULT_SKIP):
+        self.transport = transport
+        self.path = path
+        self.skip = set(skip)
+        self.lock = threading.Lock()
+        self.count = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = gzip.open(path, "at", encoding="utf-8") # Appends a gzip member per session
+        self.logger = logging.getLogger("Cassette")
+        self.logger.info(f"Recording Upstox traffic to {path}")
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name) # deadlines, latency, session, ...
+
+    def get(self, url, endpoint='default', **kwargs):
+        return self.request('GET', url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint='default', **kwargs):
+        return self.request('POST', url, endpoint=endpoint, **kwargs)
+
+    def request(self, method, url, endpoint='default', **kwargs):
+        started = time.time()
+        response = self.transport.request(method, url, endpoint=endpoint, **kwargs)
+        if endpoint not in self.skip:
+            entry = {'t': started, 'dt': round(time.time() - started, 6), 'm': method, 'u': url, 'e': endpoint,
+                     'b': kwargs.get('json'), 's': response.status_code, 'r': response.text}
+            line = json.dumps(entry, separators=(',', ':'))
+            with self.lock:
+                self.file.write(line + "\n")
+                self.count += 1
+        return response
+
+    def stats(self):
+        return self.transport.stats()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+                self.logger.info(f"Cassette closed: {self.count} calls recorded to {self.path}")
+        self.transport.close()
+
+def load_cassette(path):
+    """Cassette entries sorted by time. A cassette cut off by a crash loads up to the damage."""
+    entries = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entries.append(json.loads(line))
+    except (EOFError, json.JSONDecodeError, gzip.BadGzipFile) as e:
+        logging.getLogger("Cassette").warning(f"{path}: truncated after {len(entries)} entries ({e})")
+    entries.sort(key=lambda e: e['t'])
+    return entries
+
+class VirtualClock:
+    """Settable wall clock; datetime_class() gives a datetime whose now() reads it."""
+    def __init__(self, start):
+        self.now = start # Epoch seconds
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def datetime_class(self):
+        clock = self
+
+        class VirtualDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock.now, tz)
+
+        return VirtualDatetime
+
+class CassettePlayer:
+    """
+    Transport that answers from a cassette instead of the network. A
+    request is matched on method, URL and JSON body (then on method and URL
+    alone), and among the recorded answers the one closest to the virtual
+    clock wins, so each replayed cycle sees what that cycle saw. Unmatched
+    requests get a 404.
+    """
+    def __init__(self, entries, clock):
+        self.clock = clock
+        self.exact = {}  # (method, url, body) -> (times, entries)
+        self.by_url = {} # (method, url) -> (times, entries)
+        for entry in entries:
+            body = json.dumps(entry.get('b'), sort_keys=True)
+            for index, key in ((self.exact, (entry['m'], entry['u'], body)), (self.by_url, (entry['m'], entry['u']))):
+                times, items = index.setdefault(key, ([], []))
+                times.append(entry['t'])
+                items.append(entry)
+        self.hits = 0
+        self.misses = {} # endpoint -> count
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("CassettePlayer")
+
+    def get(self, url, endpoint='default', **kwargs):
+        return self.request('GET', url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint='default', **kwargs):
+        return self.request('POST', url, endpoint=endpoint, **kwargs)
+
+    def request(self, method, url, endpoint='default', **kwargs):
+        body = json.dumps(kwargs.get('json'), sort_keys=True)
+        found = self.exact.get((method, url, body)) or self.by_url.get((method, url))
+        with self.lock:
+            if found is None:
+                self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+                return RecordedResponse(404, '{"status": "error", "errors": [{"message": "not in cassette"}]}')
+            self.hits += 1
+        times, items = found
+        now = self.clock.time()
+        i = bisect.bisect_left(times, now)
+        if i == len(times) or (i > 0 and now - times[i - 1] <= times[i] - now):
+            i -= 1
+        return RecordedResponse(items[i]['s'], items[i]['r'])
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': dict(self.misses)}
+
+    def close(self):
+        pass
+
+def replay(path, speed=100.0, interval=None, live=False):
+    """
+    Replays a recorded session through main_cloud.trading_job and the
+    brokers on a virtual clock that steps by `interval` (CHECK_INTERVAL_SECONDS)
+    from the first to the last recorded call. `speed` is the virtual/real
+    time ratio; 0 runs as fast as possible. With `live`, LIVE orders go to an
+    UpstoxBroker answered from the cassette. Returns a summary.
+    """
+    # main_cloud reads its config at import: no journal, dumps, rate limits or live feed during a replay
+    for name, value in (("JOURNAL_ENABLED", "False"), ("INSTRUMENT_MASTER_ENABLED", "False"),
+                        ("CANDLE_STORE_ENABLED", "False"), ("RATE_LIMIT_ENABLED", "False"),
+                        ("CASSETTE_RECORD", ""), ("MOCK_SEED", "0")):
+        os.environ[name] = value
+    entries = load_cassette(path)
+    if not entries:
+        raise ValueError(f"{path} has no recorded calls")
+
+    import main_cloud
+    import broker
+    clock = VirtualClock(entries[0]['t'])
+    player = CassettePlayer(entries, clock)
+    main_cloud.datetime = broker.datetime = clock.datetime_class()
+    main_cloud.upstox_transport = player
+    main_cloud.upstox_client = None
+    main_cloud.is_connected = True
+    main_cloud.bot_active = True
+    main_cloud.config.UPSTOX_ACCESS_TOKEN = main_cloud.config.UPSTOX_ACCESS_TOKEN or "replay"
+    if live:
+        main_cloud.upstox_client = main_cloud.UpstoxClient("replay", transport=player,
+                                                           base_url=main_cloud.config.UPSTOX_BASE_URL)
+        main_cloud.live_broker = broker.UpstoxBroker(main_cloud.upstox_client)
+        main_cloud.config.LIVE_TRADING_ENABLED = True
+
+    interval = interval or main_cloud.config.CHECK_INTERVAL_SECONDS
+    end = entries[-1]['t']
+    cycles = 0
+    started = time.perf_counter()
+    while clock.now <= end:
+        tick = time.perf_counter()
+        main_cloud.trading_job()
+        cycles += 1
+        clock.advance(interval)
+        if speed:
+            time.sleep(max(0.0, interval / speed - (time.perf_counter() - tick)))
+    wall = time.perf_counter() - started
+
+    paper = main_cloud.paper_broker
+    summary = {
+        'calls': len(entries),
+        'cycles': cycles,
+        'virtual_seconds': round(cycles * interval, 1),
+        'wall_seconds': round(wall, 3),
+        'speedup': round(cycles * interval / wall, 1) if wall else None,
+        'cycle_ms': round(wall / cycles * 1000, 2) if cycles else None,
+        'paper_orders': len(paper.orders),
+        'paper_capital': round(paper.capital, 2),
+        'live_orders': len(main_cloud.live_broker.orders) if live and main_cloud.live_broker else 0,
+        'cassette': player.stats(),
+    }
+    return summary
+
+if __name__ == "__main__":
+    # Record with CASSETTE_RECORD=data/cassettes/2024-06-03.jsonl.gz, then:
+    # python cassette.py data/cassettes/2024-06-03.jsonl.gz --speed 0
+    parser = argparse.ArgumentParser(description="Replay a recorded Upstox session through the trading cycle")
+    parser.add_argument("cassette")
+    parser.add_argument("--speed", type=float, default=100.0, help="virtual seconds per real second (0 = unthrottled)")
+    parser.add_argument("--interval", type=int, default=None, help="seconds between cycles (default CHECK_INTERVAL_SECONDS)")
+    parser.add_argument("--live", action="store_true", help="route LIVE orders to the recorded order responses")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    for key, value in replay(args.cassette, speed=args.speed, interval=args.interval, live=args.live).items():
+        print(f"{key:>15}: {value}")
@@ -6,7 +6,8 @@ load_dotenv()
 class Config:
     # Trading Settings
     SYMBOL = "BANKNIFTY" # Example
-    TIMEFRAME = "5minute"
+    TIMEFRAME = os.getenv("TIMEFRAME", "5minute") # Strategy bars: 1minute, 3minute, 5minute or 15minute
+    BAR_BUFFER_SIZE = int(os.getenv("BAR_BUFFER_SIZE", 2000)) # Bars kept per symbol and timeframe
     CAPITAL = 80000
     RISK_PER_TRADE = 0.02 # 2% risk
     
@@ -49,6 +50,9 @@ class Config:
     # Strategy Settings
     EMA_PERIOD = 20
     SLOPE_THRESHOLD_DEGREES = 30 # Minimum angle for valid trend
+    SLOPE_THRESHOLD_PCT = float(os.getenv("SLOPE_THRESHOLD_PCT", 0.0001)) # Min EMA move per bar as a fraction of price
+    SL_ATR_BUFFER = float(os.getenv("SL_ATR_BUFFER", 0.1)) # Stop-loss buffer in ATRs
+    REWARD_RATIO = float(os.getenv("REWARD_RATIO", 2.0)) # Take-profit distance in multiples of risk
     
     # Mode Toggles
     PAPER_TRADING_ENABLED = os.getenv("PAPER_TRADING_ENABLED", "True").lower() == "true"
@@ -62,6 +66,83 @@ class Config:
     UPSTOX_API_SECRET = os.getenv("UPSTOX_API_SECRET", "")
     UPSTOX_REDIRECT_URI = os.getenv("UPSTOX_REDIRECT_URI", "https://localhost:5000") 
     UPSTOX_ACCESS_TOKEN = os.getenv("UPSTOX_ACCESS_TOKEN", "") # If generated manually
+    UPSTOX_BASE_URL = os.getenv("UPSTOX_BASE_URL", "https://api.upstox.com/v2") # Point at upstox_standin.py for load tests
     
     # Render / System
     CHECK_INTERVAL_SECONDS = 60
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "") # Bearer token for /metrics scrapers (only logged-in sessions when empty)
+    DASHBOARD_REFRESH_SECONDS = float(os.getenv("DASHBOARD_REFRESH_SECONDS", 2)) # Dashboard snapshot republish period in streaming mode
+    
+    # Market data mode: 'POLL' (60s timer), 'STREAM' (Upstox feed) or 'SIMULATED' (local feed)
+    DATA_MODE = os.getenv("DATA_MODE", "POLL").upper()
+    SIM_TICKS_PER_SECOND = int(os.getenv("SIM_TICKS_PER_SECOND", 10))
+    SIM_SPEED = float(os.getenv("SIM_SPEED", 1.0)) # Simulated seconds per wall second
+
+    # Synthetic candles used when Upstox data is unavailable
+    MOCK_SEED = int(os.getenv("MOCK_SEED")) if os.getenv("MOCK_SEED") else None # Fixed seed = reproducible mock market
+    MOCK_CORRELATION = float(os.getenv("MOCK_CORRELATION", 0.8)) # Pairwise correlation of index returns
+    MOCK_REGIMES = os.getenv("MOCK_REGIMES", "True").lower() == "true" # Switch between calm and stressed volatility
+
+    # Local candle store (memory-mapped columns, delta-synced from Upstox)
+    CANDLE_STORE_ENABLED = os.getenv("CANDLE_STORE_ENABLED", "True").lower() == "true"
+    CANDLE_STORE_DIR = os.getenv("CANDLE_STORE_DIR", "data/candles")
+
+    # Instrument master (Upstox option contracts, reloaded daily)
+    INSTRUMENT_MASTER_ENABLED = os.getenv("INSTRUMENT_MASTER_ENABLED", "True").lower() == "true"
+    INSTRUMENT_DIR = os.getenv("INSTRUMENT_DIR", "data/instruments")
+    INSTRUMENT_REFRESH_TIME = os.getenv("INSTRUMENT_REFRESH_TIME", "08:30") # Exchange time (IST)
+
+    # Strike selection: 'DELTA' (option-chain IV/Greeks) or 'STEP' (nearest listed strike, one step for ITM/OTM)
+    STRIKE_SELECTION = os.getenv("STRIKE_SELECTION", "DELTA").upper()
+    TARGET_DELTAS = {
+        "ATM": float(os.getenv("TARGET_DELTA_ATM", 0.5)),
+        "ITM": float(os.getenv("TARGET_DELTA_ITM", 0.65)),
+        "OTM": float(os.getenv("TARGET_DELTA_OTM", 0.35))
+    }
+    OPTION_CHAIN_MIN_OI = float(os.getenv("OPTION_CHAIN_MIN_OI", 0)) # Skip strikes with less open interest
+    # Chains not refreshed for this long (about two cycles) are ignored: strikes fall back to the nearest listed one
+    OPTION_CHAIN_MAX_AGE_SECONDS = float(os.getenv("OPTION_CHAIN_MAX_AGE_SECONDS", 2 * CHECK_INTERVAL_SECONDS + 30))
+    RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", 0.065))
+
+    # Order/position journal (SQLite WAL, replayed on startup)
+    JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "True").lower() == "true"
+    JOURNAL_PATH = os.getenv("JOURNAL_PATH", "data/journal.db")
+    JOURNAL_COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", 1000)) # Events between snapshots
+
+    # Universe scanner (pullback rules over many underlyings at once; signals only, no orders)
+    SCANNER_ENABLED = os.getenv("SCANNER_ENABLED", "False").lower() == "true"
+    SCANNER_SYMBOLS = os.getenv("SCANNER_SYMBOLS", "FO") # 'FO' = every F&O underlying, or comma-separated instrument keys
+    SCANNER_INTERVAL_SECONDS = int(os.getenv("SCANNER_INTERVAL_SECONDS", 300))
+    SCANNER_HISTORY_DAYS = int(os.getenv("SCANNER_HISTORY_DAYS", 5))
+    SCANNER_WORKERS = int(os.getenv("SCANNER_WORKERS", 2)) # Own fetch pool, separate from MARKET_DATA_WORKERS
+
+    # Cycle profiler (Chrome trace-event JSON per trading_job run; off by default)
+    PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "False").lower() == "true"
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+    PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 1000)) # Cycles at least this slow are saved to PROFILE_DIR
+    PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 20)) # Recent cycles served by /api/profile
+    PROFILE_CPROFILE = os.getenv("PROFILE_CPROFILE", "False").lower() == "true" # cProfile the indicator update
+
+    # HTTP transport (pooled keep-alive session for Upstox)
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+    HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2)) # GETs only, never order placement
+    MARKET_DATA_WORKERS = int(os.getenv("MARKET_DATA_WORKERS", 8)) # Concurrent per-index fetches
+
+    # Live order reconciliation
+    ORDER_POLL_SECONDS = float(os.getenv("ORDER_POLL_SECONDS", 0.5)) # Order-book polling while orders await fills
+    ORDER_KEEPALIVE_SECONDS = float(os.getenv("ORDER_KEEPALIVE_SECONDS", 30)) # Re-warm the connection when idle this long
+    ORDER_PENDING_TTL_SECONDS = float(os.getenv("ORDER_PENDING_TTL_SECONDS", 300)) # Stop polling for orders missing from the book
+
+    # Square-off (all exits at once, confirmed by re-fetching positions)
+    SQUARE_OFF_WORKERS = int(os.getenv("SQUARE_OFF_WORKERS", 16))
+    SQUARE_OFF_RETRIES = int(os.getenv("SQUARE_OFF_RETRIES", 2))
+    SQUARE_OFF_CONFIRM_SECONDS = float(os.getenv("SQUARE_OFF_CONFIRM_SECONDS", 5)) # Before resending stragglers
+
+    # Cassette recording (replay with: python cassette.py <file>)
+    CASSETTE_RECORD = os.getenv("CASSETTE_RECORD", "") # e.g. data/cassettes/2024-06-03.jsonl.gz; empty = off
+
+    # Request scheduler (token buckets + priorities in front of every Upstox call)
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+    RATE_LIMIT_PER_SECOND = int(os.getenv("RATE_LIMIT_PER_SECOND", 50)) # Account-wide
+    RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", 500)) # Account-wide
+    RATE_LIMIT_ORDERS_PER_SECOND = int(os.getenv("RATE_LIMIT_ORDERS_PER_SECOND", 8)) # Below Upstox's 10/s for headroom
@@ -0,0 +1,163 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import UPSTOX_LATENCY, UPSTOX_ERRORS, UPSTOX_RETRIES
+
+# (connect, read) deadlines in seconds per endpoint; 'default' covers the rest
+DEFAULT_DEADLINES = {
+    'historical-candle': (3.05, 10),
+    'market-quote/ltp': (3.05, 3),
+    'option/chain': (3.05, 5),
+    'order/place': (3.05, 5),
+    'order/details': (3.05, 4),
+    'order/retrieve-all': (3.05, 4),
+    'user/profile': (3.05, 3), # Connection warm-up
+    'portfolio/get-positions': (3.05, 5),
+    'login/authorization/token': (3.05, 10),
+    'instruments': (3.05, 60), # Daily instrument dump download
+    'default': (3.05, 10),
+}
+
+# Responses worth retrying on an idempotent GET
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class HttpTransport:
+    """
+    Shared HTTP layer for the Upstox client.
+
+    One pooled keep-alive session (so repeated calls skip the TCP+TLS handshake),
+    a connect/read deadline on every request, bounded retries with jittered
+    exponential backoff for GETs only, and per-endpoint latency samples.
+    POSTs (order placement, token exchange) are never retried. A call as a
+    whole, retries and backoff included, never runs past `budget_factor`
+    times its endpoint's connect + read deadline.
+    """
+    def __init__(self, pool_size=10, max_retries=2, backoff_base=0.2, backoff_cap=2.0, deadlines=None,
+                 budget_factor=1.5):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.budget_factor = budget_factor
+        self.deadlines = dict(DEFAULT_DEADLINES)
+        if deadlines:
+            self.deadlines.update(deadlines)
+        self.logger = logging.getLogger("HttpTransport")
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self.latency = {} # endpoint -> deque of seconds (recent calls)
+        self.counts = {}  # endpoint -> {'calls', 'errors', 'retries'}
+
+    def deadline(self, endpoint):
+        return self.deadlines.get(endpoint, self.deadlines['default'])
+
+    def budget(self, endpoint):
+        """Seconds one call to `endpoint` may take across all its attempts."""
+        connect, read = self.deadline(endpoint)
+        return (connect + read) * self.budget_factor
+
+    def get(self, url, endpoint='default', **kwargs):
+        return self.request('GET', url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint='default', **kwargs):
+        return self.request('POST', url, endpoint=endpoint, **kwargs)
+
+    def request(self, method, url, endpoint='default', **kwargs):
+        """
+        Sends a request through the pooled session and returns the Response.
+        Raises the last requests exception if every attempt failed. Retries
+        stop once the call's budget is spent; each attempt's connect/read
+        deadline is cut to what is left of it.
+        """
+        timeout = kwargs.pop('timeout', None) or self.deadline(endpoint)
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        attempts = 1 + (self.max_retries if method.upper() == 'GET' else 0)
+        start = time.perf_counter()
+        give_up = start + self.budget(endpoint)
+        response = None
+        error = None
+
+        for attempt in range(attempts):
+            if attempt:
+                pause = self._backoff(attempt, response)
+                if time.perf_counter() + pause >= give_up:
+                    self.logger.warning(f"{method} {endpoint}: call budget spent after {attempt} attempts")
+                    break
+                self._record_retry(endpoint)
+                time.sleep(pause)
+            left = give_up - time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=(min(connect, left), min(read, left)), **kwargs)
+                error = None
+                if response.status_code not in RETRY_STATUSES:
+                    break
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                response = None
+                self.logger.warning(f"{method} {endpoint} attempt {attempt + 1}/{attempts} failed: {e}")
+
+        self._record(endpoint, time.perf_counter() - start, error is not None or response is None or response.status_code >= 400)
+        if error is not None:
+            raise error
+        return response
+
+    def _backoff(self, attempt, response=None):
+        """
+        Full-jitter exponential backoff. A 429's Retry-After is honoured up to
+        the cap; without one (or with 0) the exponential backoff applies, so a
+        rate-limited API is never hit again straight away.
+        """
+        if response is not None and response.status_code == 429:
+            try:
+                retry_after = float(response.headers.get('Retry-After') or 0)
+            except ValueError:
+                retry_after = 0.0
+            if retry_after > 0:
+                return min(retry_after, self.backoff_cap)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _record(self, endpoint, seconds, failed):
+        UPSTOX_LATENCY.observe(seconds, endpoint=endpoint)
+        if failed:
+            UPSTOX_ERRORS.inc(endpoint=endpoint)
+        with self._lock:
+            self.latency.setdefault(endpoint, deque(maxlen=500)).append(seconds)
+            counts = self.counts.setdefault(endpoint, {'calls': 0, 'errors': 0, 'retries': 0})
+            counts['calls'] += 1
+            if failed:
+                counts['errors'] += 1
+
+    def _record_retry(self, endpoint):
+        UPSTOX_RETRIES.inc(endpoint=endpoint)
+        with self._lock:
+            self.counts.setdefault(endpoint, {'calls': 0, 'errors': 0, 'retries': 0})['retries'] += 1
+
+    def stats(self):
+        """
+        Per-endpoint call counts and latency summary (seconds) over recent calls.
+        """
+        with self._lock:
+            out = {}
+            for endpoint, samples in self.latency.items():
+                ordered = sorted(samples)
+                n = len(ordered)
+                out[endpoint] = dict(self.counts.get(endpoint, {}))
+                out[endpoint].update({
+                    'last': samples[-1],
+                    'avg': sum(ordered) / n,
+                    'p50': ordered[n // 2],
+                    'p95': ordered[min(n - 1, int(n * 0.95))],
+                    'max': ordered[-1],
+                })
+            return out
+
+    def close(self):
+        self.session.close()
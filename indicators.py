@@ -0,0 +1,183 @@
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Columns produced by InstitutionalPullbackStrategy.calculate_indicators
+INDICATOR_COLUMNS = ['ema_20', 'tp', 'tp_v', 'cumulative_tp_v', 'cumulative_vol', 'vwap', 'atr', 'ema_slope']
+
+def _safe_div(num, den):
+    """Division with pandas semantics (x/0 -> +-inf, 0/0 -> NaN)."""
+    if den != 0:
+        return num / den
+    if num == 0 or math.isnan(num):
+        return float('nan')
+    return math.copysign(float('inf'), num)
+
+class IncrementalIndicators:
+    """
+    Running EMA / VWAP / ATR / slope accumulators for a single instrument.
+
+    Each closed candle is folded in with O(1) work, so the per-tick cost does
+    not grow with history. The outputs follow the same conventions as
+    calculate_indicators (ta EMAIndicator / AverageTrueRange, cumulative VWAP),
+    and recompute() offers a full replay so the two can be cross-checked.
+    """
+    def __init__(self, ema_period=20, atr_period=14, history=20):
+        self.ema_period = ema_period
+        self.atr_period = atr_period
+        self.alpha = 2.0 / (ema_period + 1)
+        self.history = max(history, 2)
+        self.reset()
+
+    def reset(self):
+        self.state = {
+            'n': 0,
+            'ema': float('nan'),
+            'ema_out': float('nan'),
+            'prev_close': float('nan'),
+            'tr_sum': 0.0,
+            'atr': 0.0,
+            'cum_tp_v': 0.0,
+            'cum_vol': 0.0,
+        }
+        self.last_timestamp = None
+        self.last_close = None
+        self.rows = deque(maxlen=self.history)
+
+    @property
+    def bars(self):
+        return self.state['n']
+
+    def _step(self, candle):
+        """
+        Computes the indicator row for one candle on top of the committed state.
+        Returns (row, new_state); nothing is mutated here.
+        """
+        s = self.state
+        high = float(candle['high'])
+        low = float(candle['low'])
+        close = float(candle['close'])
+        volume = float(candle['volume'])
+        n = s['n'] + 1
+
+        # 1. EMA (ewm span=period, adjust=False, min_periods=period)
+        ema = close if s['n'] == 0 else s['ema'] + self.alpha * (close - s['ema'])
+        ema_out = ema if n >= self.ema_period else float('nan')
+        slope = ema_out - s['ema_out']
+
+        # 2. VWAP (cumulative)
+        tp = (high + low + close) / 3
+        tp_v = tp * volume
+        cum_tp_v = s['cum_tp_v'] + tp_v
+        cum_vol = s['cum_vol'] + volume
+
+        # 3. ATR (Wilder smoothing, seeded with the mean of the first window)
+        if s['n'] == 0:
+            tr = high - low
+        else:
+            prev_close = s['prev_close']
+            tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        tr_sum = s['tr_sum'] + tr if n <= self.atr_period else s['tr_sum']
+        if n < self.atr_period:
+            atr = 0.0
+        elif n == self.atr_period:
+            atr = tr_sum / self.atr_period
+        else:
+            atr = (s['atr'] * (self.atr_period - 1) + tr) / self.atr_period
+
+        row = dict(candle)
+        row.update({
+            'ema_20': ema_out,
+            'tp': tp,
+            'tp_v': tp_v,
+            'cumulative_tp_v': cum_tp_v,
+            'cumulative_vol': cum_vol,
+            'vwap': _safe_div(cum_tp_v, cum_vol),
+            'atr': atr,
+            'ema_slope': slope,
+        })
+        new_state = {
+            'n': n,
+            'ema': ema,
+            'ema_out': ema_out,
+            'prev_close': close,
+            'tr_sum': tr_sum,
+            'atr': atr,
+            'cum_tp_v': cum_tp_v,
+            'cum_vol': cum_vol,
+        }
+        return row, new_state
+
+    def update(self, candle):
+        """
+        Commits a closed candle (mapping with high/low/close/volume) and returns its row.
+        """
+        row, self.state = self._step(candle)
+        self.last_timestamp = candle.get('timestamp')
+        self.last_close = row['close']
+        self.rows.append(row)
+        return row
+
+    def preview(self, candle):
+        """
+        Indicator row for a still-forming candle, without committing it.
+        """
+        row, _ = self._step(candle)
+        return row
+
+    def frame(self, forming=None):
+        """
+        Last `history` committed rows (plus an optional forming candle) as a DataFrame,
+        which is all check_signal needs.
+        """
+        rows = list(self.rows)
+        if forming is not None:
+            rows.append(self.preview(forming))
+            rows = rows[-self.history:]
+        return pd.DataFrame(rows)
+
+    def sync(self, df):
+        """
+        Brings the accumulators in line with a candle frame sorted by timestamp.
+
+        All rows except the last are treated as closed; only those newer than the
+        last committed bar are folded in. The last row is previewed as the forming
+        bar. If the frame no longer lines up with what was committed (restart,
+        gap, rewritten bar) the state is rebuilt from the frame.
+        """
+        if df is None or df.empty:
+            return pd.DataFrame()
+
+        timestamps = df['timestamp'].values
+        start = 0
+        if self.last_timestamp is not None:
+            pos = int(np.searchsorted(timestamps, np.asarray(self.last_timestamp).astype(timestamps.dtype)))
+            if (pos < len(df) and timestamps[pos] == self.last_timestamp
+                    and float(df['close'].iat[pos]) == self.last_close):
+                start = pos + 1
+            else:
+                self.reset()
+
+        records = df.iloc[start:].to_dict('records')
+        for rec, ts in zip(records[:-1], timestamps[start:-1]):
+            rec['timestamp'] = ts
+            self.update(rec)
+        forming = records[-1] if records else None
+        if forming is not None:
+            forming['timestamp'] = timestamps[-1]
+        return self.frame(forming)
+
+    def recompute(self, df):
+        """
+        Full-recompute path: resets the state and replays every row.
+        Returns a DataFrame aligned with df that can be compared column by column
+        against calculate_indicators(df).
+        """
+        self.reset()
+        records = df.to_dict('records')
+        out = [self.update(rec) for rec in records]
+        result = pd.DataFrame(out, index=df.index)
+        if len(df):
+            self.last_timestamp = df['timestamp'].values[-1]
+        return result
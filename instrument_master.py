@@ -0,0 +1,312 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
+import numpy as np
+from candle_store import MARKET_TZ
+
+# Upstox instrument dumps (public, gzipped JSON); options for the indices we trade live in NSE_FO / BSE_FO
+INSTRUMENT_URLS = [
+    "https://assets.upstox.com/market-quote/instruments/exchange/NSE.json.gz",
+    "https://assets.upstox.com/market-quote/instruments/exchange/BSE.json.gz",
+]
+
+# One file per column; expiry is days since 1970-01-01 (exchange date)
+COLUMNS = {
+    'underlying': np.int8,
+    'expiry': np.int32,
+    'strike': np.float64,
+    'option_type': np.int8, # 0 = CE, 1 = PE
+    'lot_size': np.int32,
+    'instrument_key': 'S32',
+    'trading_symbol': 'S48',
+}
+
+OPTION_TYPES = ("CE", "PE")
+EPOCH = date(1970, 1, 1)
+
+class InstrumentMaster:
+    """
+    Index option contracts from the Upstox instrument dump, parsed once and
+    stored as memory-mapped columns under <root>/<generation>/.
+
+    Loading builds in-memory dicts over the mapped rows, so resolving
+    (underlying, expiry, strike, CE/PE) to an instrument key is a single
+    dict lookup. Strike ladders come from the listed chain, not a fixed step.
+    The expiry calendar (CURR_WEEK, NEXT_WEEK, CURR_MONTH, NEXT_MONTH) is
+    precomputed for the current trading day and rebuilt when the date changes.
+    """
+    def __init__(self, root, underlyings, transport=None, urls=INSTRUMENT_URLS):
+        self.root = root
+        self.underlyings = dict(underlyings) # name -> underlying instrument key, e.g. NIFTY -> NSE_INDEX|Nifty 50
+        self.names = list(self.underlyings)
+        self.transport = transport
+        self.urls = list(urls)
+        self.logger = logging.getLogger("InstrumentMaster")
+        self.lock = threading.Lock()
+        self.meta = {}
+        self.columns = {}
+        self.index = {}    # (underlying, expiry day, strike, 'CE'|'PE') -> row
+        self.by_key = {}   # instrument key -> row
+        self.chains = {}   # (underlying, expiry day) -> sorted strikes
+        self.expiries = {} # underlying -> sorted expiry days
+        self.calendar = {} # underlying -> {expiry type: expiry day}
+        self.as_of = None
+        self.thread = None
+
+    # --- Storage ---
+
+    def _meta_path(self):
+        return os.path.join(self.root, "meta.json")
+
+    def load(self):
+        """Maps the current generation from disk. Returns False if there is none."""
+        try:
+            with open(self._meta_path()) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        rows = meta['rows']
+        gen_dir = os.path.join(self.root, meta['generation'])
+        columns = {}
+        for col, dtype in COLUMNS.items():
+            if rows == 0:
+                columns[col] = np.empty(0, dtype=dtype)
+            else:
+                columns[col] = np.memmap(os.path.join(gen_dir, f"{col}.bin"), dtype=dtype, mode='r', shape=(rows,))
+
+        names = meta['underlyings']
+        und, exp, strike, opt = (columns['underlying'], columns['expiry'], columns['strike'], columns['option_type'])
+        index = {(names[u], e, k, OPTION_TYPES[o]): row
+                 for row, (u, e, k, o) in enumerate(zip(und.tolist(), exp.tolist(), strike.tolist(), opt.tolist()))}
+        by_key = {k.decode(): row for row, k in enumerate(columns['instrument_key'])}
+
+        chains = {}
+        expiries = {}
+        for u, name in enumerate(names):
+            mask = und == u
+            days = np.unique(exp[mask])
+            expiries[name] = days
+            for day in days:
+                chains[(name, int(day))] = np.unique(strike[mask & (exp == day)])
+
+        with self.lock:
+            self.meta, self.columns = meta, columns
+            self.index, self.by_key, self.chains, self.expiries = index, by_key, chains, expiries
+            self._build_calendar(self._today())
+        self.logger.info(f"Loaded {rows} option contracts (dump of {meta['date']})")
+        return True
+
+    def refresh(self, force=False):
+        """
+        Downloads the dumps if they changed since the last build (conditional
+        GET on ETag / Last-Modified) and writes a new generation. Unchanged
+        dumps only re-stamp the date. Returns True if a new index was built.
+        """
+        validators = {} if force else self.meta.get('validators', {})
+        payloads = []
+        new_validators = {}
+        changed = force or not self.meta
+        for url in self.urls:
+            headers = {}
+            cached = validators.get(url, {})
+            if cached.get('etag'): headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'): headers['If-Modified-Since'] = cached['last_modified']
+            response = self.transport.get(url, endpoint='instruments', headers=headers)
+            if response.status_code == 304:
+                new_validators[url] = cached
+                payloads.append(None)
+                continue
+            if response.status_code != 200:
+                self.logger.error(f"Instrument dump {url} failed: {response.status_code}")
+                return False
+            new_validators[url] = {'etag': response.headers.get('ETag'),
+                                   'last_modified': response.headers.get('Last-Modified')}
+            payloads.append(response.content)
+            changed = True
+
+        today = self._today().isoformat()
+        if not changed:
+            self._write_meta(dict(self.meta, date=today, validators=new_validators))
+            self.logger.info("Instrument dumps unchanged")
+            return False
+        if any(p is None for p in payloads):
+            # A partial 304 still needs every dump to rebuild; fetch them unconditionally
+            return self.refresh(force=True)
+
+        started = time.perf_counter()
+        records = []
+        universe = {}
+        for payload in payloads:
+            records.extend(self._parse(payload, universe))
+        self._write_generation(records, today, new_validators, universe)
+        self.logger.info(f"Built instrument index: {len(records)} contracts in {time.perf_counter() - started:.1f}s")
+        return self.load()
+
+    def _parse(self, payload, universe):
+        """Option rows for our underlyings; every F&O underlying with futures is added to `universe`."""
+        if payload[:2] == b'\x1f\x8b':
+            payload = gzip.decompress(payload)
+        codes = {key: i for i, key in enumerate(self.underlyings.values())}
+        today = (self._today() - EPOCH).days
+        out = []
+        for item in json.loads(payload):
+            if item.get('instrument_type') == 'FUT' and item.get('underlying_key'):
+                universe[item.get('underlying_symbol') or item['underlying_key']] = item['underlying_key']
+            code = codes.get(item.get('underlying_key'))
+            if code is None or item.get('instrument_type') not in OPTION_TYPES:
+                continue
+            # expiry is epoch milliseconds; convert to the exchange calendar date
+            expiry = datetime.fromtimestamp(item['expiry'] / 1000, ZoneInfo(MARKET_TZ)).date()
+            day = (expiry - EPOCH).days
+            if day < today:
+                continue
+            out.append((code, day, float(item['strike_price']), OPTION_TYPES.index(item['instrument_type']),
+                        int(item.get('lot_size') or 0), item['instrument_key'], item.get('trading_symbol', '')))
+        return out
+
+    def _write_generation(self, records, today, validators, universe):
+        generation = f"gen-{int(time.time())}"
+        gen_dir = os.path.join(self.root, generation)
+        os.makedirs(gen_dir, exist_ok=True)
+        records.sort(key=lambda r: (r[0], r[1], r[2], r[3]))
+        for i, (col, dtype) in enumerate(COLUMNS.items()):
+            values = [r[i] for r in records]
+            np.asarray(values, dtype=dtype).tofile(os.path.join(gen_dir, f"{col}.bin"))
+
+        previous = self.meta.get('generation')
+        self._write_meta({'generation': generation, 'rows': len(records), 'date': today,
+                          'underlyings': self.names, 'validators': validators, 'universe': universe})
+        if previous and previous != generation:
+            # Mapped files stay readable until unmapped, so the old generation can go now
+            shutil.rmtree(os.path.join(self.root, previous), ignore_errors=True)
+
+    def _write_meta(self, meta):
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path()) # Readers see the old or the new generation, never a mix
+        self.meta = meta
+
+    # --- Calendar ---
+
+    @staticmethod
+    def _today():
+        return datetime.now(ZoneInfo(MARKET_TZ)).date()
+
+    def _build_calendar(self, today):
+        day0 = (today - EPOCH).days
+        calendar = {}
+        for name, days in self.expiries.items():
+            live = [int(d) for d in days if d >= day0]
+            # Monthly expiry = the last listed expiry of each calendar month
+            monthly = {}
+            for d in live:
+                dt = EPOCH + timedelta(days=d)
+                monthly[(dt.year, dt.month)] = d
+            months = sorted(monthly.values())
+            entry = {}
+            if live:
+                entry['CURR_WEEK'] = live[0]
+            if len(live) > 1:
+                entry['NEXT_WEEK'] = live[1]
+            if months:
+                entry['CURR_MONTH'] = months[0]
+            if len(months) > 1:
+                entry['NEXT_MONTH'] = months[1]
+            # Backwards compatible settings values
+            if 'CURR_WEEK' in entry: entry['WEEKLY'] = entry['CURR_WEEK']
+            if 'CURR_MONTH' in entry: entry['MONTHLY'] = entry['CURR_MONTH']
+            calendar[name] = entry
+        self.calendar = calendar
+        self.as_of = today
+
+    def expiry(self, underlying, expiry_type):
+        """Expiry day number for CURR_WEEK / NEXT_WEEK / CURR_MONTH / NEXT_MONTH, or None."""
+        today = self._today()
+        if today != self.as_of:
+            with self.lock:
+                self._build_calendar(today)
+        return self.calendar.get(underlying, {}).get(expiry_type)
+
+    def expiry_date(self, underlying, expiry_type):
+        day = self.expiry(underlying, expiry_type)
+        return None if day is None else EPOCH + timedelta(days=day)
+
+    # --- Resolution ---
+
+    def resolve(self, underlying, expiry_type, spot_price, option_type, moneyness="ATM"):
+        """
+        The listed contract nearest to `spot_price` (shifted one strike for
+        ITM/OTM) as {'instrument_key', 'trading_symbol', 'strike', 'expiry', 'lot_size'}, or None.
+        """
+        expiry = self.expiry(underlying, expiry_type)
+        strikes = self.chains.get((underlying, expiry))
+        if strikes is None or not len(strikes):
+            return None
+
+        i = int(np.searchsorted(strikes, spot_price))
+        if i == len(strikes) or (i > 0 and spot_price - strikes[i - 1] <= strikes[i] - spot_price):
+            i -= 1
+        # ITM calls / OTM puts sit below spot, OTM calls / ITM puts above
+        if moneyness in ("ITM", "OTM"):
+            below = (moneyness == "ITM") == (option_type == "CE")
+            i = max(0, i - 1) if below else min(len(strikes) - 1, i + 1)
+
+        row = self.index.get((underlying, expiry, float(strikes[i]), option_type))
+        if row is None:
+            return None
+        return self._contract(row)
+
+    def _contract(self, row):
+        cols = self.columns
+        return {
+            'instrument_key': cols['instrument_key'][row].decode(),
+            'trading_symbol': cols['trading_symbol'][row].decode(),
+            'strike': float(cols['strike'][row]),
+            'expiry': EPOCH + timedelta(days=int(cols['expiry'][row])),
+            'lot_size': int(cols['lot_size'][row]),
+        }
+
+    def universe(self):
+        """Every F&O underlying in the last dump as {symbol: underlying instrument key}."""
+        return dict(self.meta.get('universe', {}))
+
+    def contract(self, instrument_key):
+        """Contract details for an instrument key, or None if it is not an indexed option."""
+        row = self.by_key.get(instrument_key)
+        return None if row is None else self._contract(row)
+
+    # --- Daily reload ---
+
+    def start(self, refresh_at="08:30"):
+        """
+        Loads the local index and keeps it current from a background thread:
+        refreshes now if the stored dump is not from today, then daily at
+        `refresh_at` (exchange time).
+        """
+        self.load()
+        self.thread = threading.Thread(target=self._run, args=(refresh_at,), name="instrument-master", daemon=True)
+        self.thread.start()
+
+    def _run(self, refresh_at):
+        hour, minute = (int(x) for x in refresh_at.split(":"))
+        while True:
+            now = datetime.now(ZoneInfo(MARKET_TZ))
+            due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            # Yesterday's index is still usable before the daily dump is due
+            stale = self.meta.get('date') != now.date().isoformat() and now >= due
+            if not self.meta or stale:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self.logger.error(f"Instrument refresh failed: {e}")
+            if due <= now:
+                due += timedelta(days=1)
+            time.sleep(min((due - now).total_seconds(), 3600)) # Re-check hourly (e.g. after a failed refresh)
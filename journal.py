@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__dt__': value.isoformat()}
+    raise TypeError(f"Not JSON serializable: {type(value)}")
+
+def _decode(obj):
+    if '__dt__' in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj['__dt__'])
+    return obj
+
+class OrderJournal:
+    """
+    Durable order/position journal in SQLite (WAL mode).
+
+    Brokers call append()/snapshot(), which only enqueue; a writer thread
+    commits whatever has queued up in one transaction every `flush_interval`
+    seconds, so order placement never waits on the disk. With
+    synchronous=NORMAL, WAL commits survive a process crash, and the fsync
+    happens at checkpoints off the request path.
+
+    Each broker has its own stream: the latest snapshot of its state plus the
+    events recorded after it. load() returns both for replay, and a snapshot
+    deletes the events it covers (compaction).
+    """
+    def __init__(self, path, flush_interval=0.25, compact_every=1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.queue = queue.Queue()
+        self.logger = logging.getLogger("OrderJournal")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                stream TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_stream ON events (stream, seq);
+            CREATE TABLE IF NOT EXISTS snapshots (
+                stream TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                payload TEXT NOT NULL
+            );
+        """)
+        conn.close()
+
+        self.running = True
+        self.writer = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append(self, stream, kind, record):
+        """Queues one event; returns immediately."""
+        self.queue.put(('event', stream, kind, json.dumps(record, default=_encode)))
+
+    def snapshot(self, stream, state):
+        """
+        Queues a full state snapshot of `stream`. It is ordered after every
+        event already appended, so the events it supersedes can be dropped.
+        `state` is serialized later on the writer thread, so the caller hands
+        over a copy it will not mutate; the O(history) encoding stays off the
+        order path.
+        """
+        self.queue.put(('snapshot', stream, None, state))
+
+    def load(self, stream):
+        """
+        Returns (snapshot state or None, [(kind, record), ...] recorded after it).
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT seq, payload FROM snapshots WHERE stream = ?", (stream,)).fetchone()
+            state, after = (json.loads(row[1], object_hook=_decode), row[0]) if row else (None, 0)
+            rows = conn.execute("SELECT kind, payload FROM events WHERE stream = ? AND seq > ? ORDER BY seq",
+                                (stream, after)).fetchall()
+        finally:
+            conn.close()
+        return state, [(kind, json.loads(payload, object_hook=_decode)) for kind, payload in rows]
+
+    def flush(self):
+        """Blocks until everything queued so far is committed."""
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        self.running = False
+        self.queue.put(None)
+        self.writer.join(timeout=5)
+
+    def _run(self):
+        conn = self._connect()
+        while self.running:
+            item = self.queue.get()
+            batch = [item]
+            time.sleep(self.flush_interval) # Let a burst accumulate into one commit
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(conn, [b for b in batch if b is not None])
+            except Exception as e:
+                self.logger.error(f"Journal write failed ({len(batch)} records): {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+        conn.close()
+
+    def _write(self, conn, batch):
+        records = []
+        for op, stream, kind, payload in batch:
+            if op == 'snapshot':
+                try:
+                    payload = json.dumps(payload, default=_encode)
+                except (TypeError, ValueError) as e:
+                    self.logger.error(f"Snapshot of {stream} not serializable, skipped: {e}")
+                    continue
+            records.append((op, stream, kind, payload))
+        with conn: # One transaction per batch
+            for op, stream, kind, payload in records:
+                if op == 'event':
+                    conn.execute("INSERT INTO events (stream, kind, payload) VALUES (?, ?, ?)", (stream, kind, payload))
+                    continue
+                seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+                conn.execute("INSERT OR REPLACE INTO snapshots (stream, seq, payload) VALUES (?, ?, ?)",
+                             (stream, seq, payload))
+                conn.execute("DELETE FROM events WHERE stream = ? AND seq <= ?", (stream, seq))
@@ -1,17 +1,33 @@
 import time
-import requests
 import threading
 import pandas as pd
-import numpy as np
 import logging
 import schedule
 import os
+import atexit
+import hmac
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session
+from zoneinfo import ZoneInfo
+from flask import Flask, render_template, request, redirect, url_for, session, Response, stream_with_context
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 from strategy import InstitutionalPullbackStrategy
-from broker import MockBroker
+from broker import MockBroker, UpstoxBroker
+from candle_store import CandleStore, MARKET_TZ
+from http_transport import HttpTransport
+from request_scheduler import RequestScheduler, UI, BULK
+from cassette import CassetteRecorder
+from market_feed import StreamingEngine, SimulatedFeed, UpstoxFeedClient
+from state_snapshot import SnapshotPublisher, to_json
+from journal import OrderJournal
+from instrument_master import InstrumentMaster
+from option_chain import OptionChainAnalytics
+from profiler import CycleProfiler
+from market_generator import MarketGenerator, DEFAULT_REGIMES
+from scanner import PanelScanner
+from metrics import (REGISTRY, CYCLE_SECONDS, INDICATOR_SECONDS, SIGNAL_SECONDS, ORDER_SECONDS,
+                     MOCK_FALLBACKS, SIGNALS)
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -23,24 +39,66 @@ app.secret_key = Config().SECRET_KEY
 
 # Initialize Bot Components
 config = Config()
-paper_broker = MockBroker(initial_capital=config.CAPITAL)
+journal = OrderJournal(config.JOURNAL_PATH, compact_every=config.JOURNAL_COMPACT_EVERY) if config.JOURNAL_ENABLED else None
+if journal:
+    atexit.register(journal.close) # Commit whatever is still queued on shutdown
+paper_broker = MockBroker(initial_capital=config.CAPITAL, journal=journal)
 live_broker = None # Initialized after Upstox login
 strategy = InstitutionalPullbackStrategy(config)
+candle_store = CandleStore(config.CANDLE_STORE_DIR) if config.CANDLE_STORE_ENABLED else None
+upstox_transport = HttpTransport(pool_size=config.HTTP_POOL_SIZE, max_retries=config.HTTP_MAX_RETRIES)
+if config.CASSETTE_RECORD:
+    upstox_transport = CassetteRecorder(upstox_transport, config.CASSETTE_RECORD)
+    atexit.register(upstox_transport.close)
+upstox_scheduler = RequestScheduler(
+    class_limits={'order': ((config.RATE_LIMIT_ORDERS_PER_SECOND, 1.0),)},
+    global_limits=((config.RATE_LIMIT_PER_SECOND, 1.0), (config.RATE_LIMIT_PER_MINUTE, 60.0)),
+) if config.RATE_LIMIT_ENABLED else None
+instrument_master = InstrumentMaster(config.INSTRUMENT_DIR, config.INDEX_MAPPINGS,
+                                     transport=upstox_transport) if config.INSTRUMENT_MASTER_ENABLED else None
+scanner = PanelScanner(config) if config.SCANNER_ENABLED else None
+# The scanner's own small pool: its ~200 BULK fetches never queue ahead of trading-cycle work in market_data_pool
+scanner_pool = ThreadPoolExecutor(max_workers=config.SCANNER_WORKERS, thread_name_prefix="scanner") if scanner else None
+option_chains = OptionChainAnalytics(risk_free_rate=config.RISK_FREE_RATE, min_oi=config.OPTION_CHAIN_MIN_OI,
+                                     max_age=config.OPTION_CHAIN_MAX_AGE_SECONDS)
 
 # Global State for Bot
 latest_price = 0.0 # Bank Nifty
 nifty_price = 0.0  # Nifty 50
 sensex_price = 0.0 # Sensex
+mock_priced = set() # Indices whose headline price is synthetic this cycle
 is_connected = True if config.UPSTOX_ACCESS_TOKEN else False
 bot_active = False # Master Control
 access_token = config.UPSTOX_ACCESS_TOKEN if config.UPSTOX_ACCESS_TOKEN else None
 upstox_client = None
 
+# Web handlers only read published snapshots; the trading threads build them
+state_publisher = SnapshotPublisher()
+publish_requested = threading.Event() # Set by web actions, served by the background loop
+square_off_lock = threading.Lock() # One square-off at a time
+square_off_status = None # Latest square-off: running, or its per-broker reports
+profiler = CycleProfiler(enabled=config.PROFILE_ENABLED, out_dir=config.PROFILE_DIR, keep=config.PROFILE_KEEP,
+                         slow_ms=config.PROFILE_SLOW_MS, cprofile=config.PROFILE_CPROFILE)
+
 def build_option_symbol(idx_key, spot_price, side, moneyness, expiry_type):
     """
     Constructs the Upstox/Broker symbol for the target option.
-    Example: NSE_FO|NIFTY25JAN24500CE
+    Returns the real instrument key (e.g. NSE_FO|43885) when the instrument
+    master lists the contract, otherwise a descriptive paper symbol.
     """
+    option_type = "CE" if ("BUY" in side and "PUT" not in side) else "PE"
+    if instrument_master:
+        if config.STRIKE_SELECTION == "DELTA":
+            # Strike whose delta is closest to the moneyness target, from the latest chain analytics
+            expiry = instrument_master.expiry_date(idx_key, expiry_type)
+            leg = option_chains.select_by_delta(idx_key, expiry.isoformat() if expiry else None, option_type,
+                                                config.TARGET_DELTAS.get(moneyness, 0.5))
+            if leg:
+                return leg['instrument_key']
+        contract = instrument_master.resolve(idx_key, expiry_type, spot_price, option_type, moneyness)
+        if contract:
+            return contract['instrument_key']
+    
     # 1. Determine Strike Step
     strike_step = 100
     if idx_key == "NIFTY": strike_step = 50
@@ -82,45 +140,58 @@ def build_option_symbol(idx_key, spot_price, side, moneyness, expiry_type):
 
 from upstox_client import UpstoxClient
 
-def generate_mock_data(length=100):
+# Starting levels for synthetic data when Upstox is unavailable
+MOCK_BASE_PRICES = {"BANKNIFTY": 45000.0, "NIFTY": 24000.0, "SENSEX": 80000.0}
+
+# Correlated synthetic market for all indices; consecutive cycles continue the same paths
+mock_market = MarketGenerator(MOCK_BASE_PRICES, correlation=config.MOCK_CORRELATION, seed=config.MOCK_SEED,
+                              regimes=DEFAULT_REGIMES if config.MOCK_REGIMES else None)
+mock_frames = {}
+MOCK_HISTORY_BARS = 50
+
+def generate_mock_data(length=100, base_price=45000, seed=None):
     """
-    Generates synthetic OHLCV data to simulate market movements.
+    Generates synthetic OHLCV data to simulate market movements
+    (1-minute session bars ending now, one vectorized pass).
     """
-    dates = [datetime.now() - timedelta(minutes=i*5) for i in range(length)]
-    dates.reverse()
-    
-    # Random walk for price
-    base_price = 45000
-    prices = [base_price]
-    for _ in range(length-1):
-        change = np.random.normal(0, 20) # Random fluctuation
-        prices.append(prices[-1] + change)
-        
-    df = pd.DataFrame({
-        'timestamp': dates,
-        'open': prices,
-        'high': [p + abs(np.random.normal(0, 10)) for p in prices],
-        'low': [p - abs(np.random.normal(0, 10)) for p in prices],
-        'close': [p + np.random.normal(0, 5) for p in prices],
-        'volume': [int(abs(np.random.normal(1000, 200))) for _ in range(length)]
-    })
-    return df
+    generator = MarketGenerator({"MOCK": base_price}, seed=seed)
+    return generator.generate(length, end=datetime.now(ZoneInfo(MARKET_TZ)))["MOCK"]
 
-def trading_job():
-    global latest_price, nifty_price, sensex_price, upstox_client, is_connected, bot_active
-    logger.info(f"Fetching market data... Connected: {is_connected}, Bot Active: {bot_active}")
-    
-    df = None
+def mock_market_data():
+    """
+    Synthetic candles for every index up to the current bar. Only bars since
+    the previous call are generated, so the mock market evolves like a live one.
+    """
+    now = datetime.now(ZoneInfo(MARKET_TZ)) # Exchange time, whatever the host's zone (UTC on Render)
+    new_bars = mock_market.bars_until(now)
+    if not mock_frames or new_bars > MOCK_HISTORY_BARS:
+        mock_frames.update(mock_market.generate(MOCK_HISTORY_BARS, end=now))
+    elif new_bars:
+        for idx_key, df in mock_market.generate(new_bars).items():
+            mock_frames[idx_key] = pd.concat([mock_frames[idx_key], df], ignore_index=True).iloc[-MOCK_HISTORY_BARS:]
+    return dict(mock_frames)
+
+# Worker pool for concurrent market data fetches and per-index evaluation
+market_data_pool = ThreadPoolExecutor(max_workers=config.MARKET_DATA_WORKERS, thread_name_prefix="market-data")
+
+def fetch_market_data(indices):
+    """
+    Fetches each index's own candles and the batched LTPs concurrently,
+    so the wall time is bounded by the slowest request rather than the sum.
+    Returns ({idx_key: candles_df}, {idx_key: price}, mocked): indices whose
+    candles could not be fetched fall back to mock data, and `mocked` maps
+    each of them to "candles" (the price is still a real LTP) or "price"
+    (the price is synthetic too).
+    """
+    with profiler.span("fetch_market_data", indices=list(indices)):
+        return _fetch_market_data(indices)
+
+def _fetch_market_data(indices):
+    frames = {}
+    prices = {}
+    mocked = {}
     
-    if is_connected and config.UPSTOX_ACCESS_TOKEN:
-        if not upstox_client:
-            upstox_client = UpstoxClient(config.UPSTOX_ACCESS_TOKEN)
-            
-        # Correct Instrument Key for BANKNIFTY Spot Index
-        # NSE_INDEX|Nifty Bank is often 'NSE_INDEX|Nifty Bank' or 'NSE_INDEX|26009'
-        # Let's use the one that works or try to fetch it.
-        instrument_key = "NSE_INDEX|Nifty Bank" 
-        
+    if is_connected and upstox_client:
         # Upstox Interval Map (Historical only supports: 1minute, 30minute, day, week, month)
         # We will fetch 1minute data and use it.
         interval = "1minute"
@@ -128,112 +199,216 @@ def trading_job():
         to_date = datetime.now().strftime('%Y-%m-%d')
         from_date = (datetime.now() - timedelta(days=5)).strftime('%Y-%m-%d')
         
-        df = upstox_client.get_historical_candles(instrument_key, interval, from_date, to_date)
+        candle_futures = {
+            idx_key: market_data_pool.submit(profiler.wrap("fetch_candles", upstox_client.get_historical_candles,
+                                                           index=idx_key),
+                                             config.INDEX_MAPPINGS[idx_key], interval, from_date, to_date)
+            for idx_key in indices
+        }
+        # One batched quote call covers all three index LTPs
+        ltp_future = market_data_pool.submit(profiler.wrap("fetch_ltps", upstox_client.get_market_ltps),
+                                             list(config.INDEX_MAPPINGS.values()))
         
-        if df is not None and not df.empty:
-            logger.info("Fetched REAL data from Upstox")
-            latest_price = df.iloc[-1]['close'] 
-            
-            # --- FETCH ALL 3 LTPs ---
-            # 1. Bank Nifty
-            bn_ltp = upstox_client.get_market_ltp(config.INDEX_MAPPINGS["BANKNIFTY"])
-            if bn_ltp: 
-                latest_price = bn_ltp
-                logger.info(f"BN LTP: {latest_price}")
-            
-            # 2. Nifty 50
-            nifty_ltp = upstox_client.get_market_ltp(config.INDEX_MAPPINGS["NIFTY"])
-            if nifty_ltp: 
-                nifty_price = nifty_ltp
-                logger.info(f"Nifty LTP: {nifty_price}")
-                
-            # 3. Sensex
-            sensex_ltp = upstox_client.get_market_ltp(config.INDEX_MAPPINGS["SENSEX"])
-            if sensex_ltp: 
-                sensex_price = sensex_ltp
-                logger.info(f"Sensex LTP: {sensex_price}")
-        else:
-            logger.warning("Failed to fetch Upstox data, falling back to MOCK")
-            df = generate_mock_data(length=50)
-            latest_price = df.iloc[-1]['close']
-            nifty_price = 24000.0 + np.random.normal(0, 50)
-            sensex_price = 80000.0 + np.random.normal(0, 100)
-            
-    else:
-        # Fallback to Mock Data
-        df = generate_mock_data(length=50)
-        latest_price = df.iloc[-1]['close']
-        nifty_price = 24000.0 + np.random.normal(0, 50)
-        sensex_price = 80000.0 + np.random.normal(0, 100)
+        try:
+            ltps = ltp_future.result()
+        except Exception as e:
+            logger.error(f"LTP fetch failed: {e}")
+            ltps = {}
+        for idx_key, instrument_key in config.INDEX_MAPPINGS.items():
+            if ltps.get(instrument_key):
+                prices[idx_key] = ltps[instrument_key]
+                logger.info(f"{idx_key} LTP: {prices[idx_key]}")
+        
+        for idx_key, future in candle_futures.items():
+            try:
+                df = future.result()
+            except Exception as e:
+                logger.error(f"Candle fetch failed for {idx_key}: {e}")
+                df = None
+            if df is not None and not df.empty:
+                logger.info(f"Fetched REAL data from Upstox for {idx_key}")
+                frames[idx_key] = df
+                prices.setdefault(idx_key, df.iloc[-1]['close'])
+            else:
+                logger.warning(f"Failed to fetch Upstox data for {idx_key}, falling back to MOCK")
+    
+    # Fallback to Mock Data
+    missing = [idx_key for idx_key in indices if idx_key not in frames]
+    if missing or any(idx_key not in prices for idx_key in MOCK_BASE_PRICES):
+        with profiler.span("mock_data", indices=missing):
+            mock = mock_market_data()
+        for idx_key in missing:
+            MOCK_FALLBACKS.inc(index=idx_key)
+            frames[idx_key] = mock[idx_key]
+            mocked[idx_key] = "candles"
+        for idx_key, df in mock.items():
+            if idx_key not in prices:
+                prices[idx_key] = float(df.iloc[-1]['close'])
+                mocked[idx_key] = "price"
+    
+    return frames, prices, mocked
+
+def request_option_chains(indices):
+    """
+    Submits one option-chain request per index for its configured expiry.
+    Returns {(idx_key, expiry): future}; empty when delta selection is unavailable.
+    """
+    if not (config.STRIKE_SELECTION == "DELTA" and is_connected and upstox_client and instrument_master):
+        return {}
+    futures = {}
+    for idx_key in indices:
+        expiry = instrument_master.expiry_date(idx_key, getattr(config, f"EXPIRY_{idx_key}"))
+        if expiry:
+            futures[(idx_key, expiry.isoformat())] = market_data_pool.submit(
+                profiler.wrap("fetch_option_chain", upstox_client.get_option_chain, index=idx_key),
+                config.INDEX_MAPPINGS[idx_key], expiry.isoformat())
+    return futures
+
+def update_option_chains(futures, prices):
+    """Collects the chain requests and recomputes IV/Greeks for all of them in one pass."""
+    raw = {}
+    for key, future in futures.items():
+        try:
+            raw[key] = future.result()
+        except Exception as e:
+            logger.error(f"Option chain fetch failed for {key[0]}: {e}")
+    if raw:
+        with profiler.span("option_analytics", chains=len(raw)):
+            df = option_chains.update(raw, spots=prices)
+        if live_broker and not df.empty:
+            for key in df['instrument_key']:
+                live_broker.prepare(key) # Payloads ready before any signal picks a strike
+
+def analyze_index(idx_key, df, current_idx_price):
+    """
+    Runs the strategy on one index's own candles; safe to run in parallel across indices.
+    """
+    logger.info(f"Analyzing {idx_key} at {current_idx_price}...")
+    
+    # Calculate Indicators (incremental: only newly closed candles are folded in)
+    with INDICATOR_SECONDS.time(index=idx_key), profiler.hotspot("update_indicators", index=idx_key):
+        df_analysis = strategy.update_indicators(idx_key, df)
+    # We override the last close with current real-time price for the check
+    df_analysis.loc[df_analysis.index[-1], 'close'] = current_idx_price
+    
+    with SIGNAL_SECONDS.time(index=idx_key), profiler.span("check_signal", index=idx_key):
+        signal_data = strategy.check_signal(df_analysis)
+    if signal_data:
+        signal_data['signal_at'] = time.time() # Starts the signal-to-ack/fill clocks
+    return signal_data
+
+def execute_signal(idx_key, signal_data, current_idx_price):
+    """
+    Builds the option symbol for a signal and routes it to the enabled brokers.
+    """
+    side = signal_data['side']
+    entry = signal_data['entry_price']
+    sl = signal_data['stop_loss']
+    tp = signal_data['take_profit']
+    
+    # Get index-specific settings
+    lot_count = getattr(config, f"LOT_SIZE_{idx_key}")
+    moneyness = getattr(config, f"MONEYNESS_{idx_key}")
+    expiry = getattr(config, f"EXPIRY_{idx_key}")
+    
+    # Build Option Symbol
+    with profiler.span("build_option_symbol", index=idx_key):
+        option_symbol = build_option_symbol(idx_key, current_idx_price, side, moneyness, expiry)
+    contract = instrument_master.contract(option_symbol) if instrument_master else None
+    
+    # The exchange lot size from the instrument master wins over the configured default
+    lot_multiplier = contract['lot_size'] if contract and contract['lot_size'] else config.LOT_MULTIPLIERS.get(idx_key, 1)
+    quantity = lot_count * lot_multiplier
+    
+    logger.info(f"SIGNAL DETECTED for {idx_key}: {side} | Target Option: {option_symbol}")
+    SIGNALS.inc(index=idx_key, side=side)
+    
+    # Place Paper Trade if enabled
+    if config.PAPER_TRADING_ENABLED:
+        logger.info(f"Executing Paper Trade for {option_symbol}...")
+        with ORDER_SECONDS.time(broker="paper"), profiler.span("place_order", broker="paper", index=idx_key):
+            paper_broker.place_order(option_symbol, "MARKET", quantity, side, price=current_idx_price, sl=sl, tp=tp,
+                                     underlying=idx_key)
+        
+    # Place Live Trade if enabled
+    if config.LIVE_TRADING_ENABLED and live_broker:
+        if not contract:
+            logger.error(f"No listed contract for {option_symbol}; LIVE order skipped")
+            return
+        logger.info(f"Executing LIVE Trade for {contract['trading_symbol']} ({option_symbol}) on Upstox...")
+        # Expected fill is the option's last chain price (slippage stays unset without one)
+        expected = option_chains.ltp(option_symbol)
+        with ORDER_SECONDS.time(broker="live"), profiler.span("place_order", broker="live", index=idx_key):
+            live_broker.place_order(option_symbol, "MARKET", quantity, side, price=expected, sl=sl, tp=tp,
+                                    signal_at=signal_data.get('signal_at'))
+
+def trading_job():
+    """One scheduled cycle, timed for /metrics (and traced when profiling is on)."""
+    with CYCLE_SECONDS.time(), profiler.cycle("trading_job"):
+        run_trading_cycle()
+
+def run_trading_cycle():
+    global latest_price, nifty_price, sensex_price, mock_priced, upstox_client, is_connected, bot_active
+    logger.info(f"Fetching market data... Connected: {is_connected}, Bot Active: {bot_active}")
+    
+    if is_connected and config.UPSTOX_ACCESS_TOKEN:
+        if not upstox_client:
+            upstox_client = UpstoxClient(config.UPSTOX_ACCESS_TOKEN, candle_store=candle_store, transport=upstox_transport,
+                                         base_url=config.UPSTOX_BASE_URL, scheduler=upstox_scheduler)
+    
+    selected = [k.strip() for k in config.SELECTED_INDICES if k.strip() in config.INDEX_MAPPINGS]
+    frames, prices, mocked = fetch_market_data(selected)
+    
+    latest_price = prices["BANKNIFTY"]
+    nifty_price = prices["NIFTY"]
+    sensex_price = prices["SENSEX"]
+    mock_priced = {k for k, kind in mocked.items() if kind == "price"} # Replaced, never mutated: the publisher reads it
+    
+    # Paper SL/TP fills (SL/TP are index levels); while connected, never at synthetic levels
+    with profiler.span("paper_fills"):
+        paper_broker.on_prices({k: v for k, v in prices.items() if k not in mock_priced} if is_connected else prices)
     
     if not bot_active:
         logger.info("Bot is STOPPED. Skipping strategy execution.")
+        publish_state()
         return
 
-    # Apply Strategy per selected index
-    # We use 'df' (Bank Nifty candles) as a technical proxy for the touch-EMA logic 
-    # but we use the specific index price for crossing.
+    # While connected, an index on mock candles is not traded: its signal would be synthetic,
+    # yet the real LTP would resolve it to a listed contract
+    if is_connected and mocked:
+        skipped = [k for k in selected if k in mocked]
+        if skipped:
+            logger.warning(f"No live candles for {', '.join(skipped)}; not evaluating them this cycle")
+        selected = [k for k in selected if k not in mocked]
     
-    for idx_key in config.SELECTED_INDICES:
-        idx_key = idx_key.strip()
-        if not idx_key: continue
-        
-        # Get current price for this specific index
-        current_idx_price = latest_price
-        if idx_key == "NIFTY": current_idx_price = nifty_price
-        elif idx_key == "SENSEX": current_idx_price = sensex_price
-        
-        full_symbol = config.INDEX_MAPPINGS.get(idx_key)
-        if not full_symbol: continue
-        
-        logger.info(f"Analyzing {idx_key} at {current_idx_price}...")
-        
-        # Calculate Indicators 
-        df_analysis = strategy.calculate_indicators(df.copy())
-        # We override the last close with current real-time price for the check
-        df_analysis.loc[df_analysis.index[-1], 'close'] = current_idx_price
-        
-        signal_data = strategy.check_signal(df_analysis)
+    # Option chains download while the strategy runs
+    chain_futures = request_option_chains(selected)
+    
+    # Apply Strategy per selected index, each on its own candles, in parallel
+    signal_futures = {
+        idx_key: market_data_pool.submit(profiler.wrap("analyze_index", analyze_index, index=idx_key),
+                                         idx_key, frames[idx_key], prices[idx_key])
+        for idx_key in selected
+    }
+    
+    update_option_chains(chain_futures, prices)
+    
+    # Orders are placed sequentially in selection order
+    for idx_key, future in signal_futures.items():
+        current_idx_price = prices[idx_key]
+        try:
+            signal_data = future.result()
+        except Exception as e:
+            logger.error(f"Strategy evaluation failed for {idx_key}: {e}")
+            continue
         
         if signal_data:
-            side = signal_data['side']
-            entry = signal_data['entry_price']
-            sl = signal_data['stop_loss']
-            tp = signal_data['take_profit']
-            
-            # Get index-specific settings
-            lot_count = getattr(config, f"LOT_SIZE_{idx_key}")
-            quantity = lot_count * config.LOT_MULTIPLIERS.get(idx_key, 1)
-            
-            moneyness = getattr(config, f"MONEYNESS_{idx_key}")
-            expiry = getattr(config, f"EXPIRY_{idx_key}")
-            
-            # Build Option Symbol
-            option_symbol = build_option_symbol(idx_key, current_idx_price, side, moneyness, expiry)
-            
-            logger.info(f"SIGNAL DETECTED for {idx_key}: {side} | Target Option: {option_symbol}")
+            execute_signal(idx_key, signal_data, current_idx_price)
             
-            # Place Paper Trade if enabled
-            if config.PAPER_TRADING_ENABLED:
-                logger.info(f"Executing Paper Trade for {option_symbol}...")
-                paper_broker.place_order(option_symbol, "MARKET", quantity, side, price=current_idx_price, sl=sl, tp=tp)
-                
-            # Place Live Trade if enabled
-            if config.LIVE_TRADING_ENABLED and live_broker:
-                logger.info(f"Executing LIVE Trade for {option_symbol} on Upstox...")
-                # Note: For live, we would use the actual Upstox instrument key
-                live_broker.place_order(option_symbol, "MARKET", quantity, side, price=current_idx_price, sl=sl, tp=tp)
-            
-    # Combine positions/orders for display
-    all_positions = paper_broker.get_positions()
-    all_orders = paper_broker.orders[:]
-    
-    if live_broker:
-        all_positions += live_broker.get_positions()
-        all_orders += live_broker.orders
-        
-    if all_positions:
-        logger.info(f"Open Positions: {len(all_positions)}")
+    # Publish this cycle's view for the web handlers
+    snapshot = publish_state()
+    if snapshot.state['positions']:
+        logger.info(f"Open Positions: {len(snapshot.state['positions'])}")
 
 def run_scheduler():
     """Background thread to run schedule"""
@@ -245,7 +420,141 @@ def run_scheduler():
     
     while True:
         schedule.run_pending()
-        time.sleep(1)
+        if publish_requested.wait(1):
+            publish_state()
+
+# --- Universe Scanner (SCANNER_ENABLED) ---
+def scanner_universe():
+    """{symbol: instrument key} to scan: every F&O underlying, or the configured keys."""
+    if config.SCANNER_SYMBOLS.strip().upper() == "FO":
+        return instrument_master.universe() if instrument_master else {}
+    keys = [k.strip() for k in config.SCANNER_SYMBOLS.split(",") if k.strip()]
+    return {k.split("|")[-1]: k for k in keys}
+
+def scanner_job():
+    """Fetches candles for the whole universe on the scanner's pool and scans them as one panel."""
+    if not (is_connected and upstox_client):
+        return
+    universe = scanner_universe()
+    if not universe:
+        logger.warning("Scanner: empty universe (instrument master not loaded yet?)")
+        return
+    to_date = datetime.now().strftime('%Y-%m-%d')
+    from_date = (datetime.now() - timedelta(days=config.SCANNER_HISTORY_DAYS)).strftime('%Y-%m-%d')
+    futures = {symbol: scanner_pool.submit(upstox_client.get_historical_candles, key, "1minute",
+                                           from_date, to_date, BULK)
+               for symbol, key in universe.items()}
+    frames = {}
+    for symbol, future in futures.items():
+        try:
+            frames[symbol] = future.result()
+        except Exception as e:
+            logger.error(f"Scanner fetch failed for {symbol}: {e}")
+    for signal in scanner.scan(frames):
+        logger.info(f"SCAN {signal['symbol']}: {signal['side']} @ {signal['entry_price']:.2f} "
+                    f"| SL: {signal['stop_loss']:.2f} | TP: {signal['take_profit']:.2f}")
+
+def run_scanner():
+    """Background thread: scans the universe every SCANNER_INTERVAL_SECONDS"""
+    while True:
+        try:
+            scanner_job()
+        except Exception as e:
+            logger.error(f"Scanner failed: {e}")
+        time.sleep(config.SCANNER_INTERVAL_SECONDS)
+
+# --- Live Order Reconciliation ---
+def run_order_reconciler():
+    """
+    Background thread: polls the order book while live orders await fills
+    and keeps the order connection warm when idle.
+    """
+    while True:
+        broker = live_broker
+        try:
+            if broker:
+                broker.reconcile()
+                broker.keep_warm(config.ORDER_KEEPALIVE_SECONDS)
+        except Exception as e:
+            logger.error(f"Order reconciliation failed: {e}")
+        time.sleep(config.ORDER_POLL_SECONDS if broker and broker.pending else 1.0)
+
+# --- Streaming Mode (DATA_MODE=STREAM or SIMULATED) ---
+INDEX_BY_KEY = {v: k for k, v in config.INDEX_MAPPINGS.items()}
+
+def on_stream_tick(tick):
+    """Keeps the headline prices live between bar closes and fills paper SL/TP on every tick."""
+    global latest_price, nifty_price, sensex_price, mock_priced
+    idx_key = INDEX_BY_KEY.get(tick['instrument_key'])
+    if idx_key in mock_priced:
+        mock_priced = mock_priced - {idx_key}
+    if idx_key == "BANKNIFTY": latest_price = tick['ltp']
+    elif idx_key == "NIFTY": nifty_price = tick['ltp']
+    elif idx_key == "SENSEX": sensex_price = tick['ltp']
+    if idx_key and paper_broker.on_prices({idx_key: tick['ltp']}):
+        publish_requested.set()
+
+def on_bar_close(instrument_key, bar):
+    """Evaluates the strategy for one index the moment its bar closes."""
+    idx_key = INDEX_BY_KEY.get(instrument_key)
+    if not idx_key:
+        return
+    with INDICATOR_SECONDS.time(index=idx_key):
+        df_analysis = strategy.update_bar(idx_key, bar)
+    selected = [k.strip() for k in config.SELECTED_INDICES]
+    if not bot_active or idx_key not in selected:
+        return
+    with SIGNAL_SECONDS.time(index=idx_key):
+        signal_data = strategy.check_signal(df_analysis)
+    if signal_data:
+        signal_data['signal_at'] = time.time()
+        execute_signal(idx_key, signal_data, bar['close'])
+        publish_requested.set()
+
+def run_streaming():
+    """Background thread: bar-close events from a push feed instead of a timer"""
+    global upstox_client
+    
+    # Warm the indicator engines and prices from history first
+    if is_connected and config.UPSTOX_ACCESS_TOKEN and not upstox_client:
+        upstox_client = UpstoxClient(config.UPSTOX_ACCESS_TOKEN, candle_store=candle_store, transport=upstox_transport,
+                                     base_url=config.UPSTOX_BASE_URL, scheduler=upstox_scheduler)
+    frames, prices, mocked = fetch_market_data(list(config.INDEX_MAPPINGS))
+    for idx_key, df in frames.items():
+        if is_connected and idx_key in mocked:
+            continue # Live bars must not extend a synthetic history
+        strategy.update_indicators(idx_key, df)
+    
+    if config.DATA_MODE == "STREAM" and upstox_client:
+        feed = UpstoxFeedClient(upstox_client, list(config.INDEX_MAPPINGS.values()))
+    else:
+        logger.info("Streaming from the local feed simulator")
+        feed = SimulatedFeed({config.INDEX_MAPPINGS[k]: prices[k] for k in config.INDEX_MAPPINGS},
+                             ticks_per_second=config.SIM_TICKS_PER_SECOND, speed=config.SIM_SPEED)
+    
+    engine = StreamingEngine(feed, on_bar_close, on_tick=on_stream_tick,
+                             timeframe=config.TIMEFRAME, capacity=config.BAR_BUFFER_SIZE)
+    try:
+        engine.start()
+    except Exception as e:
+        # No feed (websocket-client missing, authorize refused, ...): keep trading on the timer
+        logger.error(f"Market data feed failed to start: {e}. Falling back to polling every "
+                     f"{config.CHECK_INTERVAL_SECONDS}s.")
+        engine.stop()
+        return run_scheduler()
+    last_log = time.monotonic()
+    last_chains = 0.0
+    while True:
+        if bot_active and time.monotonic() - last_chains >= config.CHECK_INTERVAL_SECONDS:
+            last_chains = time.monotonic()
+            spots = {"BANKNIFTY": latest_price, "NIFTY": nifty_price, "SENSEX": sensex_price}
+            update_option_chains(request_option_chains([k.strip() for k in config.SELECTED_INDICES]), spots)
+        # Ticks move the headline prices continuously, so republish on a short period
+        publish_requested.wait(config.DASHBOARD_REFRESH_SECONDS)
+        publish_state()
+        if time.monotonic() - last_log >= 60:
+            last_log = time.monotonic()
+            logger.info(f"Stream: {engine.ticks} ticks, {engine.bars} bars, {engine.dropped} dropped")
 
 # Flask Routes
 from flask import Flask, render_template, request, redirect, url_for
@@ -288,20 +597,40 @@ def logout():
     session.pop('logged_in', None)
     return redirect(url_for('login'))
 
-@app.route('/')
-@login_required
-def dashboard():
+# --- Published State (built by the trading threads, read by the web handlers) ---
+def display_symbol(symbol):
+    """Trading symbol for listed option keys, otherwise the key without its exchange prefix."""
+    contract = instrument_master.contract(symbol) if instrument_master else None
+    if contract:
+        return contract['trading_symbol']
+    return symbol if "|" not in str(symbol) else str(symbol).split("|")[1]
+
+def build_dashboard_state():
+    """
+    JSON-ready view of prices, positions, P&L and recent orders.
+    Broker lists are copied, never modified.
+    """
     # Merge for UI
-    positions = paper_broker.get_positions()
-    orders = paper_broker.orders[:]
+    positions = list(paper_broker.get_positions())
+    orders = list(paper_broker.orders)
     
     if live_broker:
-        positions += live_broker.get_positions()
+        positions += live_broker.get_positions(priority=UI) or []
         orders += live_broker.orders
     
     # Calculate P&L for display
     total_pnl = 0
     display_positions = []
+    spot = {"BANKNIFTY": latest_price, "NIFTY": nifty_price, "SENSEX": sensex_price}
+    
+    # One batched LTP request for every open position
+    marks = {}
+    if is_connected and upstox_client and positions:
+        try:
+            marks = upstox_client.get_market_ltps([p.get('symbol') or p.get('instrument_token') for p in positions],
+                                                  priority=UI)
+        except:
+            pass
     
     for p in positions:
         # Handle Upstox Position Object vs Mock Dict
@@ -310,41 +639,147 @@ def dashboard():
         qty = int(p.get('quantity') or p.get('net_quantity') or 0)
         
         # Determine current mark
-        current_mark = latest_price # Fallback to Spot
+        current_mark = spot.get(p.get('underlying'), latest_price) # Fallback to Spot
         
-        # If it's a real Upstox position, try to get LTP for that symbol
-        if is_connected and upstox_client and symbol:
-            try:
-                ltp = upstox_client.get_market_ltp(symbol)
-                if ltp: current_mark = ltp
-            except:
-                pass
+        # If it's a real Upstox position, use the LTP for that symbol
+        ltp = marks.get(symbol)
+        if ltp: current_mark = ltp
         
         pnl = (current_mark - entry_price) * qty
         # Inverse P&L for Puts if it's a mock position (Real Upstox pos handles signs in net_quantity)
         if p.get('side') == 'BUY_PUT' and 'net_quantity' not in p:
              pnl = (entry_price - current_mark) * qty
-             
-        p['pnl'] = pnl
-        p['current_price'] = current_mark
-        p['entry_price'] = entry_price # Normalize for UI
-        p['quantity'] = qty
-        p['symbol_display'] = symbol if "|" not in str(symbol) else str(symbol).split("|")[1]
         
         total_pnl += pnl
-        display_positions.append(p)
+        display_positions.append({
+            'symbol_display': display_symbol(symbol),
+            'quantity': qty,
+            'entry_price': round(entry_price, 2),
+            'current_price': round(float(current_mark), 2),
+            'pnl': round(float(pnl), 2),
+        })
+    
+    recent_orders = [{
+        'id': str(o.get('id')),
+        'time': o['time'].strftime('%H:%M:%S'),
+        'symbol': display_symbol(o.get('symbol')),
+        'side': o.get('side'),
+        'quantity': o.get('quantity'),
+        'price': round(float(o['price']), 2) if o.get('price') else None,
+        'status': o.get('status'),
+    } for o in orders[-10:][::-1]]
     
+    return {
+        'prices': {
+            'BANKNIFTY': round(float(latest_price), 2),
+            'NIFTY': round(float(nifty_price), 2),
+            'SENSEX': round(float(sensex_price), 2),
+        },
+        'mock_prices': sorted(mock_priced), # Synthetic, not market, prices
+        'pnl': round(float(total_pnl), 2),
+        'capital': round(float(paper_broker.capital + total_pnl), 2),
+        'positions': display_positions,
+        'orders': recent_orders,
+        'is_connected': is_connected,
+        'bot_active': bot_active,
+        'square_off': square_off_status,
+    }
+
+def publish_state():
+    """
+    Builds the dashboard view on the calling background thread (this is where
+    the broker position and LTP calls happen) and publishes it as the next
+    immutable snapshot. Returns the current snapshot.
+    """
+    publish_requested.clear()
+    try:
+        with profiler.span("publish_state"):
+            return state_publisher.publish(build_dashboard_state())
+    except Exception as e:
+        logger.error(f"State publish failed: {e}")
+        return state_publisher.read()
+
+def state_delta(old, new):
+    """Top-level keys of `new` whose value differs from `old` (everything if old is None)."""
+    if old is None:
+        return dict(new)
+    return {k: v for k, v in new.items() if old.get(k) != v}
+
+publish_state() # Initial view (no broker I/O before login)
+
+@app.route('/')
+@login_required
+def dashboard():
+    snapshot = state_publisher.read()
+    state = snapshot.state
     return render_template('index.html', 
-                         pnl=total_pnl, 
-                         positions=display_positions, 
-                         orders=orders,
-                         capital=paper_broker.capital + total_pnl,
+                         pnl=state['pnl'], 
+                         positions=state['positions'], 
+                         orders=state['orders'],
+                         capital=state['capital'],
                          config=config,
-                         is_connected=is_connected,
-                         bot_active=bot_active,
-                         latest_price=latest_price,
-                         nifty_price=nifty_price,
-                         sensex_price=sensex_price)
+                         is_connected=state['is_connected'],
+                         bot_active=state['bot_active'],
+                         latest_price=state['prices']['BANKNIFTY'],
+                         nifty_price=state['prices']['NIFTY'],
+                         sensex_price=state['prices']['SENSEX'],
+                         state_version=snapshot.version)
+
+@app.route('/api/state')
+@login_required
+def api_state():
+    return Response(state_publisher.read().json, mimetype='application/json')
+
+@app.route('/api/stream')
+@login_required
+def api_stream():
+    """
+    Server-sent events: the full state once, then only the keys that changed.
+    Streams wake on each newly published snapshot, so open tabs add no broker calls.
+    """
+    def events():
+        sent_version, sent = None, None
+        snapshot = state_publisher.read()
+        while True:
+            if snapshot.version != sent_version:
+                delta = state_delta(sent, snapshot.state)
+                sent_version, sent = snapshot.version, snapshot.state
+                yield f"id: {snapshot.version}\ndata: {to_json(delta)}\n\n"
+            else:
+                yield ": keep-alive\n\n" # Stops proxies from closing an idle stream
+            snapshot = state_publisher.wait(sent_version, timeout=15)
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus scrape endpoint. Scrapers send `Authorization: Bearer <METRICS_TOKEN>`;
+    a logged-in dashboard session may also read it. Never open to anonymous callers.
+    """
+    token_ok = bool(config.METRICS_TOKEN) and hmac.compare_digest(
+        request.headers.get('Authorization', ''), f"Bearer {config.METRICS_TOKEN}")
+    if not (token_ok or 'logged_in' in session):
+        return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/scanner')
+@login_required
+def api_scanner():
+    """Signals from the last universe scan."""
+    if not scanner:
+        return Response(to_json({'enabled': False, 'signals': []}), mimetype='application/json')
+    scanned_at = scanner.scanned_at.isoformat() if scanner.scanned_at is not None else None
+    return Response(to_json({'enabled': True, 'scanned_at': scanned_at, 'instruments': len(scanner.panel.get('symbols', [])),
+                             'signals': scanner.results}), mimetype='application/json')
+
+@app.route('/api/profile')
+@login_required
+def api_profile():
+    """Recent trading_job traces in Chrome trace-event format (empty unless PROFILE_ENABLED)."""
+    headers = {'Content-Disposition': 'attachment; filename=trading_job_trace.json'}
+    return Response(to_json(profiler.export()), mimetype='application/json', headers=headers)
 
 @app.route('/toggle_bot', methods=['POST'])
 @login_required
@@ -352,18 +787,46 @@ def toggle_bot():
     global bot_active
     bot_active = not bot_active
     logger.info(f"Bot toggled: {bot_active}")
+    state_publisher.update(bot_active=bot_active)
     return redirect(url_for('dashboard'))
 
 @app.route('/square_off', methods=['POST'])
 @login_required
 def square_off():
-    # Square off both paper and live
-    paper_broker.square_off_all()
-    if live_broker:
-        live_broker.square_off_all()
+    # Square off both paper and live, off the request: confirming live exits can take seconds
+    global square_off_status
+    if not square_off_lock.acquire(blocking=False):
+        logger.warning("Square off already running; request ignored.")
+        return redirect(url_for('dashboard'))
     logger.info("Manual Square Off triggered from UI.")
+    square_off_status = {'running': True, 'started': datetime.now(ZoneInfo(MARKET_TZ)).strftime('%H:%M:%S')}
+    threading.Thread(target=run_square_off, name="square-off", daemon=True).start()
+    publish_requested.set()
     return redirect(url_for('dashboard'))
 
+def run_square_off():
+    """Background thread: closes every paper and live position and publishes the reports."""
+    global square_off_status
+    status = dict(square_off_status or {}, running=False)
+    try:
+        reports = {"paper": paper_broker.square_off_all(workers=config.SQUARE_OFF_WORKERS,
+                                                        retries=config.SQUARE_OFF_RETRIES)}
+        if live_broker:
+            reports["live"] = live_broker.square_off_all(workers=config.SQUARE_OFF_WORKERS,
+                                                         retries=config.SQUARE_OFF_RETRIES,
+                                                         confirm_timeout=config.SQUARE_OFF_CONFIRM_SECONDS)
+        for name, report in reports.items():
+            logger.info(f"Square-off ({name}): {report['positions']} positions, flat={report['flat']}, "
+                        f"time to flat {report['time_to_flat_ms']}ms")
+        status['reports'] = reports
+    except Exception as e:
+        logger.error(f"Square-off failed: {e}")
+        status['error'] = str(e)
+    finally:
+        square_off_status = status
+        square_off_lock.release()
+    publish_state()
+
 @app.route('/update_selection', methods=['POST'])
 @login_required
 def update_selection():
@@ -405,7 +868,7 @@ def login_upstox():
     if not config.UPSTOX_API_KEY or not config.UPSTOX_REDIRECT_URI:
         return "Please configure API Credentials first in Settings."
         
-    auth_url = f"https://api.upstox.com/v2/login/authorization/dialog?response_type=code&client_id={config.UPSTOX_API_KEY}&redirect_uri={config.UPSTOX_REDIRECT_URI}"
+    auth_url = f"{config.UPSTOX_BASE_URL}/login/authorization/dialog?response_type=code&client_id={config.UPSTOX_API_KEY}&redirect_uri={config.UPSTOX_REDIRECT_URI}"
     return redirect(auth_url)
 
 @app.route('/callback')
@@ -418,7 +881,7 @@ def callback():
         return "Error: No code received from Upstox."
         
     # Exchange Code for Token
-    url = "https://api.upstox.com/v2/login/authorization/token"
+    url = f"{config.UPSTOX_BASE_URL}/login/authorization/token"
     headers = {
         'accept': 'application/json',
         'Content-Type': 'application/x-www-form-urlencoded'
@@ -432,7 +895,7 @@ def callback():
     }
     
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = upstox_transport.post(url, endpoint='login/authorization/token', headers=headers, data=data)
         response_json = response.json()
         
         if response.status_code == 200:
@@ -442,8 +905,9 @@ def callback():
             
             # Initialize Live Broker
             global live_broker, upstox_client
-            upstox_client = UpstoxClient(access_token)
-            live_broker = UpstoxBroker(upstox_client)
+            upstox_client = UpstoxClient(access_token, candle_store=candle_store, transport=upstox_transport,
+                                         base_url=config.UPSTOX_BASE_URL, scheduler=upstox_scheduler)
+            live_broker = UpstoxBroker(upstox_client, journal=journal, pending_ttl=config.ORDER_PENDING_TTL_SECONDS)
             
             # Persist token to .env
             env_path = ".env"
@@ -468,6 +932,8 @@ def callback():
                 f.writelines(new_lines)
 
             logger.info("Upstox Login Successful and Token Persisted!")
+            state_publisher.update(is_connected=True)
+            publish_requested.set()
             return redirect(url_for('dashboard'))
         else:
             logger.error(f"Upstox Login Failed: {response.text}")
@@ -641,9 +1107,15 @@ def save_settings():
     return redirect(url_for('dashboard'))
 
 if __name__ == "__main__":
-    # Start Scheduler in Background Thread
-    t = threading.Thread(target=run_scheduler, daemon=True)
+    # Start Scheduler (or the streaming engine) in Background Thread
+    if instrument_master:
+        instrument_master.start(config.INSTRUMENT_REFRESH_TIME)
+    runner = run_streaming if config.DATA_MODE in ("STREAM", "SIMULATED") else run_scheduler
+    t = threading.Thread(target=runner, daemon=True)
     t.start()
+    threading.Thread(target=run_order_reconciler, name="order-reconciler", daemon=True).start()
+    if scanner:
+        threading.Thread(target=run_scanner, name="scanner", daemon=True).start()
     
     # Start Flask Server
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,321 @@
+import json
+import time
+import uuid
+import queue
+import struct
+import argparse
+import logging
+import threading
+import numpy as np
+from bar_aggregator import BarAggregator
+
+class FeedClient:
+    """
+    Pushes ticks into a callback: on_tick({'instrument_key', 'ltp', 'volume', 'timestamp'}).
+    timestamp is epoch seconds (float).
+    """
+    realtime = True # Tick timestamps follow the wall clock
+
+    def start(self, on_tick):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+def _varint(buf, i):
+    value = shift = 0
+    while True:
+        byte = buf[i]
+        i += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+def _fields(buf):
+    """(field number, value) for each field of one protobuf message; nested messages stay bytes."""
+    i, n = 0, len(buf)
+    while i < n:
+        key, i = _varint(buf, i)
+        number, wire = key >> 3, key & 7
+        if wire == 0:
+            value, i = _varint(buf, i)
+        elif wire == 1:
+            value, i = buf[i:i + 8], i + 8
+        elif wire == 2:
+            length, i = _varint(buf, i)
+            value, i = buf[i:i + length], i + length
+        elif wire == 5:
+            value, i = buf[i:i + 4], i + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire}")
+        yield number, value
+
+def _ltpc(buf):
+    """LTPC {ltp = 1 (double), ltt = 2 (int64 ms), ltq = 3 (int64), cp = 4 (double)}."""
+    ltpc = {'ltp': 0.0, 'ltt': 0, 'ltq': 0}
+    for number, value in _fields(buf):
+        if number == 1:
+            ltpc['ltp'] = struct.unpack('<d', value)[0]
+        elif number == 2:
+            ltpc['ltt'] = value
+        elif number == 3:
+            ltpc['ltq'] = value
+    return ltpc
+
+def decode_feed_response(message):
+    """
+    {instrument_key: LTPC dict} from one FeedResponse frame of Upstox's
+    MarketDataFeed.proto (v2). Only the fields the bot uses are read:
+    FeedResponse.feeds = 2 (map<string, Feed>); Feed.ltpc = 1 or Feed.ff = 2;
+    FullFeed.marketFF = 1 / indexFF = 2, each with ltpc = 1.
+    """
+    feeds = {}
+    for number, entry in _fields(message):
+        if number != 2:
+            continue
+        key, feed = None, b''
+        for field, value in _fields(entry): # Map entry: key = 1, value = 2
+            if field == 1:
+                key = value.decode('utf-8')
+            elif field == 2:
+                feed = value
+        ltpc = None
+        for field, value in _fields(feed):
+            if field == 1:
+                ltpc = value
+            elif field == 2:
+                for _, full in _fields(value): # marketFF or indexFF
+                    for sub, data in _fields(full):
+                        if sub == 1:
+                            ltpc = data
+        if key and ltpc is not None:
+            feeds[key] = _ltpc(ltpc)
+    return feeds
+
+class UpstoxFeedClient(FeedClient):
+    """
+    Upstox market data feed (WebSocket, protobuf frames).
+
+    The socket URL comes from the feed authorize endpoint; subscriptions are sent
+    as binary JSON and every frame is a FeedResponse protobuf, decoded by
+    decode_feed_response (no generated protobuf module needed).
+    """
+    def __init__(self, client, instrument_keys, mode="ltpc"):
+        self.client = client
+        self.instrument_keys = list(instrument_keys)
+        self.mode = mode
+        self.ws = None
+        self.thread = None
+        self.on_tick = None
+        self.logger = logging.getLogger("UpstoxFeed")
+
+    def authorize(self):
+        url = f"{self.client.base_url}/feed/market-data-feed/authorize"
+        headers = {
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {self.client.access_token}'
+        }
+        response = self.client.transport.get(url, endpoint='feed/authorize', headers=headers)
+        if response.status_code != 200:
+            self.logger.error(f"Feed authorize failed {response.status_code}: {response.text}")
+            return None
+        return response.json().get('data', {}).get('authorizedRedirectUri')
+
+    def start(self, on_tick):
+        import websocket
+
+        self.on_tick = on_tick
+        ws_url = self.authorize()
+        if not ws_url:
+            raise RuntimeError("Could not authorize Upstox market data feed")
+
+        self.ws = websocket.WebSocketApp(ws_url,
+                                         on_open=self._on_open,
+                                         on_message=self._on_message,
+                                         on_error=lambda ws, e: self.logger.error(f"Feed error: {e}"),
+                                         on_close=lambda ws, code, msg: self.logger.warning(f"Feed closed: {code} {msg}"))
+        self.thread = threading.Thread(target=self.ws.run_forever, kwargs={'ping_interval': 10}, daemon=True)
+        self.thread.start()
+
+    def _on_open(self, ws):
+        import websocket
+        message = {
+            "guid": uuid.uuid4().hex,
+            "method": "sub",
+            "data": {"mode": self.mode, "instrumentKeys": self.instrument_keys}
+        }
+        ws.send(json.dumps(message).encode('utf-8'), opcode=websocket.ABNF.OPCODE_BINARY)
+        self.logger.info(f"Subscribed to {len(self.instrument_keys)} instruments ({self.mode})")
+
+    def _on_message(self, ws, message):
+        try:
+            feeds = decode_feed_response(message)
+        except (ValueError, IndexError, UnicodeDecodeError, struct.error) as e:
+            self.logger.warning(f"Undecodable feed frame ({len(message)} bytes): {e}")
+            return
+        for key, ltpc in feeds.items():
+            if not ltpc['ltp']:
+                continue
+            self.on_tick({
+                'instrument_key': key,
+                'ltp': ltpc['ltp'],
+                'volume': float(ltpc['ltq']),
+                'timestamp': (ltpc['ltt'] / 1000.0) if ltpc['ltt'] else time.time(),
+            })
+
+    def stop(self):
+        if self.ws:
+            self.ws.close()
+
+class SimulatedFeed(FeedClient):
+    """
+    Local stand-in for the broker feed: geometric random-walk ticks for a set of
+    instruments at a target rate, with an optional simulated clock so bars close
+    faster than real time during load tests.
+    """
+    def __init__(self, base_prices, ticks_per_second=100, speed=1.0, seed=None, vol_per_tick=0.0002):
+        self.base_prices = dict(base_prices)
+        self.ticks_per_second = ticks_per_second
+        self.speed = speed # Simulated seconds per wall-clock second
+        self.rng = np.random.default_rng(seed)
+        self.vol_per_tick = vol_per_tick
+        self.realtime = speed == 1.0
+        self.running = False
+        self.thread = None
+
+    def ticks(self, count, start_time=None):
+        """
+        Generates `count` ticks round-robin across instruments (vectorized).
+        """
+        keys = list(self.base_prices)
+        n_keys = len(keys)
+        start_time = time.time() if start_time is None else start_time
+        steps = self.rng.normal(0, self.vol_per_tick, count)
+        prices = np.empty(count)
+        volumes = self.rng.integers(1, 100, count)
+        dt = self.speed / max(self.ticks_per_second, 1)
+        for i, key in enumerate(keys):
+            idx = np.arange(i, count, n_keys)
+            path = self.base_prices[key] * np.exp(np.cumsum(steps[idx]))
+            prices[idx] = path
+            if len(path):
+                self.base_prices[key] = path[-1]
+        stamps = start_time + np.arange(count) * dt
+        return [{'instrument_key': keys[i % n_keys], 'ltp': float(prices[i]),
+                 'volume': float(volumes[i]), 'timestamp': float(stamps[i])} for i in range(count)]
+
+    def start(self, on_tick):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, args=(on_tick,), daemon=True)
+        self.thread.start()
+
+    def _run(self, on_tick):
+        batch = max(1, self.ticks_per_second // 20) # ~50ms batches
+        sim_time = time.time()
+        next_wake = time.perf_counter()
+        while self.running:
+            for tick in self.ticks(batch, start_time=sim_time):
+                on_tick(tick)
+            sim_time += batch * self.speed / self.ticks_per_second
+            next_wake += batch / self.ticks_per_second
+            delay = next_wake - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def stop(self):
+        self.running = False
+
+class StreamingEngine:
+    """
+    Event-driven ingestion: the feed pushes ticks onto a queue, one worker thread
+    folds them into `timeframe` bars and calls on_bar_close(instrument_key, bar)
+    the moment a bar closes, so strategy evaluation follows the data instead of a timer.
+    """
+    def __init__(self, feed, on_bar_close, on_tick=None, timeframe="1minute", queue_size=100000, capacity=2000):
+        self.feed = feed
+        self.on_bar_close = on_bar_close
+        self.on_tick = on_tick
+        self.timeframe = timeframe
+        self.aggregator = BarAggregator((timeframe,), capacity=capacity)
+        self.emitted = {} # instrument_key -> start of the last bar handed to on_bar_close
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.running = False
+        self.worker = None
+        self.ticks = 0
+        self.bars = 0
+        self.dropped = 0
+        self.logger = logging.getLogger("StreamingEngine")
+
+    def push(self, tick):
+        """Feed callback; never blocks the feed thread."""
+        try:
+            self.queue.put_nowait(tick)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self.running = True
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+        self.feed.start(self.push)
+        self.logger.info("Streaming engine started")
+
+    def stop(self):
+        self.feed.stop()
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            try:
+                tick = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                if self.feed.realtime:
+                    self._flush(time.time())
+                continue
+            self.ticks += 1
+            if self.on_tick:
+                self.on_tick(tick)
+            key = tick['instrument_key']
+            if self.aggregator.add_tick(key, tick['timestamp'], tick['ltp'], tick['volume']):
+                ring = self.aggregator.ring(key, self.timeframe)
+                self._emit(key, ring, (ring.head - 1) % ring.capacity)
+
+    def _flush(self, now):
+        """Closes bars of quiet instruments once their interval has ended."""
+        for key, rings in self.aggregator.rings.items():
+            ring = rings[self.timeframe]
+            if ring.count and now >= ring.start[ring.head] + ring.seconds:
+                self._emit(key, ring, ring.head)
+
+    def _emit(self, key, ring, i):
+        start = int(ring.start[i])
+        if self.emitted.get(key, -1) >= start:
+            return # Already emitted by an idle flush
+        self.emitted[key] = start
+        self.bars += 1
+        bar = ring.bar(i)
+        bar['instrument_key'] = key
+        try:
+            self.on_bar_close(key, bar)
+        except Exception as e:
+            self.logger.error(f"Bar-close handler failed for {key}: {e}")
+
+if __name__ == "__main__":
+    # Offline load test: python market_feed.py --rate 5000 --seconds 10 --speed 60
+    parser = argparse.ArgumentParser(description="Load-test the streaming engine with the simulated feed")
+    parser.add_argument("--rate", type=int, default=5000, help="ticks per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--speed", type=float, default=60, help="simulated seconds per wall second")
+    parser.add_argument("--instruments", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    prices = {f"SIM|{i}": 20000.0 + 1000 * i for i in range(args.instruments)}
+    feed = SimulatedFeed(prices, ticks_per_second=args.rate, speed=args.speed, seed=42)
+    engine = StreamingEngine(feed, on_bar_close=lambda key, bar: None)
+    engine.start()
+    time.sleep(args.seconds)
+    engine.stop()
+    print(f"ticks={engine.ticks} ({engine.ticks / args.seconds:.0f}/s) bars={engine.bars} "
+          f"dropped={engine.dropped} backlog={engine.queue.qsize()}")
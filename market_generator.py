@@ -0,0 +1,230 @@
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+from candle_store import MARKET_TZ
+
+TRADING_DAYS = 252
+SESSION_OPEN = (9, 15)
+SESSION_CLOSE = (15, 30)
+ANCHOR = np.datetime64("2000-01-03") # A Monday; bar numbers count session bars from here
+
+# Annualised volatility per index when none is given
+DEFAULT_VOLS = {"BANKNIFTY": 0.18, "NIFTY": 0.14, "SENSEX": 0.14}
+
+# (volatility multiplier, mean duration in bars): calm and stressed markets
+DEFAULT_REGIMES = ((1.0, 750), (2.5, 150))
+
+class MarketGenerator:
+    """
+    Seedable synthetic 1-minute (or `bar_seconds`) OHLCV for several indices
+    at once.
+
+    Log returns are correlated geometric Brownian motion (Cholesky factor of
+    the correlation matrix), optionally scaled by a Markov regime path of
+    volatility multipliers. Bars only fall inside the exchange session on
+    weekdays, sessions open with an overnight gap, and volume follows a
+    U-shaped intraday curve that also rises with the size of the move. Each
+    call is one NumPy pass over all bars and indices; the generator keeps the
+    last closes, regime and clock, so successive calls (or stream()) continue
+    the same paths, and a seed reproduces them exactly.
+    """
+    def __init__(self, base_prices, vols=None, correlation=0.8, drift=0.0, regimes=None, seed=None,
+                 bar_seconds=60, start=None, base_volume=1000.0, gap_vol_days=0.25):
+        self.names = list(base_prices)
+        k = len(self.names)
+        self.last_log = np.log([float(base_prices[n]) for n in self.names])
+        vols = DEFAULT_VOLS if vols is None else vols
+        self.vols = np.array([vols.get(n, 0.16) if isinstance(vols, dict) else vols for n in self.names], dtype=float)
+        self.drift = drift
+        self.base_volume = base_volume
+        self.gap_vol_days = gap_vol_days # Overnight variance as a fraction of one session's
+
+        if np.isscalar(correlation):
+            corr = np.full((k, k), float(correlation))
+            np.fill_diagonal(corr, 1.0)
+        else:
+            corr = np.asarray(correlation, dtype=float)
+        self.chol = np.linalg.cholesky(corr)
+
+        self.bar_seconds = bar_seconds
+        self.open_seconds = SESSION_OPEN[0] * 3600 + SESSION_OPEN[1] * 60
+        self.bars_per_day = (SESSION_CLOSE[0] * 3600 + SESSION_CLOSE[1] * 60 - self.open_seconds) // bar_seconds
+        self.dt = 1.0 / (TRADING_DAYS * self.bars_per_day) # Years per bar
+
+        # One random stream per component, each drawn in bar order, so the
+        # paths for a seed do not depend on how they are chunked
+        streams = np.random.SeedSequence(seed).spawn(5)
+        self.shock_rng, self.gap_rng, self.wick_rng, self.volume_rng, self.regime_rng = (
+            np.random.default_rng(s) for s in streams)
+
+        self.regimes = np.array(regimes or ((1.0, 1),), dtype=float)
+        self.run_states = np.zeros(1, dtype=np.int64) # Drawn regime runs not yet used up; start calm
+        self.run_lengths = np.zeros(1, dtype=np.int64)
+        if len(self.regimes) > 1:
+            self.run_lengths[0] = self.regime_rng.geometric(1.0 / self.regimes[0, 1])
+        self.lock = threading.Lock()
+        self.bar = self._day_bar(np.datetime64(start or "2024-01-01", 'D'))
+        self.logger = logging.getLogger("MarketGenerator")
+
+    # --- Clock ---
+
+    def _day_bar(self, day):
+        """Number of the first bar of `day` (rolled forward to a weekday)."""
+        return int(np.busday_count(ANCHOR, np.busday_offset(day, 0, roll='forward'))) * self.bars_per_day
+
+    def bar_at(self, when):
+        """Number of the latest session bar that has started by `when` (aware, or naive exchange time)."""
+        if when.tzinfo is not None:
+            when = when.astimezone(ZoneInfo(MARKET_TZ))
+        day = np.datetime64(when.date(), 'D')
+        seconds = when.hour * 3600 + when.minute * 60 + when.second - self.open_seconds
+        if not np.is_busday(day) or seconds < 0:
+            # Before the open (or on a holiday): the last bar of the previous session
+            day = np.busday_offset(day, 0, roll='backward') if not np.is_busday(day) else np.busday_offset(day, -1)
+            return self._day_bar(day) + self.bars_per_day - 1
+        offset = min(seconds // self.bar_seconds, self.bars_per_day - 1)
+        return self._day_bar(day) + offset
+
+    def bars_until(self, when):
+        """How many bars generate() needs to reach the bar in progress at `when`."""
+        return max(0, self.bar_at(when) - self.bar + 1)
+
+    def timestamps(self, first, n):
+        """Exchange-time timestamps of bars first .. first + n - 1."""
+        bars = first + np.arange(n)
+        days = np.busday_offset(ANCHOR, bars // self.bars_per_day)
+        ns = (days.astype('datetime64[ns]')
+              + np.timedelta64(self.open_seconds, 's')
+              + (bars % self.bars_per_day) * np.timedelta64(self.bar_seconds, 's'))
+        return pd.DatetimeIndex(ns).tz_localize(MARKET_TZ)
+
+    # --- Paths ---
+
+    def _regime_path(self, n, batch=1024):
+        """Volatility multiplier per bar from a Markov chain of regimes."""
+        count = len(self.regimes)
+        if count == 1:
+            return np.full(n, self.regimes[0, 0])
+        states, lengths = self.run_states, self.run_lengths
+        while lengths.sum() <= n:
+            # Runs are drawn in fixed batches; each switches to one of the other regimes
+            steps = self.regime_rng.integers(1, count, batch)
+            new_states = (states[-1] + np.cumsum(steps)) % count
+            new_lengths = self.regime_rng.geometric(1.0 / self.regimes[new_states, 1])
+            states = np.concatenate([states, new_states])
+            lengths = np.concatenate([lengths, new_lengths])
+        ends = np.cumsum(lengths)
+        used = int(np.searchsorted(ends, n, side='right')) # Runs finished within these n bars
+        path = np.repeat(self.regimes[states, 0], lengths)[:n]
+        self.run_states = states[used:]
+        self.run_lengths = lengths[used:].copy()
+        self.run_lengths[0] = ends[used] - n
+        return path
+
+    def generate(self, n, end=None):
+        """
+        The next `n` bars for every index as {name: DataFrame} with
+        timestamp/open/high/low/close/volume. With `end`, the clock first
+        moves so the last bar is the one in progress at `end`; prices still
+        continue from the previous call.
+        """
+        with self.lock:
+            if end is not None:
+                self.bar = self.bar_at(end) - n + 1
+            first = self.bar
+            k = len(self.names)
+            sigma_bar = self.vols * np.sqrt(self.dt)
+            position = (first + np.arange(n)) % self.bars_per_day
+
+            # Correlated shocks, scaled by the regime path
+            shocks = self.shock_rng.standard_normal((n, k)) @ self.chol.T
+            scale = self._regime_path(n)[:, None]
+            returns = (self.drift - 0.5 * self.vols ** 2) * self.dt + sigma_bar * scale * shocks
+
+            # Overnight gap into the first bar of each session
+            gaps = np.zeros((n, k))
+            opens = np.nonzero(position == 0)[0]
+            gap_sigma = sigma_bar * np.sqrt(self.bars_per_day * self.gap_vol_days)
+            gaps[opens] = (self.gap_rng.standard_normal((len(opens), k)) @ self.chol.T) * gap_sigma
+
+            # Accumulate from the previous log close so chunked paths match one long pass bit for bit
+            log_close = np.cumsum(np.vstack([self.last_log, gaps + returns]), axis=0)[1:]
+            close = np.exp(log_close)
+            open_ = np.exp(log_close - returns)
+            wick = np.abs(self.wick_rng.standard_normal((n, 2, k))) * (sigma_bar * scale * 0.5)[:, None, :]
+            high = np.maximum(open_, close) * np.exp(wick[:, 0])
+            low = np.minimum(open_, close) * np.exp(-wick[:, 1])
+
+            # U-shaped intraday volume, heavier on large moves
+            x = position / self.bars_per_day
+            curve = 1.0 + 1.5 * np.exp(-x / 0.08) + 0.8 * np.exp(-(1.0 - x) / 0.1)
+            noise = self.volume_rng.lognormal(0.0, 0.3, (n, k))
+            volume = np.round(self.base_volume * curve[:, None] * noise * (0.6 + 0.4 * np.abs(shocks)))
+
+            stamps = self.timestamps(first, n)
+            if n:
+                self.last_log = log_close[-1]
+            self.bar = first + n
+
+        return {name: pd.DataFrame({
+            'timestamp': stamps,
+            'open': open_[:, i],
+            'high': high[:, i],
+            'low': low[:, i],
+            'close': close[:, i],
+            'volume': volume[:, i],
+        }) for i, name in enumerate(self.names)}
+
+    def stream(self, total, chunk=100_000):
+        """Yields generate() chunks until `total` bars per index; memory stays at one chunk."""
+        done = 0
+        while done < total:
+            n = min(chunk, total - done)
+            yield self.generate(n)
+            done += n
+
+def soak(generator, total, chunk, backtest=False):
+    """
+    Streams `total` bars per index through the vectorized backtester (or
+    just generates them) and returns throughput plus a digest of every close,
+    which is identical across runs with the same seed.
+    """
+    from config import Config
+    from backtest import VectorizedBacktester
+    tester = VectorizedBacktester(Config()) if backtest else None
+    digests = {name: hashlib.sha256() for name in generator.names} # Per index, so chunking does not matter
+    trades = 0
+    started = time.perf_counter()
+    for frames in generator.stream(total, chunk):
+        for name, df in frames.items():
+            digests[name].update(df['close'].to_numpy().tobytes())
+            if tester:
+                trades += len(tester.run(df)['trades'])
+    seconds = time.perf_counter() - started
+    bars = total * len(generator.names)
+    digest = hashlib.sha256(b"".join(d.digest() for d in digests.values()))
+    return {'bars': bars, 'seconds': round(seconds, 3), 'bars_per_second': round(bars / seconds),
+            'trades': trades, 'digest': digest.hexdigest()[:16]}
+
+if __name__ == "__main__":
+    # Soak test: python market_generator.py --bars 1000000 --seed 42 --regimes --backtest
+    parser = argparse.ArgumentParser(description="Stream synthetic correlated index candles (soak/load testing)")
+    parser.add_argument("--bars", type=int, default=1_000_000, help="bars per index")
+    parser.add_argument("--chunk", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--correlation", type=float, default=0.8)
+    parser.add_argument("--regimes", action="store_true", help="switch between calm and stressed volatility")
+    parser.add_argument("--backtest", action="store_true", help="run the vectorized backtester on every chunk")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    generator = MarketGenerator({"BANKNIFTY": 45000.0, "NIFTY": 24000.0, "SENSEX": 80000.0},
+                                correlation=args.correlation, seed=args.seed,
+                                regimes=DEFAULT_REGIMES if args.regimes else None)
+    for key, value in soak(generator, args.bars, args.chunk, backtest=args.backtest).items():
+        print(f"{key:>15}: {value}")
@@ -0,0 +1,132 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    """Monotonic counter per label combination."""
+    kind = "counter"
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}_total{_labels(self.labelnames, key)} {value}" for key, value in items]
+
+class Histogram:
+    """
+    Fixed-bucket histogram per label combination. observe() is a bisect plus
+    two additions under a short lock; cumulative counts are only built when
+    the metrics are scraped.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {} # labels -> [per-bucket counts (+Inf last), sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self.series.items()]
+        lines = []
+        for key, counts, total in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                running += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, doc, labelnames=()):
+        metric = Counter(name, doc, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, doc, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            name = metric.name + ("_total" if metric.kind == "counter" else "")
+            lines.append(f"# HELP {name} {metric.doc}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# --- Upstox transport ---
+UPSTOX_LATENCY = REGISTRY.histogram("upstox_request_seconds", "Upstox API call latency including retries", ["endpoint"])
+UPSTOX_ERRORS = REGISTRY.counter("upstox_errors", "Upstox API calls that failed or returned HTTP >= 400", ["endpoint"])
+UPSTOX_RETRIES = REGISTRY.counter("upstox_retries", "Upstox API retry attempts", ["endpoint"])
+
+# --- Trading cycle ---
+CYCLE_SECONDS = REGISTRY.histogram("trading_job_seconds", "Duration of one trading_job cycle")
+INDICATOR_SECONDS = REGISTRY.histogram("indicator_seconds", "Indicator update time per index", ["index"])
+SIGNAL_SECONDS = REGISTRY.histogram("signal_seconds", "Signal check time per index", ["index"])
+ORDER_SECONDS = REGISTRY.histogram("order_roundtrip_seconds", "Order placement round trip per broker", ["broker"])
+ORDER_ACK_SECONDS = REGISTRY.histogram("order_signal_to_ack_seconds", "From signal detection to the broker's order id", ["broker"])
+ORDER_FILL_SECONDS = REGISTRY.histogram("order_signal_to_fill_seconds", "From signal detection to the reconciled fill", ["broker"],
+                                        buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+TIME_TO_FLAT_SECONDS = REGISTRY.histogram("square_off_time_to_flat_seconds", "From square-off request to no open positions", ["broker"],
+                                          buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+MOCK_FALLBACKS = REGISTRY.counter("mock_fallbacks", "Cycles that fell back to mock candles", ["index"])
+SIGNALS = REGISTRY.counter("signals", "Strategy signals per index and side", ["index", "side"])
+
+# --- Request scheduler ---
+SCHEDULER_WAIT = REGISTRY.histogram("upstox_scheduler_wait_seconds", "Time an Upstox call waited for rate-limit tokens", ["priority"])
+COALESCED = REGISTRY.counter("upstox_coalesced", "Upstox calls served by an identical in-flight request", ["endpoint"])
+THROTTLED = REGISTRY.counter("upstox_throttled", "Upstox 429 responses that paused the request scheduler", ["endpoint"])
@@ -0,0 +1,202 @@
+import os
+import time
+import argparse
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from config import Config
+from backtest import VectorizedBacktester
+
+PARAM_NAMES = ['ema_period', 'slope_threshold', 'sl_atr_buffer', 'reward_ratio']
+
+# Worker-side view of the shared indicator block (set once per process)
+_worker = {}
+
+def _attach(name, shape, rows, capital):
+    shm = shared_memory.SharedMemory(name=name) # The parent owns and unlinks the segment
+    _worker['shm'] = shm
+    _worker['block'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _worker['rows'] = rows
+    _worker['capital'] = capital
+
+def _evaluate(task):
+    """
+    Backtests one parameter combination on one [start, end) window of the shared arrays.
+    """
+    params, start, end = task
+    block, rows = _worker['block'], _worker['rows']
+
+    def col(key):
+        return block[rows[key], start:end]
+
+    period = params['ema_period']
+    ind = {'ema_20': col(f"ema_{period}"), 'ema_slope': col(f"slope_{period}"), 'vwap': col('vwap'), 'atr': col('atr')}
+    bt = VectorizedBacktester(Config, slope_threshold=params['slope_threshold'],
+                              sl_atr_buffer=params['sl_atr_buffer'], reward_ratio=params['reward_ratio'])
+    stats = bt.evaluate(col('open'), col('high'), col('low'), col('close'), ind, capital=_worker['capital'])
+    return params, start, end, stats
+
+def walk_forward_windows(n, train_bars=None, test_bars=None, step_bars=None):
+    """
+    [(train_window, test_window), ...] as (start, end) bar ranges.
+    Without train/test sizes the whole history is a single in-sample window.
+    """
+    if not train_bars or not test_bars:
+        return [((0, n), None)]
+    step_bars = step_bars or test_bars
+    windows = []
+    start = 0
+    while start + train_bars + test_bars <= n:
+        windows.append(((start, start + train_bars), (start + train_bars, start + train_bars + test_bars)))
+        start += step_bars
+    return windows
+
+class ParameterOptimizer:
+    """
+    Sweeps strategy parameters over stored history on every core.
+
+    Indicator arrays that do not depend on the sweep (OHLCV, VWAP, ATR) and the
+    EMA/slope series for each EMA period are computed once and placed in a single
+    shared-memory block; workers attach to it by name, so tasks only carry the
+    parameter dict and a window.
+    """
+    def __init__(self, config, grid, metric='total_pnl', min_trades=5, workers=None):
+        self.config = config
+        self.grid = grid
+        self.metric = metric
+        self.min_trades = min_trades
+        self.workers = workers or os.cpu_count()
+        self.logger = logging.getLogger("Optimizer")
+
+    def combinations(self):
+        values = [self.grid[name] for name in PARAM_NAMES]
+        return [dict(zip(PARAM_NAMES, combo)) for combo in itertools.product(*values)]
+
+    def _build_block(self, df):
+        bt = VectorizedBacktester(self.config)
+        arrays = {col: df[col].to_numpy(dtype=np.float64) for col in ['open', 'high', 'low', 'close', 'volume']}
+        base = bt.indicators(arrays['high'], arrays['low'], arrays['close'], arrays['volume'])
+        arrays['vwap'], arrays['atr'] = base['vwap'], base['atr']
+        for period in self.grid['ema_period']:
+            arrays[f"ema_{period}"], arrays[f"slope_{period}"] = bt.ema(arrays['close'], period)
+
+        rows = {key: i for i, key in enumerate(arrays)}
+        shape = (len(rows), len(df))
+        shm = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 8))
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        for key, i in rows.items():
+            block[i] = arrays[key]
+        return shm, shape, rows
+
+    def _score(self, stats):
+        if stats['trades'] < self.min_trades:
+            return -np.inf
+        return stats[self.metric]
+
+    def run(self, df, train_bars=None, test_bars=None, step_bars=None):
+        """
+        Returns (ranked, walk_forward) DataFrames. `ranked` aggregates in-sample
+        results per combination; `walk_forward` holds the best train combination
+        of each fold and its out-of-sample stats (empty for a plain sweep).
+        """
+        combos = self.combinations()
+        windows = walk_forward_windows(len(df), train_bars, test_bars, step_bars)
+        if not windows:
+            raise ValueError("History is shorter than one train + test window")
+
+        started = time.perf_counter()
+        shm, shape, rows = self._build_block(df)
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_attach,
+                                     initargs=(shm.name, shape, rows, self.config.CAPITAL)) as pool:
+                tasks = [(params, train[0], train[1]) for train, _ in windows for params in combos]
+                chunksize = max(1, len(tasks) // (self.workers * 8))
+                train_results = list(pool.map(_evaluate, tasks, chunksize=chunksize))
+
+                # Pick the best in-sample combination per fold and test it out of sample
+                folds = []
+                per_fold = len(combos)
+                for f, (train, test) in enumerate(windows):
+                    fold = train_results[f * per_fold:(f + 1) * per_fold]
+                    best = max(fold, key=lambda r: self._score(r[3]))
+                    folds.append((f, train, test, best))
+                test_tasks = [(best[0], test[0], test[1]) for _, _, test, best in folds if test]
+                test_results = list(pool.map(_evaluate, test_tasks)) if test_tasks else []
+        finally:
+            shm.close()
+            shm.unlink()
+
+        ranked = self._rank(train_results)
+        walk_forward = pd.DataFrame([
+            {'fold': f, 'train_start': train[0], 'train_end': train[1], 'test_start': oos[1], 'test_end': oos[2],
+             **oos[0], **{f"train_{k}": v for k, v in best[3].items()},
+             **{f"test_{k}": v for k, v in oos[3].items()}}
+            for (f, train, _, best), oos in zip([x for x in folds if x[2]], test_results)
+        ])
+        self.logger.info(f"Evaluated {len(train_results) + len(test_results)} backtests "
+                         f"({len(combos)} combos x {len(windows)} windows) in {time.perf_counter() - started:.1f}s")
+        return ranked, walk_forward
+
+    def _rank(self, results):
+        records = [{**params, **stats} for params, _, _, stats in results]
+        table = pd.DataFrame(records)
+        if table.empty:
+            return table
+        ranked = table.groupby(PARAM_NAMES, as_index=False).agg(
+            windows=('trades', 'size'),
+            trades=('trades', 'sum'),
+            total_pnl=('total_pnl', 'sum'),
+            avg_pnl=('avg_pnl', 'mean'),
+            win_rate=('win_rate', 'mean'),
+            profit_factor=('profit_factor', 'mean'),
+            max_drawdown=('max_drawdown', 'max'),
+        )
+        ranked = ranked[ranked['trades'] >= self.min_trades].sort_values(self.metric, ascending=False)
+        return ranked.reset_index(drop=True)
+
+def _parse_list(text, cast):
+    return [cast(v) for v in text.split(",") if v.strip()]
+
+if __name__ == "__main__":
+    from candle_store import CandleStore
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Parameter sweep / walk-forward optimizer for the pullback strategy")
+    parser.add_argument("--instrument", default=Config.INDEX_MAPPINGS["BANKNIFTY"])
+    parser.add_argument("--interval", default="1minute")
+    parser.add_argument("--ema", default="10,15,20,30,40")
+    parser.add_argument("--slope", default="0.00005,0.0001,0.0002")
+    parser.add_argument("--buffer", default="0.05,0.1,0.2")
+    parser.add_argument("--reward", default="1.5,2,2.5,3")
+    parser.add_argument("--metric", default="total_pnl", choices=["total_pnl", "avg_pnl", "win_rate", "profit_factor"])
+    parser.add_argument("--min-trades", type=int, default=5)
+    parser.add_argument("--train-bars", type=int, default=None)
+    parser.add_argument("--test-bars", type=int, default=None)
+    parser.add_argument("--step-bars", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="data/optimizer_results.csv")
+    args = parser.parse_args()
+
+    df = CandleStore(Config.CANDLE_STORE_DIR).read_frame(args.instrument, args.interval)
+    if df.empty:
+        raise SystemExit(f"No stored candles for {args.instrument} ({args.interval})")
+
+    grid = {
+        'ema_period': _parse_list(args.ema, int),
+        'slope_threshold': _parse_list(args.slope, float),
+        'sl_atr_buffer': _parse_list(args.buffer, float),
+        'reward_ratio': _parse_list(args.reward, float),
+    }
+    optimizer = ParameterOptimizer(Config(), grid, metric=args.metric, min_trades=args.min_trades, workers=args.workers)
+    ranked, walk_forward = optimizer.run(df, args.train_bars, args.test_bars, args.step_bars)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    ranked.to_csv(args.out, index=False)
+    print(ranked.head(20).to_string())
+    if not walk_forward.empty:
+        wf_path = os.path.splitext(args.out)[0] + "_walkforward.csv"
+        walk_forward.to_csv(wf_path, index=False)
+        print(walk_forward.to_string())
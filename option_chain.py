@@ -0,0 +1,214 @@
+import time
+import logging
+from datetime import datetime, time as dtime
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+from candle_store import MARKET_TZ
+
+YEAR_SECONDS = 365.0 * 86400
+MIN_EXPIRY_YEARS = 60.0 / YEAR_SECONDS # Floor time to expiry at one minute
+EXPIRY_TIME = dtime(15, 30)            # Index options settle at the close
+
+def _erfc(x):
+    """Complementary error function (Chebyshev fit, relative error < 1.2e-7 everywhere)."""
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    r = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277)))))))))
+    return np.where(x >= 0, r, 2.0 - r)
+
+def norm_cdf(x):
+    return 0.5 * _erfc(-x / np.sqrt(2.0))
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2.0 * np.pi)
+
+def _d1_d2(spot, strike, t, sigma, r):
+    vol_t = sigma * np.sqrt(t)
+    d1 = (np.log(spot / strike) + (r + 0.5 * sigma * sigma) * t) / vol_t
+    return d1, d1 - vol_t
+
+def bs_price(spot, strike, t, sigma, is_call, r=0.0):
+    """Black-Scholes price for arrays of European calls/puts (no dividend yield)."""
+    d1, d2 = _d1_d2(spot, strike, t, sigma, r)
+    discount = strike * np.exp(-r * t)
+    call = spot * norm_cdf(d1) - discount * norm_cdf(d2)
+    put = discount * norm_cdf(-d2) - spot * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+def implied_vol(price, spot, strike, t, is_call, r=0.0, tol=1e-6, max_iter=50, lo=1e-4, hi=5.0):
+    """
+    Implied volatility for every option at once.
+
+    Newton steps on a per-option [lo, hi] bracket that tightens every
+    iteration; a step that leaves the bracket or meets a vanishing vega falls
+    back to bisection, so every option converges. Prices outside the
+    no-arbitrage bounds come back as NaN.
+    """
+    price, spot, strike, t, is_call = (np.asarray(a, dtype=float if i < 4 else bool)
+                                       for i, a in enumerate(np.broadcast_arrays(price, spot, strike, t, is_call)))
+    discount = strike * np.exp(-r * t)
+    lower = np.where(is_call, np.maximum(spot - discount, 0.0), np.maximum(discount - spot, 0.0))
+    upper = np.where(is_call, spot, discount)
+    valid = (price > lower) & (price < upper) & (t > 0) & (spot > 0) & (strike > 0)
+
+    # Brenner-Subrahmanyam starting point
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.clip(np.sqrt(2 * np.pi / t) * price / spot, lo, hi)
+    sigma = np.where(valid, sigma, 0.2)
+    low = np.full(sigma.shape, lo)
+    high = np.full(sigma.shape, hi)
+
+    active = valid.copy()
+    for _ in range(max_iter):
+        d1, _ = _d1_d2(spot, strike, t, sigma, r)
+        diff = bs_price(spot, strike, t, sigma, is_call, r) - price
+        active &= np.abs(diff) > tol
+        if not active.any():
+            break
+        high = np.where(active & (diff > 0), sigma, high)
+        low = np.where(active & (diff < 0), sigma, low)
+        vega = spot * norm_pdf(d1) * np.sqrt(t)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton = sigma - diff / vega
+        inside = (vega > 1e-8) & (newton > low) & (newton < high)
+        sigma = np.where(active, np.where(inside, newton, 0.5 * (low + high)), sigma)
+
+    return np.where(valid, sigma, np.nan)
+
+def greeks(spot, strike, t, sigma, is_call, r=0.0):
+    """
+    Delta, gamma, vega (per 1 vol point) and theta (per calendar day) arrays.
+    """
+    d1, d2 = _d1_d2(spot, strike, t, sigma, r)
+    pdf = norm_pdf(d1)
+    sqrt_t = np.sqrt(t)
+    discount = strike * np.exp(-r * t)
+    delta = np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1.0)
+    gamma = pdf / (spot * sigma * sqrt_t)
+    vega = spot * pdf * sqrt_t / 100.0
+    decay = -spot * pdf * sigma / (2 * sqrt_t)
+    theta = np.where(is_call, decay - r * discount * norm_cdf(d2), decay + r * discount * norm_cdf(-d2)) / 365.0
+    return {'delta': delta, 'gamma': gamma, 'vega': vega, 'theta': theta}
+
+class OptionChainAnalytics:
+    """
+    Option chains per index with implied volatility and Greeks.
+
+    update() takes the raw Upstox chains for every index and solves all of
+    their calls and puts in a single vectorized pass; select_by_delta() then
+    picks the liquid contract whose |delta| is closest to a target. A chain
+    not refreshed within `max_age` seconds (its fetches keep failing) is
+    ignored, so neither strikes nor expected prices come from stale quotes.
+    """
+    def __init__(self, risk_free_rate=0.065, min_oi=0, max_age=None):
+        self.risk_free_rate = risk_free_rate
+        self.min_oi = min_oi
+        self.max_age = max_age
+        self.chains = {}     # (idx_key, expiry 'YYYY-MM-DD') -> DataFrame, one row per contract
+        self.fetched_at = {} # (idx_key, expiry) -> time.monotonic() of its last update
+        self.logger = logging.getLogger("OptionChain")
+
+    @staticmethod
+    def _rows(idx_key, expiry, raw):
+        rows = []
+        for item in raw:
+            strike = item.get('strike_price')
+            spot = item.get('underlying_spot_price')
+            for option_type, field in (("CE", 'call_options'), ("PE", 'put_options')):
+                leg = item.get(field) or {}
+                market = leg.get('market_data') or {}
+                if not leg.get('instrument_key'):
+                    continue
+                rows.append((idx_key, expiry, leg['instrument_key'], option_type, strike, spot,
+                             market.get('ltp') or 0.0, market.get('oi') or 0.0, market.get('volume') or 0.0,
+                             market.get('bid_price') or 0.0, market.get('ask_price') or 0.0))
+        return rows
+
+    def update(self, raw_chains, spots=None, now=None):
+        """
+        raw_chains: {(idx_key, expiry): rows from UpstoxClient.get_option_chain}.
+        spots overrides the chain's underlying price per idx_key. Returns the
+        combined analytics frame.
+        """
+        started = time.perf_counter()
+        rows = []
+        for (idx_key, expiry), raw in raw_chains.items():
+            if raw:
+                rows.extend(self._rows(idx_key, expiry, raw))
+        if not rows:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(rows, columns=['index', 'expiry', 'instrument_key', 'option_type', 'strike', 'spot',
+                                         'ltp', 'oi', 'volume', 'bid', 'ask'])
+        if spots:
+            override = df['index'].map(spots)
+            df['spot'] = override.fillna(df['spot'])
+
+        # Time to expiry in years, from now until the close on expiry day
+        now = now or datetime.now(ZoneInfo(MARKET_TZ))
+        expiries = {e: datetime.combine(datetime.strptime(e, "%Y-%m-%d").date(), EXPIRY_TIME, now.tzinfo)
+                    for e in df['expiry'].unique()}
+        t = df['expiry'].map(lambda e: (expiries[e] - now).total_seconds() / YEAR_SECONDS).to_numpy()
+        t = np.maximum(t, MIN_EXPIRY_YEARS)
+
+        spot = df['spot'].to_numpy(dtype=float)
+        strike = df['strike'].to_numpy(dtype=float)
+        ltp = df['ltp'].to_numpy(dtype=float)
+        is_call = (df['option_type'] == "CE").to_numpy()
+
+        iv = implied_vol(ltp, spot, strike, t, is_call, r=self.risk_free_rate)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            g = greeks(spot, strike, t, iv, is_call, r=self.risk_free_rate)
+        df['t'] = t
+        df['iv'] = iv
+        for name, values in g.items():
+            df[name] = values
+
+        chains = {key: group.reset_index(drop=True) for key, group in df.groupby(['index', 'expiry'], sort=False)}
+        self.chains.update(chains)
+        fetched_at = time.monotonic()
+        self.fetched_at.update((key, fetched_at) for key in chains)
+        self.logger.info(f"Option analytics: {len(df)} contracts across {len(chains)} chains "
+                         f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return df
+
+    def fresh(self, key):
+        """The chain for (idx_key, expiry) if it was updated within max_age, else None."""
+        chain = self.chains.get(key)
+        if chain is None or self.max_age is None:
+            return chain
+        if time.monotonic() - self.fetched_at.get(key, float('-inf')) > self.max_age:
+            return None
+        return chain
+
+    def ltp(self, instrument_key):
+        """Last traded price of a contract from the fresh chains, or None."""
+        for key in list(self.chains):
+            chain = self.fresh(key)
+            if chain is None:
+                continue
+            match = chain.loc[chain['instrument_key'] == instrument_key, 'ltp']
+            if not match.empty and match.iloc[0] > 0:
+                return float(match.iloc[0])
+        return None
+
+    def select_by_delta(self, idx_key, expiry, option_type, target_delta, min_oi=None):
+        """
+        The contract of `option_type` with |delta| closest to `target_delta`
+        among strikes that trade (ltp > 0, solved IV, open interest >= min_oi).
+        Returns a row dict or None (also when the chain is stale).
+        """
+        chain = self.fresh((idx_key, expiry))
+        if chain is None or chain.empty:
+            if (idx_key, expiry) in self.chains:
+                self.logger.warning(f"{idx_key} {expiry} chain older than {self.max_age}s; not selecting by delta")
+            return None
+        min_oi = self.min_oi if min_oi is None else min_oi
+        legs = chain[(chain['option_type'] == option_type) & (chain['ltp'] > 0)
+                     & chain['iv'].notna() & (chain['oi'] >= min_oi)]
+        if legs.empty:
+            return None
+        best = (legs['delta'].abs() - abs(target_delta)).abs().idxmin()
+        return legs.loc[best].to_dict()
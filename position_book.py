@@ -0,0 +1,133 @@
+import numpy as np
+
+# side: +1 profits when the underlying rises (BUY_CALL / BUY), -1 when it falls (BUY_PUT)
+SIDE_SIGN = {"BUY_CALL": 1, "BUY": 1, "BUY_PUT": -1}
+
+class PositionBook:
+    """
+    Open positions held column-wise (entry, SL, TP, side, quantity, underlying)
+    in preallocated NumPy arrays, indexed by position id and by symbol.
+
+    Opening and closing are O(1): slots are recycled through a free list and
+    closes by symbol take the oldest id from an insertion-ordered dict. Stop
+    and target checks run over every open slot in one vectorized pass.
+    """
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        self.entry = np.empty(0)
+        self.sl = np.empty(0)
+        self.tp = np.empty(0)
+        self.side = np.empty(0, dtype=np.int8)
+        self.quantity = np.empty(0, dtype=np.int64)
+        self.underlying = np.empty(0, dtype=np.int32)
+        self.active = np.empty(0, dtype=bool)
+        self.meta = []          # slot -> {'id', 'symbol', 'side', 'underlying', 'time'}
+        self.free = []          # Recycled slots
+        self.by_id = {}         # position id -> slot
+        self.by_symbol = {}     # symbol -> {position id: None}, oldest first
+        self.codes = {}         # underlying name -> code
+        self.next_id = 1
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        old = self.capacity
+        for name in ('entry', 'sl', 'tp', 'side', 'quantity', 'underlying', 'active'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:old] = column
+            setattr(self, name, grown)
+        self.meta.extend([None] * (capacity - old))
+        self.free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def open(self, symbol, side, quantity, entry, sl=None, tp=None, underlying=None, time=None, pid=None):
+        """Adds a position and returns its id (`pid` re-uses a journaled id on restore)."""
+        if not self.free:
+            self._grow(self.capacity * 2)
+        slot = self.free.pop()
+        underlying = underlying or symbol
+        code = self.codes.setdefault(underlying, len(self.codes))
+
+        if pid is None:
+            pid = self.next_id
+            self.next_id += 1
+        self.entry[slot] = entry
+        self.sl[slot] = np.nan if sl is None else sl
+        self.tp[slot] = np.nan if tp is None else tp
+        self.side[slot] = SIDE_SIGN.get(side, 1)
+        self.quantity[slot] = quantity
+        self.underlying[slot] = code
+        self.active[slot] = True
+        self.meta[slot] = {'id': pid, 'symbol': symbol, 'side': side, 'underlying': underlying, 'time': time}
+        self.by_id[pid] = slot
+        self.by_symbol.setdefault(symbol, {})[pid] = None
+        return pid
+
+    def close(self, pid):
+        """Removes a position by id and returns it as a dict (None if unknown)."""
+        slot = self.by_id.pop(pid, None)
+        if slot is None:
+            return None
+        position = self._record(slot)
+        ids = self.by_symbol[position['symbol']]
+        del ids[pid]
+        if not ids:
+            del self.by_symbol[position['symbol']]
+        self.active[slot] = False
+        self.meta[slot] = None
+        self.free.append(slot)
+        return position
+
+    def close_symbol(self, symbol):
+        """Closes the oldest open position in `symbol` (FIFO)."""
+        ids = self.by_symbol.get(symbol)
+        if not ids:
+            return None
+        return self.close(next(iter(ids)))
+
+    def check(self, prices):
+        """
+        Stop/target scan for every open position against {underlying: price}.
+        Returns [(position id, 'SL' | 'TP', price)]; SL wins if both are crossed.
+        """
+        if not self.by_id:
+            return []
+        marks = np.full(len(self.codes), np.nan)
+        for name, price in prices.items():
+            code = self.codes.get(name)
+            if code is not None and price is not None:
+                marks[code] = price
+        mark = marks[self.underlying]
+
+        # Distances in the position's favour; NaN levels and unpriced slots never trigger
+        with np.errstate(invalid='ignore'):
+            sl_hit = self.active & ((mark - self.sl) * self.side <= 0)
+            tp_hit = self.active & ((mark - self.tp) * self.side >= 0) & ~sl_hit
+        hits = np.nonzero(sl_hit | tp_hit)[0]
+        return [(self.meta[s]['id'], 'SL' if sl_hit[s] else 'TP', float(mark[s])) for s in hits]
+
+    def get(self, pid):
+        slot = self.by_id.get(pid)
+        return None if slot is None else self._record(slot)
+
+    def positions(self):
+        """Open positions as dicts, oldest first."""
+        return [self._record(slot) for slot in self.by_id.values()] # Ids are issued in order
+
+    def _record(self, slot):
+        meta = self.meta[slot]
+        sl, tp = self.sl[slot], self.tp[slot]
+        return {
+            'id': meta['id'],
+            'symbol': meta['symbol'],
+            'quantity': int(self.quantity[slot]),
+            'entry_price': float(self.entry[slot]),
+            'sl': None if np.isnan(sl) else float(sl),
+            'tp': None if np.isnan(tp) else float(tp),
+            'side': meta['side'],
+            'underlying': meta['underlying'],
+            'time': meta['time'],
+        }
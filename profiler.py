@@ -0,0 +1,147 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+_NULL = nullcontext()
+
+class CycleProfiler:
+    """
+    Opt-in span recorder for trading cycles, exported as Chrome trace-event
+    JSON (load it in chrome://tracing or ui.perfetto.dev).
+
+    cycle() opens a root span and collects every span() recorded until it
+    ends, from any thread, as one trace; pool threads show up as their own
+    rows, so concurrent fetches and per-index analysis line up against the
+    cycle. The last `keep` cycles stay in memory, and cycles slower than
+    `slow_ms` are also written to `out_dir`. When disabled, span() returns a
+    shared no-op context manager.
+    """
+    def __init__(self, enabled=False, out_dir="data/profiles", keep=20, slow_ms=0, cprofile=False):
+        self.enabled = enabled
+        self.out_dir = out_dir
+        self.slow_ms = slow_ms
+        self.cprofile = cprofile
+        self.cycles = deque(maxlen=keep) # Completed traces, oldest first
+        self.events = None               # Events of the cycle in progress
+        self.count = 0
+        self.pid = os.getpid()
+        self.cprofile_lock = threading.Lock()
+        self.logger = logging.getLogger("Profiler")
+
+    @staticmethod
+    def _now_us():
+        return time.perf_counter_ns() / 1000.0
+
+    def _emit(self, name, start, args):
+        events = self.events
+        if events is None:
+            return
+        thread = threading.current_thread()
+        event = {'name': name, 'ph': 'X', 'ts': start, 'dur': self._now_us() - start,
+                 'pid': self.pid, 'tid': thread.ident, 'args': args}
+        events.append((thread.ident, thread.name, event)) # list.append is atomic; no lock on the hot path
+
+    @contextmanager
+    def _span(self, name, args):
+        start = self._now_us()
+        try:
+            yield args
+        finally:
+            self._emit(name, start, args)
+
+    def span(self, name, **args):
+        """Times a block as a span of the current cycle; `args` show up in the trace viewer."""
+        if not self.enabled or self.events is None:
+            return _NULL
+        return self._span(name, args)
+
+    def wrap(self, name, fn, **args):
+        """`fn` wrapped in a span, for work submitted to a thread pool."""
+        if not self.enabled:
+            return fn
+        def run(*a, **kw):
+            with self.span(name, **args):
+                return fn(*a, **kw)
+        return run
+
+    @contextmanager
+    def hotspot(self, name, top=15, **args):
+        """
+        A span that also runs cProfile over the block (when cprofile is on)
+        and attaches the `top` functions by cumulative time to the span.
+        """
+        if not self.enabled or self.events is None:
+            yield
+            return
+        with self.span(name, **args) as span_args:
+            if not self.cprofile:
+                yield
+                return
+            # One profiler at a time: newer Pythons allow a single active profiling tool
+            if not self.cprofile_lock.acquire(blocking=False):
+                yield
+                return
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                self.cprofile_lock.release()
+                out = io.StringIO()
+                pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(top)
+                span_args['cprofile'] = [line for line in out.getvalue().splitlines() if line.strip()]
+
+    @contextmanager
+    def cycle(self, name="trading_job"):
+        """Root span of one cycle; the finished trace is kept and slow ones are saved."""
+        if not self.enabled:
+            yield
+            return
+        self.count += 1
+        number = self.count
+        events = self.events = []
+        start = self._now_us()
+        try:
+            with self._span(name, {'cycle': number}):
+                yield
+        finally:
+            self.events = None
+            duration_ms = (self._now_us() - start) / 1000.0
+            trace = self._trace(events)
+            self.cycles.append(trace)
+            if duration_ms >= self.slow_ms:
+                self._save(trace, number, duration_ms)
+
+    def _trace(self, events):
+        names = {}
+        trace = []
+        for tid, thread_name, event in events:
+            names[tid] = thread_name
+            trace.append(event)
+        for tid, thread_name in names.items():
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                          'args': {'name': thread_name}})
+        return trace
+
+    def _save(self, trace, number, duration_ms):
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            path = os.path.join(self.out_dir, f"cycle-{int(time.time())}-{number}.json")
+            with open(path, "w") as f:
+                json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+            self.logger.info(f"Cycle {number} took {duration_ms:.1f}ms, trace saved to {path}")
+        except OSError as e:
+            self.logger.error(f"Could not save cycle trace: {e}")
+
+    def export(self):
+        """The kept cycles as one Chrome trace-event document."""
+        events = [event for trace in list(self.cycles) for event in trace]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -0,0 +1,206 @@
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from metrics import SCHEDULER_WAIT, COALESCED, THROTTLED
+
+# Priorities, most urgent first
+ORDER = 0   # Order placement, order status, square-off
+SIGNAL = 1  # Candles and LTPs the strategy trades on
+UI = 2      # Dashboard marks and position lists
+BULK = 3    # Universe scans and other background fetches
+PRIORITY_NAMES = {ORDER: "order", SIGNAL: "signal", UI: "ui", BULK: "bulk"}
+
+# Share of every account-wide bucket a priority must leave for the ones above it
+DEFAULT_RESERVE = {ORDER: 0.0, SIGNAL: 0.1, UI: 0.3, BULK: 0.5}
+
+# Endpoint (as passed to HttpTransport) -> rate-limit class
+ENDPOINT_CLASSES = {
+    'order/place': 'order',
+    'order/details': 'order',
+    'order/retrieve-all': 'order',
+    'portfolio/get-positions': 'portfolio',
+    'historical-candle': 'candles',
+    'market-quote/ltp': 'quotes',
+    'option/chain': 'quotes',
+}
+
+# (requests, per seconds) per class, on top of the account-wide limits
+DEFAULT_CLASS_LIMITS = {
+    'order': ((8, 1.0),), # Upstox allows 10/s; the headroom absorbs clock drift between the two buckets
+    'portfolio': ((5, 1.0),),
+    'candles': ((25, 1.0),),
+    'quotes': ((25, 1.0),),
+    'default': ((10, 1.0),),
+}
+DEFAULT_GLOBAL_LIMITS = ((50, 1.0), (500, 60.0))
+
+class TokenBucket:
+    def __init__(self, count, period):
+        self.capacity = float(count)
+        self.rate = count / period
+        self.tokens = float(count)
+        self.stamp = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait(self, floor=0.0):
+        """Seconds until a token can be taken without going below `floor`."""
+        return max(0.0, (floor + 1.0 - self.tokens) / self.rate)
+
+class _Ticket:
+    __slots__ = ('priority', 'seq', 'cls', 'future')
+
+    def __init__(self, priority, seq, cls):
+        self.priority = priority
+        self.seq = seq
+        self.cls = cls
+        self.future = Future()
+
+class RequestScheduler:
+    """
+    Single gate in front of every Upstox API call.
+
+    Each call waits for a token from its endpoint class's bucket and from
+    every account-wide bucket (per second and per minute). Waiting calls are
+    admitted in priority order, and lower priorities may not drain the last
+    `reserve` share of the account-wide buckets, so a burst of dashboard
+    refreshes cannot spend the quota an order needs. Admitted calls run on
+    the caller's own thread; nothing queues behind a slow candle download.
+    GETs with the same key share one in-flight request (a higher-priority
+    caller lifts the shared request's priority).
+
+    Priorities only order calls that have reached the scheduler. A call
+    waiting here blocks its thread, so bulk work must not be submitted to a
+    thread pool that urgent work shares: the pool's FIFO queue would decide
+    who goes first (the scanner has its own pool for this reason).
+    """
+    def __init__(self, class_limits=None, global_limits=DEFAULT_GLOBAL_LIMITS, reserve=None, classes=None):
+        limits = dict(DEFAULT_CLASS_LIMITS)
+        if class_limits:
+            limits.update(class_limits)
+        self.classes = dict(ENDPOINT_CLASSES)
+        if classes:
+            self.classes.update(classes)
+        self.buckets = {cls: [TokenBucket(*limit) for limit in spec] for cls, spec in limits.items()}
+        self.global_buckets = [TokenBucket(*limit) for limit in global_limits]
+        self.reserve = dict(DEFAULT_RESERVE)
+        if reserve:
+            self.reserve.update(reserve)
+        self.cond = threading.Condition()
+        self.waiting = []  # Tickets not yet admitted
+        self.inflight = {} # key -> ticket of the call everyone with that key shares
+        self.seq = 0
+        self.logger = logging.getLogger("RequestScheduler")
+
+    def call(self, endpoint, fn, *args, priority=SIGNAL, key=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) once its tokens are granted and returns its
+        result. Calls with the same `key` while one is queued or running get
+        that call's result (or exception) instead of a request of their own.
+        """
+        cls = self.classes.get(endpoint, 'default')
+        with self.cond:
+            ticket = self.inflight.get(key) if key is not None else None
+            if ticket is not None:
+                if priority < ticket.priority:
+                    ticket.priority = priority
+                    self.cond.notify_all()
+                shared = True
+            else:
+                self.seq += 1
+                ticket = _Ticket(priority, self.seq, cls)
+                if key is not None:
+                    self.inflight[key] = ticket
+                shared = False
+        if shared:
+            COALESCED.inc(endpoint=endpoint)
+            return ticket.future.result()
+
+        try:
+            self._admit(ticket)
+            result = fn(*args, **kwargs)
+            if getattr(result, 'status_code', None) == 429:
+                self.throttle(endpoint)
+            ticket.future.set_result(result)
+            return result
+        except BaseException as e:
+            ticket.future.set_exception(e)
+            raise
+        finally:
+            if key is not None:
+                with self.cond:
+                    self.inflight.pop(key, None)
+
+    def _admit(self, ticket):
+        """Blocks until `ticket` is the most urgent waiting call its buckets can serve, then takes the tokens."""
+        started = time.perf_counter()
+        with self.cond:
+            self.waiting.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    for bucket in self.global_buckets:
+                        bucket.refill(now)
+                    for buckets in self.buckets.values():
+                        for bucket in buckets:
+                            bucket.refill(now)
+
+                    # 1. First waiting call (by priority, then arrival) that can go now
+                    ready = None
+                    for other in sorted(self.waiting, key=lambda t: (t.priority, t.seq)):
+                        if self._delay(other) == 0.0:
+                            ready = other
+                            break
+                    if ready is ticket:
+                        break
+                    # 2. Someone else goes first, or nobody can: sleep until our tokens could be there
+                    if ready is not None:
+                        self.cond.notify_all()
+                    self.cond.wait(min(max(self._delay(ticket), 0.001), 0.05))
+
+                # 3. Take the tokens
+                for bucket in self.buckets[ticket.cls]:
+                    bucket.tokens -= 1.0
+                for bucket in self.global_buckets:
+                    bucket.tokens -= 1.0
+            finally:
+                self.waiting.remove(ticket)
+                self.cond.notify_all()
+        SCHEDULER_WAIT.observe(time.perf_counter() - started, priority=PRIORITY_NAMES.get(ticket.priority, ticket.priority))
+
+    def _delay(self, ticket):
+        reserve = self.reserve.get(ticket.priority, 0.0)
+        waits = [bucket.wait() for bucket in self.buckets[ticket.cls]]
+        waits += [bucket.wait(bucket.capacity * reserve) for bucket in self.global_buckets]
+        return max(waits)
+
+    def throttle(self, endpoint):
+        """
+        Upstox answered 429: empty the endpoint's class buckets and the
+        per-second account-wide buckets so everyone backs off for a refill.
+        Longer windows keep their tokens; draining a per-minute bucket would
+        stall every call for most of a minute.
+        """
+        THROTTLED.inc(endpoint=endpoint)
+        self.logger.warning(f"Rate limited on {endpoint}; pausing non-urgent calls")
+        with self.cond:
+            short = [b for b in self.global_buckets if b.capacity / b.rate <= 1.0]
+            for bucket in short + self.buckets[self.classes.get(endpoint, 'default')]:
+                bucket.tokens = min(bucket.tokens, 0.0)
+
+    def stats(self):
+        """Tokens left per bucket and waiting calls per priority."""
+        with self.cond:
+            waiting = {}
+            for ticket in self.waiting:
+                name = PRIORITY_NAMES.get(ticket.priority, ticket.priority)
+                waiting[name] = waiting.get(name, 0) + 1
+            return {
+                'global': [round(b.tokens, 2) for b in self.global_buckets],
+                'classes': {cls: [round(b.tokens, 2) for b in buckets] for cls, buckets in self.buckets.items()},
+                'waiting': waiting,
+                'inflight': len(self.inflight),
+            }
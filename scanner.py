@@ -0,0 +1,202 @@
+import time
+import logging
+import numpy as np
+import pandas as pd
+from bar_aggregator import TIMEFRAME_SECONDS
+
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+class PanelScanner:
+    """
+    Pullback scan over a whole universe at once.
+
+    Candles for every instrument are resampled together and pivoted into a
+    (time x instrument) panel per OHLCV field. EMA, VWAP, ATR and slope are
+    computed down the time axis for all columns in single pandas/NumPy
+    passes, with the same conventions as calculate_indicators, and the
+    check_signal rules are evaluated on the last bar of every column as
+    boolean masks. The cost depends on the number of bars, barely on the
+    number of instruments.
+    """
+    def __init__(self, config, timeframe=None, atr_period=14):
+        self.config = config
+        self.timeframe = timeframe or config.TIMEFRAME
+        self.atr_period = atr_period
+        self.panel = {}        # 'times', 'symbols' and field -> (time x instrument) array
+        self.indicators = {}   # name -> (time x instrument) array
+        self.results = []      # Signals from the last scan
+        self.scanned_at = None
+        self.logger = logging.getLogger("PanelScanner")
+
+    def build_panel(self, frames):
+        """
+        {symbol: candle frame} -> {'times', 'symbols', field: (time x symbol) array}
+        at the strategy timeframe. Bars missing for a symbol carry its last close
+        with no volume; bars before its first candle stay NaN.
+        """
+        frames = {s: df for s, df in frames.items() if df is not None and not df.empty}
+        if not frames:
+            return {}
+        symbols = list(frames)
+        stamps = [pd.DatetimeIndex(df['timestamp']) for df in frames.values()]
+        tz = stamps[0].tz
+        bucket = TIMEFRAME_SECONDS[self.timeframe] * 10**9
+        first = stamps[0].asi8
+        if all(len(s) == len(first) and np.array_equal(s.asi8, first) for s in stamps[1:]):
+            panel = self._aligned_panel(frames, first, bucket)
+        else:
+            panel = self._ragged_panel(frames, stamps, bucket)
+        panel['times'] = pd.DatetimeIndex(panel['times']).tz_localize('UTC').tz_convert(tz) if tz \
+            else pd.DatetimeIndex(panel['times'])
+        panel['symbols'] = symbols
+        return panel
+
+    @staticmethod
+    def _aligned_panel(frames, ts, bucket):
+        """Every frame has the same bar times (the usual case): columns stack directly."""
+        ts = ts - ts % bucket
+        starts = np.r_[0, np.nonzero(np.diff(ts))[0] + 1]
+        ends = np.r_[starts[1:], len(ts)] - 1
+        panel = {'times': ts[starts]}
+        for field in PANEL_FIELDS:
+            values = np.column_stack([df[field].to_numpy(dtype=float) for df in frames.values()])
+            if len(starts) == len(ts):
+                panel[field] = values
+            elif field in ('open', 'close'):
+                panel[field] = values[starts if field == 'open' else ends]
+            else:
+                reduce = np.maximum if field == 'high' else np.minimum if field == 'low' else np.add
+                panel[field] = reduce.reduceat(values, starts, axis=0)
+        return panel
+
+    @staticmethod
+    def _ragged_panel(frames, stamps, bucket):
+        """Frames with different bar times: scatter every (symbol, bucket) group into a NaN panel."""
+        ts = np.concatenate([s.asi8 for s in stamps])
+        code = np.repeat(np.arange(len(frames)), [len(s) for s in stamps])
+        values = np.column_stack([np.concatenate([df[f].to_numpy(dtype=float) for df in frames.values()])
+                                  for f in PANEL_FIELDS])
+
+        # Floor to the bucket, then one group per (symbol, bucket) in time order
+        ts = ts - ts % bucket
+        times = np.sort(pd.unique(ts)) # Hash, then sort only the distinct bar times
+        row = np.searchsorted(times, ts)
+        key = code * len(times) + row
+        order = np.argsort(key, kind='stable') # Rows keep their original order inside a bucket
+        key = key[order]
+        values = values[order]
+        starts = np.r_[0, np.nonzero(np.diff(key))[0] + 1]
+        ends = np.r_[starts[1:], len(key)] - 1
+        col, row = np.divmod(key[starts], len(times))
+
+        panel = {'times': times}
+        for i, field in enumerate(PANEL_FIELDS):
+            if field == 'open':
+                bars = values[starts, i]
+            elif field == 'close':
+                bars = values[ends, i]
+            else:
+                bars = (np.maximum if field == 'high' else np.minimum if field == 'low' else np.add).reduceat(
+                    values[:, i], starts)
+            out = np.full((len(times), len(frames)), np.nan)
+            out[row, col] = bars
+            panel[field] = out
+
+        # Gaps: carry the close forward with no volume (leading NaNs stay)
+        close = pd.DataFrame(panel['close']).ffill().to_numpy(copy=True)
+        missing = np.isnan(panel['close']) & ~np.isnan(close)
+        panel['volume'][missing] = 0.0
+        for field in ('open', 'high', 'low'):
+            panel[field] = np.where(np.isnan(panel[field]), close, panel[field])
+        panel['close'] = close
+        return panel
+
+    def compute(self, panel):
+        """Indicator arrays (ema_20, vwap, atr, ema_slope, bars) for every column at once."""
+        close, high, low, volume = panel['close'], panel['high'], panel['low'], panel['volume']
+        period = self.config.EMA_PERIOD
+
+        # 1. EMA (ewm span=period, adjust=False, min_periods=period) and its per-bar slope
+        ema = pd.DataFrame(close).ewm(span=period, min_periods=period, adjust=False).mean().to_numpy()
+        slope = np.full_like(ema, np.nan)
+        slope[1:] = ema[1:] - ema[:-1]
+
+        # 2. VWAP (cumulative over the fetched history)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = np.nancumsum((high + low + close) / 3 * volume, axis=0) / np.nancumsum(volume, axis=0)
+
+        # 3. ATR: Wilder smoothing seeded with the mean of each column's first window (ta semantics)
+        prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        bars = np.cumsum(~np.isnan(tr), axis=0)
+        seed = np.nansum(np.where(bars <= self.atr_period, tr, 0.0), axis=0) / self.atr_period
+        seeded = np.where(bars > self.atr_period, tr, np.nan)
+        seeded = np.where(bars == self.atr_period, seed, seeded)
+        atr = pd.DataFrame(seeded).ewm(alpha=1.0 / self.atr_period, adjust=False).mean().to_numpy(copy=True)
+        atr[bars < self.atr_period] = 0.0
+
+        return {'ema_20': ema, 'vwap': vwap, 'atr': atr, 'ema_slope': slope, 'bars': bars}
+
+    def signals(self, panel, ind):
+        """
+        check_signal on the last bar of every column. Returns a list of
+        {'symbol', 'side', 'entry_price', 'stop_loss', 'take_profit'}.
+        """
+        last = {f: panel[f][-1] for f in PANEL_FIELDS}
+        ema, vwap, slope = (ind[k][-1] for k in ('ema_20', 'vwap', 'ema_slope'))
+        atr = np.where(np.isnan(ind['atr'][-1]), 10.0, ind['atr'][-1])
+        close, open_, high, low = last['close'], last['open'], last['high'], last['low']
+
+        # 1. Trend Filter
+        threshold = close * self.config.SLOPE_THRESHOLD_PCT
+        with np.errstate(invalid='ignore'):
+            is_uptrend = (close > vwap) & (slope > threshold)
+            is_downtrend = (close < vwap) & (slope < -threshold)
+
+            # 2. Bounce/Rejection Logic
+            touched_ema = (low <= ema) & (ema <= high)
+
+        warm = ind['bars'][-1] >= 20 # check_signal needs at least 20 candles
+        long_ = warm & touched_ema & is_uptrend & (close > open_)
+        short = warm & touched_ema & ~long_ & is_downtrend & (close < open_)
+
+        buffer = atr * self.config.SL_ATR_BUFFER
+        long_sl = np.minimum(low, ema) - buffer
+        short_sl = np.maximum(high, ema) + buffer
+        long_risk = np.where(close - long_sl <= 0, atr, close - long_sl)
+        short_risk = np.where(short_sl - close <= 0, atr, short_sl - close)
+
+        symbols = panel['symbols']
+        results = []
+        for i in np.nonzero(long_ | short)[0]:
+            is_long = bool(long_[i])
+            results.append({
+                'symbol': symbols[i],
+                'side': 'BUY_CALL' if is_long else 'BUY_PUT',
+                'entry_price': float(close[i]),
+                'stop_loss': float(long_sl[i] if is_long else short_sl[i]),
+                'take_profit': float(close[i] + long_risk[i] * self.config.REWARD_RATIO if is_long
+                                     else close[i] - short_risk[i] * self.config.REWARD_RATIO),
+            })
+        return results
+
+    def scan(self, frames, prices=None):
+        """
+        Builds the panel from {symbol: 1-minute candles}, optionally overrides
+        the last close with live prices ({symbol: ltp}), and returns the signals.
+        """
+        started = time.perf_counter()
+        panel = self.build_panel(frames)
+        if not panel:
+            return []
+        if prices:
+            live = np.array([prices.get(symbol, np.nan) for symbol in panel['symbols']], dtype=float)
+            panel['close'][-1] = np.where(np.isnan(live), panel['close'][-1], live)
+        ind = self.compute(panel)
+        results = self.signals(panel, ind)
+        self.panel, self.indicators, self.results = panel, ind, results
+        self.scanned_at = panel['times'][-1]
+        shape = panel['close'].shape
+        self.logger.info(f"Scanned {shape[1]} instruments x {shape[0]} bars in "
+                         f"{(time.perf_counter() - started) * 1000:.1f}ms: {len(results)} signals")
+        return results
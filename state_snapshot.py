@@ -0,0 +1,65 @@
+import json
+import time
+import threading
+from types import MappingProxyType
+from collections import namedtuple
+
+# One published view of the bot. Never modified after publication.
+Snapshot = namedtuple('Snapshot', ['version', 'published_at', 'state', 'json'])
+
+def freeze(value):
+    """Recursively turns dicts into read-only mappings and lists into tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def to_json(value):
+    """JSON for frozen state (read-only mappings serialize as objects)."""
+    return json.dumps(value, default=dict)
+
+class SnapshotPublisher:
+    """
+    Single reference to the latest immutable Snapshot.
+
+    Writers build a complete new state and swap the reference in one assignment;
+    readers just take `current` without locking and can never observe a half
+    written cycle. The version only moves when the content changes, and the JSON
+    body is rendered once per version so API reads are constant time.
+    """
+    def __init__(self, state=None):
+        self.write_lock = threading.Lock()
+        self.changed = threading.Condition()
+        frozen = freeze(state or {})
+        self.current = Snapshot(0, time.time(), frozen, to_json(dict(frozen, version=0)))
+
+    def read(self):
+        return self.current
+
+    def publish(self, state):
+        """Publishes `state` (a plain dict) and returns the resulting snapshot."""
+        frozen = freeze(state)
+        with self.write_lock:
+            previous = self.current
+            if frozen == previous.state:
+                return previous
+            version = previous.version + 1
+            snapshot = Snapshot(version, time.time(), frozen, to_json(dict(frozen, version=version)))
+            self.current = snapshot
+        with self.changed:
+            self.changed.notify_all()
+        return snapshot
+
+    def update(self, **fields):
+        """Republishes the current state with some top-level fields replaced (no rebuild)."""
+        with self.write_lock:
+            state = dict(self.current.state)
+        state.update(fields)
+        return self.publish(state)
+
+    def wait(self, version, timeout=None):
+        """Blocks until a snapshot newer than `version` is published or `timeout` passes."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.current.version != version, timeout=timeout)
+        return self.current
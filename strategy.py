@@ -3,10 +3,48 @@ import numpy as np
 import math
 from ta.trend import EMAIndicator
 from ta.volatility import AverageTrueRange
+from indicators import IncrementalIndicators
+from bar_aggregator import BarAggregator, TIMEFRAME_SECONDS
 
 class InstitutionalPullbackStrategy:
     def __init__(self, config):
         self.config = config
+        self.engines = {} # Per-instrument incremental indicator state
+        self.timeframe = config.TIMEFRAME
+        # 1-minute candles are resampled to TIMEFRAME in bounded ring buffers
+        self.aggregator = BarAggregator((self.timeframe,), capacity=config.BAR_BUFFER_SIZE)
+
+    def update_indicators(self, key, df):
+        """
+        Incremental counterpart of calculate_indicators.
+        Resamples 1-minute candles to config.TIMEFRAME, folds only the bars that
+        closed since the last call into the running accumulators for `key` and
+        returns a short tail frame for check_signal.
+        """
+        engine = self._engine(key)
+        if df is None or df.empty or TIMEFRAME_SECONDS[self.timeframe] == 60:
+            return engine.sync(df)
+
+        closed, reset = self.aggregator.update_from_frame(key, df)
+        last = None if reset or engine.last_timestamp is None else closed + 2
+        bars = self.aggregator.frame(key, self.timeframe, last=last, preview=df.iloc[-1])
+        return engine.sync(bars)
+
+    def update_bar(self, key, candle):
+        """
+        Streaming path: commits one closed candle for `key` and returns the tail frame.
+        """
+        engine = self._engine(key)
+        engine.update(candle)
+        return engine.frame()
+
+    def _engine(self, key):
+        engine = self.engines.get(key)
+        if engine is None:
+            engine = IncrementalIndicators(ema_period=self.config.EMA_PERIOD,
+                                           history=max(self.config.EMA_PERIOD, 20))
+            self.engines[key] = engine
+        return engine
 
     def calculate_indicators(self, df):
         """
@@ -52,8 +90,8 @@ class InstitutionalPullbackStrategy:
         
         # 1. Trend Filter
         # Threshold: We look for a slope that isn't flat. 
-        # Using 0.01% of price as a minimum move per bar.
-        threshold = price * 0.0001 
+        # Using 0.01% of price (SLOPE_THRESHOLD_PCT) as a minimum move per bar.
+        threshold = price * self.config.SLOPE_THRESHOLD_PCT
         is_uptrend = price > vwap_val and slope > threshold
         is_downtrend = price < vwap_val and slope < -threshold
         
@@ -67,10 +105,10 @@ class InstitutionalPullbackStrategy:
             if is_uptrend and current['close'] > current['open']:
                 entry = current['close']
                 # SL: Below candle low or EMA (whichever lower) - small buffer
-                sl = min(current['low'], ema_val) - (atr * 0.1)
+                sl = min(current['low'], ema_val) - (atr * self.config.SL_ATR_BUFFER)
                 risk = entry - sl
                 if risk <= 0: risk = atr # Fallback
-                tp = entry + (risk * 2) # 1:2 Risk Reward
+                tp = entry + (risk * self.config.REWARD_RATIO) # 1:2 Risk Reward by default
                 
                 return {
                     'side': 'BUY_CALL',
@@ -83,10 +121,10 @@ class InstitutionalPullbackStrategy:
             elif is_downtrend and current['close'] < current['open']:
                 entry = current['close']
                 # SL: Above candle high or EMA (whichever higher) + small buffer
-                sl = max(current['high'], ema_val) + (atr * 0.1)
+                sl = max(current['high'], ema_val) + (atr * self.config.SL_ATR_BUFFER)
                 risk = sl - entry
                 if risk <= 0: risk = atr # Fallback
-                tp = entry - (risk * 2) # 1:2 Risk Reward
+                tp = entry - (risk * self.config.REWARD_RATIO) # 1:2 Risk Reward by default
                 
                 return {
                     'side': 'BUY_PUT',
@@ -0,0 +1,18 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from market_generator import MarketGenerator
+
+@pytest.fixture
+def config():
+    return Config()
+
+@pytest.fixture
+def candles():
+    """Two sessions of seeded 1-minute BANKNIFTY candles, with stressed regimes for plenty of signals."""
+    generator = MarketGenerator({"BANKNIFTY": 45000.0}, seed=7, regimes=((1.0, 120), (2.5, 60)), start="2024-06-03")
+    return generator.generate(2 * generator.bars_per_day)["BANKNIFTY"]
@@ -0,0 +1,27 @@
+import numpy as np
+from backtest import VectorizedBacktester, reference_signals
+from strategy import InstitutionalPullbackStrategy
+
+def test_signals_match_check_signal(config, candles):
+    tester = VectorizedBacktester(config)
+    arrays = [candles[c].to_numpy(dtype=np.float64) for c in ('open', 'high', 'low', 'close', 'volume')]
+    open_, high, low, close, volume = arrays
+    side, sl, tp = tester.signals(open_, high, low, close, tester.indicators(high, low, close, volume))
+
+    expected = reference_signals(InstitutionalPullbackStrategy(config), candles)
+    assert np.count_nonzero(expected) > 0
+    np.testing.assert_array_equal(side, expected)
+
+    # Stops and targets match the ones check_signal returns on the bars that signal
+    strategy = InstitutionalPullbackStrategy(config)
+    full = strategy.calculate_indicators(candles.copy())
+    for i in np.nonzero(expected)[0]:
+        signal = strategy.check_signal(full.iloc[:i + 1])
+        assert np.isclose(sl[i], signal['stop_loss'])
+        assert np.isclose(tp[i], signal['take_profit'])
+
+def test_run_trades_only_on_reference_signals(config, candles):
+    result = VectorizedBacktester(config).run(candles)
+    expected = reference_signals(InstitutionalPullbackStrategy(config), candles)
+    entries = candles.index[candles['timestamp'].isin(result['trades']['entry_time'])]
+    np.testing.assert_array_equal(entries, np.nonzero(expected)[0])
@@ -0,0 +1,31 @@
+import numpy as np
+from indicators import IncrementalIndicators, INDICATOR_COLUMNS
+from strategy import InstitutionalPullbackStrategy
+
+def test_recompute_matches_calculate_indicators(config, candles):
+    strategy = InstitutionalPullbackStrategy(config)
+    expected = strategy.calculate_indicators(candles.copy())
+    result = IncrementalIndicators(ema_period=config.EMA_PERIOD).recompute(candles)
+    for column in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(result[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                   rtol=1e-9, atol=1e-6, equal_nan=True, err_msg=column)
+
+def test_bar_by_bar_signals_match_reference(config, candles):
+    # Feed the growing frame one bar at a time, as trading_job does, and compare
+    # the incremental signal with check_signal on the full recomputation
+    strategy = InstitutionalPullbackStrategy(config)
+    full = strategy.calculate_indicators(candles.copy())
+    engine = IncrementalIndicators(ema_period=config.EMA_PERIOD, history=max(config.EMA_PERIOD, 20))
+    mismatches, signals = [], 0
+    for i in range(20, len(candles)):
+        tail = engine.sync(candles.iloc[:i + 1])
+        expected = strategy.check_signal(full.iloc[:i + 1])
+        actual = strategy.check_signal(tail)
+        signals += expected is not None
+        if (expected is None) != (actual is None) or (expected and expected['side'] != actual['side']):
+            mismatches.append(i)
+        elif expected:
+            assert np.isclose(actual['stop_loss'], expected['stop_loss'])
+            assert np.isclose(actual['take_profit'], expected['take_profit'])
+    assert signals > 0
+    assert mismatches == []
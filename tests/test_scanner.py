@@ -0,0 +1,34 @@
+import numpy as np
+from market_generator import MarketGenerator
+from scanner import PanelScanner
+from strategy import InstitutionalPullbackStrategy
+
+SYMBOLS = {f"SYM{i}": 1000.0 + 250 * i for i in range(6)}
+
+def _reference(strategy, df):
+    if len(df) < 20: # check_signal's minimum (ta's ATR cannot even run on fewer than 14 bars)
+        return None
+    return strategy.check_signal(strategy.calculate_indicators(df.copy()))
+
+def test_scan_matches_check_signal_per_symbol(config):
+    generator = MarketGenerator(SYMBOLS, seed=11, correlation=0.3, regimes=((1.0, 120), (2.5, 60)), start="2024-06-03")
+    frames = generator.generate(generator.bars_per_day)
+    frames["SYM5"] = frames["SYM5"].iloc[40:].reset_index(drop=True) # Lists later: a ragged panel
+    strategy = InstitutionalPullbackStrategy(config)
+    scanner = PanelScanner(config, timeframe="1minute")
+
+    cases, signals = 0, 0
+    for end in frames["SYM0"]['timestamp'].iloc[30::3]:
+        cut = {s: df[df['timestamp'] <= end] for s, df in frames.items()}
+        found = {r['symbol']: r for r in scanner.scan(cut)}
+        for symbol, df in cut.items():
+            expected = _reference(strategy, df.reset_index(drop=True))
+            actual = found.get(symbol)
+            cases += 1
+            signals += expected is not None
+            assert (expected is None) == (actual is None), (symbol, end)
+            if expected:
+                assert actual['side'] == expected['side']
+                assert np.isclose(actual['stop_loss'], expected['stop_loss'])
+                assert np.isclose(actual['take_profit'], expected['take_profit'])
+    assert signals > 0, f"no signals in {cases} cases"
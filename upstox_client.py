@@ -1,19 +1,92 @@
-import requests
 import pandas as pd
 from datetime import datetime, timedelta
 import logging
+import time
 import urllib.parse
+from candle_store import MARKET_TZ
+from http_transport import HttpTransport
+from request_scheduler import ORDER, SIGNAL, BULK
 
 class UpstoxClient:
-    def __init__(self, access_token):
+    def __init__(self, access_token, candle_store=None, transport=None, base_url="https://api.upstox.com/v2",
+                 scheduler=None, order_retries=2):
         self.access_token = access_token
-        self.base_url = "https://api.upstox.com/v2"
+        self.order_retries = order_retries # Resends of an order answered 429 (never accepted, so safe)
+        self.transport = transport or HttpTransport() # Pooled keep-alive session shared across calls
+        self.scheduler = scheduler # Optional RequestScheduler: rate limits, priorities, coalescing
+        self.candle_store = candle_store # Optional CandleStore for delta fetching
+        self.base_url = base_url.rstrip("/")
         self.logger = logging.getLogger("UpstoxClient")
+
+        # Order path: URL, headers and per-instrument payloads are built once, not per order
+        self.order_url = f"{self.base_url}/order/place"
+        self.order_headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {self.access_token}'
+        }
+        self.order_templates = {} # (instrument_key, order_type, product) -> payload without quantity/side
+        self.last_sent = 0.0      # time.monotonic() of the last request, for keep-alive warm-ups
         
-    def get_historical_candles(self, instrument_key, interval, from_date, to_date):
+    def _send(self, method, url, endpoint, priority, **kwargs):
+        """
+        Sends through the request scheduler when one is attached. GETs for the
+        same URL share one in-flight request; POSTs never do.
+        """
+        self.last_sent = time.monotonic()
+        if self.scheduler is None:
+            return self.transport.request(method, url, endpoint=endpoint, **kwargs)
+        return self.scheduler.call(endpoint, lambda: self.transport.request(method, url, endpoint=endpoint, **kwargs),
+                                   priority=priority, key=url if method == 'GET' else None)
+
+    def get_historical_candles(self, instrument_key, interval, from_date, to_date, priority=SIGNAL):
         """
         Fetches historical candles from Upstox.
         interval: 1minute, 5minute, 30minute, day, etc.
+        With a candle store attached, only the range after the last stored bar is
+        downloaded and the result is served from the local store.
+        """
+        if self.candle_store is not None:
+            return self._get_stored_candles(instrument_key, interval, from_date, to_date, priority)
+
+        candles = self._fetch_candles(instrument_key, interval, from_date, to_date, priority)
+        if candles is None:
+            return None
+        # Upstox returns: [timestamp, open, high, low, close, volume, oi]
+        df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'oi'])
+
+        # Convert timestamp to datetime
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+
+        # Sort by timestamp ascending
+        df = df.sort_values('timestamp').reset_index(drop=True)
+        return df
+
+    def _get_stored_candles(self, instrument_key, interval, from_date, to_date, priority=SIGNAL):
+        """
+        Delta sync: fetch from the day of the last stored bar, append, read the range back as a writable frame.
+        """
+        store = self.candle_store
+        start_ns = pd.Timestamp(from_date, tz=MARKET_TZ).value
+        end_ns = (pd.Timestamp(to_date, tz=MARKET_TZ) + timedelta(days=1)).value
+
+        fetch_from = from_date
+        last = store.last_timestamp(instrument_key, interval)
+        if last is not None and last >= start_ns:
+            fetch_from = pd.Timestamp(last, tz='UTC').tz_convert(MARKET_TZ).strftime('%Y-%m-%d')
+
+        candles = self._fetch_candles(instrument_key, interval, fetch_from, to_date, priority)
+        if candles is None:
+            return None
+        added = store.append(instrument_key, interval, candles)
+        self.logger.debug(f"Candle store +{added} bars for {instrument_key} ({interval})")
+
+        df = store.read_frame(instrument_key, interval, start_ns, end_ns)
+        return df if not df.empty else None
+
+    def _fetch_candles(self, instrument_key, interval, from_date, to_date, priority=SIGNAL):
+        """
+        Raw candle rows from the historical-candle endpoint, or None on failure.
         """
         encoded_key = urllib.parse.quote(instrument_key)
         url = f"{self.base_url}/historical-candle/{encoded_key}/{interval}/{to_date}/{from_date}"
@@ -23,99 +96,158 @@ class UpstoxClient:
         }
         
         try:
-            self.logger.info(f"DEBUG: Fetching candles from {url}")
-            response = requests.get(url, headers=headers)
+            self.logger.debug(f"Fetching candles from {url}")
+            response = self._send('GET', url, 'historical-candle', priority, headers=headers)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('status') == 'success' and data.get('data'):
-                    candles = data['data']['candles']
-                    # Upstox returns: [timestamp, open, high, low, close, volume, oi]
-                    df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'oi'])
-                    
-                    # Convert timestamp to datetime
-                    df['timestamp'] = pd.to_datetime(df['timestamp'])
-                    
-                    # Sort by timestamp ascending
-                    df = df.sort_values('timestamp').reset_index(drop=True)
-                    return df
+                    return data['data']['candles']
                 else:
-                    self.logger.info(f"DEBUG: Upstox API Data Error: {data}")
+                    self.logger.debug(f"Upstox API Data Error: {data}")
                     self.logger.warning(f"No data or error in response: {data}")
                     return None
             else:
-                self.logger.info(f"DEBUG: Upstox API HTTP Error {response.status_code}: {response.text}")
+                self.logger.debug(f"Upstox API HTTP Error {response.status_code}: {response.text}")
                 self.logger.error(f"Upstox API Error: {response.text}")
                 return None
         except Exception as e:
-            self.logger.info(f"DEBUG: Upstox Exception: {e}")
+            self.logger.debug(f"Upstox Exception: {e}")
             self.logger.error(f"Exception fetching candles: {e}")
             return None
             
-    def get_market_ltp(self, instrument_key):
+    def get_market_ltp(self, instrument_key, priority=SIGNAL):
         """
         Get Last Traded Price (LTP) for a specific key
         """
-        encoded_key = urllib.parse.quote(instrument_key)
-        url = f"{self.base_url}/market-quote/ltp?instrument_key={encoded_key}"
+        return self.get_market_ltps([instrument_key], priority).get(instrument_key)
+
+    def get_market_ltps(self, instrument_keys, priority=SIGNAL):
+        """
+        Get Last Traded Prices for many keys in a single request.
+        Returns {requested_key: last_price} for every key Upstox answered.
+        """
+        keys = list(dict.fromkeys(k for k in instrument_keys if k))
+        if not keys:
+            return {}
+
+        encoded_keys = urllib.parse.quote(",".join(keys))
+        url = f"{self.base_url}/market-quote/ltp?instrument_key={encoded_keys}"
         headers = {
             'accept': 'application/json',
             'Authorization': f'Bearer {self.access_token}'
         }
         
         try:
-            self.logger.info(f"DEBUG: Fetching LTP from {url}")
-            response = requests.get(url, headers=headers)
+            self.logger.debug(f"Fetching LTP from {url}")
+            response = self._send('GET', url, 'market-quote/ltp', priority, headers=headers)
             if response.status_code == 200:
-                data = response.json().get('data', {})
-                self.logger.info(f"DEBUG: LTP API Data: {data}")
-                
-                # Upstox sometimes returns key with ':' instead of '|'
-                alt_key = instrument_key.replace('|', ':')
-                
-                if instrument_key in data:
-                    return data[instrument_key].get('last_price')
-                elif alt_key in data:
-                    return data[alt_key].get('last_price')
-                
-                # Fallback to first available value if only one key requested
-                if len(data) == 1:
-                    return list(data.values())[0].get('last_price')
-                    
-                return None
-            self.logger.info(f"DEBUG: LTP API Error {response.status_code}: {response.text}")
-            return None
+                data = response.json().get('data', {}) or {}
+                self.logger.debug(f"LTP API Data: {data}")
+                return self._match_ltps(keys, data)
+            self.logger.debug(f"LTP API Error {response.status_code}: {response.text}")
+            return {}
         except Exception as e:
-            self.logger.info(f"DEBUG: LTP API Exception: {e}")
+            self.logger.debug(f"LTP API Exception: {e}")
             self.logger.error(f"Exception fetching LTP: {e}")
-            return None
-    def place_order(self, instrument_key, quantity, side, order_type="MARKET", product="I"):
+            return {}
+
+    @staticmethod
+    def _match_ltps(keys, data):
         """
-        Places an order on Upstox.
-        product: I (Intraday), D (Delivery)
+        Maps the response back onto the requested keys.
+        Upstox answers with 'EXCHANGE:symbol' keys instead of 'EXCHANGE|token',
+        so match on the echoed instrument_token first, then on the ':' form.
         """
-        url = f"{self.base_url}/order/place"
+        by_token = {}
+        for resp_key, quote in data.items():
+            token = quote.get('instrument_token')
+            if token:
+                by_token[token] = quote
+            by_token.setdefault(resp_key, quote)
+
+        prices = {}
+        for key in keys:
+            quote = by_token.get(key) or by_token.get(key.replace('|', ':'))
+            if quote is not None and quote.get('last_price') is not None:
+                prices[key] = quote.get('last_price')
+
+        # Fallback to the only value if a single key was requested
+        if len(keys) == 1 and not prices and len(data) == 1:
+            prices[keys[0]] = list(data.values())[0].get('last_price')
+        return prices
+
+    def get_option_chain(self, underlying_key, expiry_date, priority=SIGNAL):
+        """
+        Put/call chain for one underlying and expiry (YYYY-MM-DD).
+        Returns the raw per-strike rows, or None on failure.
+        """
+        encoded_key = urllib.parse.quote(underlying_key)
+        url = f"{self.base_url}/option/chain?instrument_key={encoded_key}&expiry_date={expiry_date}"
         headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
+            'accept': 'application/json',
             'Authorization': f'Bearer {self.access_token}'
         }
-        payload = {
-            "quantity": int(quantity),
-            "product": product,
-            "validity": "DAY",
-            "price": 0,
-            "tag": "PullbackBot",
-            "instrument_token": instrument_key,
-            "order_type": order_type,
-            "transaction_type": side,
-            "disclosed_quantity": 0,
-            "trigger_price": 0,
-            "is_amo": False
-        }
-        
         try:
-            self.logger.info(f"DEBUG: Placing order on {url} | Payload: {payload}")
-            response = requests.post(url, headers=headers, json=payload)
+            response = self._send('GET', url, 'option/chain', priority, headers=headers)
+            if response.status_code == 200:
+                return response.json().get('data', []) or []
+            self.logger.error(f"Option chain error {response.status_code}: {response.text}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Exception fetching option chain: {e}")
+            return None
+
+    def order_template(self, instrument_key, order_type="MARKET", product="I"):
+        """
+        Cached order payload for an instrument; place_order only fills in
+        quantity and side. Call ahead of time to have it ready for the signal.
+        """
+        key = (instrument_key, order_type, product)
+        template = self.order_templates.get(key)
+        if template is None:
+            template = self.order_templates[key] = {
+                "quantity": 0,
+                "product": product,
+                "validity": "DAY",
+                "price": 0,
+                "tag": "PullbackBot",
+                "instrument_token": instrument_key,
+                "order_type": order_type,
+                "transaction_type": "BUY",
+                "disclosed_quantity": 0,
+                "trigger_price": 0,
+                "is_amo": False
+            }
+        return template
+
+    def place_order(self, instrument_key, quantity, side, order_type="MARKET", product="I", tag=None):
+        """
+        Places an order on Upstox and returns the order id as soon as it is
+        acknowledged (fills are picked up later via get_order_book).
+        product: I (Intraday), D (Delivery)
+        tag: overrides the template's tag, so the order can be found in the
+        order book even if its acknowledgement is lost
+        """
+        payload = dict(self.order_template(instrument_key, order_type, product))
+        payload["quantity"] = int(quantity)
+        payload["transaction_type"] = side
+        if tag:
+            payload["tag"] = tag
+
+        try:
+            self.logger.debug(f"Placing order on {self.order_url} | Payload: {payload}")
+            for attempt in range(self.order_retries + 1):
+                response = self._send('POST', self.order_url, 'order/place', ORDER, headers=self.order_headers, json=payload)
+                if response.status_code != 429 or attempt == self.order_retries:
+                    break
+                # Rate limited: Upstox did not accept the order, so sending it again cannot duplicate it
+                try:
+                    wait = float(response.headers.get('Retry-After') or 0)
+                except ValueError:
+                    wait = 0.0
+                wait = min(wait or 0.1 * 2 ** attempt, 1.0)
+                self.logger.warning(f"Order rate limited (429); resending in {wait * 1000:.0f}ms")
+                time.sleep(wait)
             if response.status_code == 200:
                 return response.json().get('data', {}).get('order_id')
             self.logger.error(f"Order Placement Failed {response.status_code}: {response.text}")
@@ -134,7 +266,7 @@ class UpstoxClient:
             'Authorization': f'Bearer {self.access_token}'
         }
         try:
-            response = requests.get(url, headers=headers)
+            response = self._send('GET', url, 'order/details', ORDER, headers=headers)
             if response.status_code == 200:
                 return response.json().get('data')
             return None
@@ -142,9 +274,47 @@ class UpstoxClient:
             self.logger.error(f"Exception fetching order details: {e}")
             return None
 
-    def get_positions(self):
+    def get_order_book(self, priority=ORDER):
         """
-        Fetches current open positions.
+        Every order of the day with its status and average fill price, in one
+        request. Returns None on failure.
+        """
+        url = f"{self.base_url}/order/retrieve-all"
+        headers = {
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {self.access_token}'
+        }
+        try:
+            response = self._send('GET', url, 'order/retrieve-all', priority, headers=headers)
+            if response.status_code == 200:
+                return response.json().get('data', []) or []
+            self.logger.error(f"Order book error {response.status_code}: {response.text}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Exception fetching order book: {e}")
+            return None
+
+    def warm_up(self, priority=BULK):
+        """
+        Cheap authenticated GET that opens (or keeps alive) a pooled connection,
+        so the next order skips the TCP+TLS handshake.
+        """
+        url = f"{self.base_url}/user/profile"
+        headers = {
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {self.access_token}'
+        }
+        try:
+            return self._send('GET', url, 'user/profile', priority, headers=headers).status_code == 200
+        except Exception as e:
+            self.logger.warning(f"Connection warm-up failed: {e}")
+            return False
+
+    def get_positions(self, priority=ORDER):
+        """
+        Fetches current open positions (ORDER priority by default: square-off
+        depends on it; the dashboard asks at UI priority). Returns None on
+        failure, so an error is never mistaken for being flat.
         """
         url = f"{self.base_url}/portfolio/get-positions"
         headers = {
@@ -152,10 +322,11 @@ class UpstoxClient:
             'Authorization': f'Bearer {self.access_token}'
         }
         try:
-            response = requests.get(url, headers=headers)
+            response = self._send('GET', url, 'portfolio/get-positions', priority, headers=headers)
             if response.status_code == 200:
-                return response.json().get('data', [])
-            return []
+                return response.json().get('data', []) or []
+            self.logger.error(f"Positions error {response.status_code}: {response.text}")
+            return None
         except Exception as e:
             self.logger.error(f"Exception fetching positions: {e}")
-            return []
+            return None
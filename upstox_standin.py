@@ -0,0 +1,502 @@
+import json
+import time
+import zlib
+import random
+import logging
+import argparse
+import threading
+import urllib.parse
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+from config import Config
+from candle_store import MARKET_TZ
+from market_generator import MarketGenerator
+from request_scheduler import TokenBucket
+
+# Starting prices for the configured indices; any other instrument (options, stocks) starts here
+BASE_PRICES = {"BANKNIFTY": 45000.0, "NIFTY": 24000.0, "SENSEX": 80000.0}
+OTHER_BASE_PRICE = 200.0
+
+INTERVAL_SECONDS = {'1minute': 60, '3minute': 180, '5minute': 300, '15minute': 900, '30minute': 1800}
+
+# Server behaviour presets. latency_ms is the median of a lognormal with `jitter` sigma;
+# rate limits are (requests, per seconds) like the real API's; fills happen fill_ms after placement
+PROFILES = {
+    'fast': {
+        'latency_ms': 0, 'jitter': 0.0, 'error_rate': 0.0, 'hang_rate': 0.0, 'hang_seconds': 0.0,
+        'rate_limits': (), 'order_rate_limits': (),
+        'fill_ms': 0, 'reject_rate': 0.0, 'slippage_bps': 0.0,
+    },
+    'realistic': {
+        'latency_ms': 25, 'jitter': 0.5, 'error_rate': 0.002, 'hang_rate': 0.0, 'hang_seconds': 0.0,
+        'rate_limits': ((50, 1.0), (500, 60.0)), 'order_rate_limits': ((10, 1.0),),
+        'fill_ms': 150, 'reject_rate': 0.005, 'slippage_bps': 5.0,
+    },
+    'degraded': {
+        'latency_ms': 150, 'jitter': 0.8, 'error_rate': 0.05, 'hang_rate': 0.01, 'hang_seconds': 15.0,
+        'rate_limits': ((25, 1.0), (300, 60.0)), 'order_rate_limits': ((5, 1.0),),
+        'fill_ms': 1500, 'reject_rate': 0.05, 'slippage_bps': 20.0,
+    },
+    'throttled': {
+        'latency_ms': 25, 'jitter': 0.5, 'error_rate': 0.0, 'hang_rate': 0.0, 'hang_seconds': 0.0,
+        'rate_limits': ((10, 1.0), (100, 60.0)), 'order_rate_limits': ((2, 1.0),),
+        'fill_ms': 150, 'reject_rate': 0.0, 'slippage_bps': 5.0,
+    },
+}
+
+def _error(code, message):
+    return {'status': 'error', 'errors': [{'errorCode': code, 'message': message}]}
+
+def _stamp(epoch):
+    """Exchange-local order-book time like Upstox's, with milliseconds so latency stays measurable."""
+    return datetime.fromtimestamp(epoch, ZoneInfo(MARKET_TZ)).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+class CandleSource:
+    """
+    Seedable candles for any instrument key. Each session is generated on its
+    own (seeded by instrument and day) from a daily random walk of opening
+    prices that passes through the base price today, so overlapping requests
+    always agree and nothing older than the requested days is ever built.
+    """
+    def __init__(self, seed=None, base_prices=None, vol=0.16, anchor="2020-01-01", cache_days=512):
+        self.seed = 0 if seed is None else seed
+        self.base_prices = dict(base_prices or {})
+        self.vol = vol
+        self.anchor = np.datetime64(anchor, 'D')
+        self.pivot = int(np.busday_count(self.anchor, np.datetime64(datetime.now().date(), 'D'))) # Day at the base price
+        self.cache_days = cache_days
+        self.opens = {}    # instrument key -> daily opening prices from the anchor
+        self.sessions = {} # (key, day, bar_seconds) -> arrays of one session
+        self.lock = threading.Lock()
+
+    def _key_seed(self, key):
+        return zlib.crc32(key.encode())
+
+    def _daily_open(self, key, day_index):
+        opens = self.opens.get(key)
+        if opens is None or day_index >= len(opens):
+            rng = np.random.default_rng([self.seed, self._key_seed(key)])
+            days = max(4096, day_index + 1, self.pivot + 1)
+            walk = np.cumsum(rng.standard_normal(days) * self.vol / np.sqrt(252))
+            base = self.base_prices.get(key, OTHER_BASE_PRICE)
+            opens = self.opens[key] = base * np.exp(walk - walk[self.pivot])
+        return float(opens[day_index])
+
+    def session(self, key, day, bar_seconds=60):
+        """(timestamps ns, open, high, low, close, volume) for one weekday session."""
+        cache_key = (key, day, bar_seconds)
+        with self.lock:
+            bars = self.sessions.get(cache_key)
+            if bars is None:
+                day_index = int(np.busday_count(self.anchor, day))
+                generator = MarketGenerator({key: self._daily_open(key, day_index)}, vols={key: self.vol},
+                                            seed=[self.seed, self._key_seed(key), day_index],
+                                            bar_seconds=bar_seconds, start=str(day), regimes=None)
+                df = generator.generate(generator.bars_per_day)[key]
+                bars = (pd.DatetimeIndex(df['timestamp']).asi8, # UTC epoch ns
+                        df['open'].to_numpy(), df['high'].to_numpy(), df['low'].to_numpy(),
+                        df['close'].to_numpy(), df['volume'].to_numpy())
+                if len(self.sessions) >= self.cache_days:
+                    self.sessions.pop(next(iter(self.sessions)))
+                self.sessions[cache_key] = bars
+        return bars
+
+    def candles(self, key, interval, from_date, to_date, now=None, limit=None):
+        """
+        Upstox-style rows [iso time, o, h, l, c, v, oi], newest first, for the
+        sessions in [from_date, to_date] up to `now`; at most `limit` rows.
+        """
+        bar_seconds = INTERVAL_SECONDS[interval]
+        now = now or datetime.now(ZoneInfo(MARKET_TZ))
+        now_ns = int(now.timestamp() * 10**9)
+        first = np.datetime64(from_date, 'D')
+        day = np.busday_offset(min(np.datetime64(to_date, 'D'), np.datetime64(now.date(), 'D')), 0, roll='backward')
+        chunks, count = [], 0
+        while day >= first and (limit is None or count < limit):
+            stamps, o, h, l, c, v = self.session(key, day, bar_seconds)
+            done = stamps <= now_ns # Only bars that have opened by now
+            chunks.append((stamps[done], o[done], h[done], l[done], c[done], v[done]))
+            count += int(done.sum())
+            day = np.busday_offset(day, -1, roll='backward')
+        rows = []
+        tz = ZoneInfo(MARKET_TZ)
+        for stamps, o, h, l, c, v in chunks:
+            times = [datetime.fromtimestamp(ns / 1e9, tz).isoformat() for ns in stamps[::-1]]
+            rows.extend([t, round(a, 2), round(b, 2), round(d, 2), round(e, 2), int(f), 0]
+                        for t, a, b, d, e, f in zip(times, o[::-1].tolist(), h[::-1].tolist(), l[::-1].tolist(),
+                                                     c[::-1].tolist(), v[::-1].tolist()))
+        return rows[:limit] if limit is not None else rows
+
+    def ltp(self, key, now=None):
+        """Close of the bar in progress at `now` (the last session's close out of hours)."""
+        now = (now or datetime.now(ZoneInfo(MARKET_TZ))).astimezone(ZoneInfo(MARKET_TZ))
+        day = np.busday_offset(np.datetime64(now.date(), 'D'), 0, roll='backward')
+        stamps, _, _, _, close, _ = self.session(key, day)
+        i = int(np.searchsorted(stamps, int(now.timestamp() * 10**9), side='right')) - 1
+        if i < 0: # Before today's open: the previous session's close
+            stamps, _, _, _, close, _ = self.session(key, np.busday_offset(day, -1, roll='backward'))
+        return round(float(close[i]), 2)
+
+class UpstoxStandIn:
+    """
+    Local, scriptable stand-in for the Upstox endpoints the bot uses:
+    historical candles, LTP quotes, order placement/details/order book,
+    positions, the profile warm-up and the OAuth dialog + token exchange.
+
+    Candles and prices come from a seeded CandleSource. Latency, errors,
+    hangs, rate limits (429 with Retry-After), fill delay, rejections and
+    slippage follow a profile that can be swapped at runtime with
+    set_profile() or POST /__profile; GET /__stats returns request counts.
+    Keep-alive HTTP/1.1 on a threaded server, like the real API.
+    """
+    def __init__(self, host="127.0.0.1", port=0, profile='fast', seed=None, max_candles=None, **overrides):
+        base = {Config.INDEX_MAPPINGS[name]: price for name, price in BASE_PRICES.items() if name in Config.INDEX_MAPPINGS}
+        self.source = CandleSource(seed=seed, base_prices=base)
+        self.rng = random.Random(seed)
+        self.max_candles = max_candles # Cap per candle response (the real API also limits history per call)
+        self.lock = threading.Lock()
+        self.orders = {}     # order id -> order
+        self.working = set() # ids of orders not yet filled or rejected
+        self.positions = {}  # instrument key -> {'net_quantity', 'buy_value', 'sell_value', 'product'}
+        self.order_seq = 0
+        self.tokens = 0
+        self.counts = {}     # (endpoint, status) -> requests
+        self.bodies = {}     # Encoded candle responses, keyed by request path
+        self.set_profile(profile, **overrides)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_port}/v2"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="upstox-standin", daemon=True)
+        self.logger = logging.getLogger("UpstoxStandIn")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_profile(self, profile='fast', **overrides):
+        """Switches behaviour to a PROFILES preset (or a dict), with field overrides; resets the limiters."""
+        settings = dict(PROFILES['fast'])
+        settings.update(PROFILES[profile] if isinstance(profile, str) else profile)
+        settings.update(overrides)
+        with self.lock:
+            self.profile = settings
+            self.buckets = [TokenBucket(*limit) for limit in settings['rate_limits']]
+            self.order_buckets = [TokenBucket(*limit) for limit in settings['order_rate_limits']]
+
+    def stats(self):
+        with self.lock:
+            return {f"{endpoint} {status}": count for (endpoint, status), count in sorted(self.counts.items())}
+
+    # --- Request pipeline ---
+
+    def handle(self, method, path, headers, body):
+        """Returns (status, payload dict or bytes, extra headers) for one request."""
+        parsed = urllib.parse.urlsplit(path)
+        route = parsed.path[len("/v2/"):] if parsed.path.startswith("/v2/") else parsed.path.lstrip("/")
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        endpoint = route.split("/")[0] if route.startswith("historical-candle/") else route
+
+        # 1. Control endpoints bypass the profile
+        if route == "__stats":
+            return 200, self.stats(), {}
+        if route == "__profile" and method == "POST":
+            settings = json.loads(body or b"{}")
+            self.set_profile(settings.pop('profile', 'fast'), **settings)
+            return 200, {'status': 'success', 'data': self.profile}, {}
+
+        # 2. Profile: rate limits, latency, injected failures
+        profile = self.profile
+        limited = self._take(endpoint.startswith("order/place"))
+        if limited:
+            return self._count(endpoint, 429, _error("UDAPI10005", "Too Many Request Sent"), {'Retry-After': '1'})
+        if profile['latency_ms']:
+            time.sleep(profile['latency_ms'] / 1000 * self.rng.lognormvariate(0, profile['jitter']))
+        if profile['hang_rate'] and self.rng.random() < profile['hang_rate']:
+            time.sleep(profile['hang_seconds'])
+        if profile['error_rate'] and self.rng.random() < profile['error_rate']:
+            status = self.rng.choice((500, 502, 503))
+            return self._count(endpoint, status, _error("UDAPI100500", "Something went wrong"), {})
+
+        # 3. Auth: everything but the OAuth flow needs a bearer token
+        if not route.startswith("login/") and not headers.get('Authorization', '').startswith('Bearer '):
+            return self._count(endpoint, 401, _error("UDAPI100050", "Invalid token used to access API"), {})
+
+        status, payload, extra = self._route(method, route, query, body)
+        return self._count(endpoint, status, payload, extra)
+
+    def _take(self, is_order):
+        """True if a rate limit is exhausted; otherwise takes one token from every limiter."""
+        with self.lock:
+            buckets = self.buckets + (self.order_buckets if is_order else [])
+            now = time.monotonic()
+            for bucket in buckets:
+                bucket.refill(now)
+            if any(bucket.tokens < 1.0 for bucket in buckets):
+                return True
+            for bucket in buckets:
+                bucket.tokens -= 1.0
+            return False
+
+    def _count(self, endpoint, status, payload, extra):
+        with self.lock:
+            self.counts[(endpoint, status)] = self.counts.get((endpoint, status), 0) + 1
+        return status, payload, extra
+
+    def _route(self, method, route, query, body):
+        if method == "GET" and route.startswith("historical-candle/"):
+            return self._candles(route)
+        if method == "GET" and route == "market-quote/ltp":
+            return self._ltp(query)
+        if method == "POST" and route == "order/place":
+            return self._place(body)
+        if method == "GET" and route == "order/details":
+            self._settle()
+            order = self.orders.get(query.get('order_id'))
+            if order is None:
+                return 400, _error("UDAPI100010", "Order not found"), {}
+            return 200, {'status': 'success', 'data': order}, {}
+        if method == "GET" and route == "order/retrieve-all":
+            self._settle()
+            with self.lock:
+                return 200, {'status': 'success', 'data': list(self.orders.values())}, {}
+        if method == "GET" and route == "portfolio/get-positions":
+            return self._positions()
+        if method == "GET" and route == "user/profile":
+            return 200, {'status': 'success', 'data': {'user_name': 'Stand-in', 'broker': 'UPSTOX', 'is_active': True}}, {}
+        if method == "GET" and route == "login/authorization/dialog":
+            redirect = query.get('redirect_uri', '')
+            location = f"{redirect}{'&' if '?' in redirect else '?'}code=standin-{self.rng.randrange(10**6):06d}"
+            return 302, b"", {'Location': location}
+        if method == "POST" and route == "login/authorization/token":
+            form = dict(urllib.parse.parse_qsl((body or b"").decode()))
+            if not form.get('code'):
+                return 400, _error("UDAPI100069", "Check your 'code' value"), {}
+            with self.lock:
+                self.tokens += 1
+                token = f"standin-token-{self.tokens}"
+            return 200, {'access_token': token, 'user_name': 'Stand-in', 'email': 'standin@example.com'}, {}
+        return 404, _error("UDAPI100060", f"Resource not found: {route}"), {}
+
+    def _candles(self, route):
+        parts = route.split("/")
+        if len(parts) != 5:
+            return 400, _error("UDAPI1021", "Invalid candle request"), {}
+        _, key, interval, to_date, from_date = parts
+        key = urllib.parse.unquote(key)
+        if interval not in INTERVAL_SECONDS:
+            return 400, _error("UDAPI1020", f"Invalid interval: {interval}"), {}
+        now = datetime.now(ZoneInfo(MARKET_TZ))
+        today = now.strftime('%Y-%m-%d')
+        cache_key = (route, now.strftime('%H:%M') if to_date >= today else None) # Today's candles grow once a minute
+        body = self.bodies.get(cache_key)
+        if body is None:
+            rows = self.source.candles(key, interval, from_date, to_date, now=now, limit=self.max_candles)
+            body = json.dumps({'status': 'success', 'data': {'candles': rows}}).encode()
+            if len(self.bodies) > 256:
+                self.bodies.clear()
+            self.bodies[cache_key] = body
+        return 200, body, {}
+
+    def _ltp(self, query):
+        keys = [k for k in query.get('instrument_key', '').split(",") if k]
+        if not keys:
+            return 400, _error("UDAPI1009", "instrument_key is required"), {}
+        data = {key.replace('|', ':'): {'instrument_token': key, 'last_price': self.source.ltp(key)} for key in keys}
+        return 200, {'status': 'success', 'data': data}, {}
+
+    def _place(self, body):
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return 400, _error("UDAPI1004", "Invalid JSON"), {}
+        missing = [f for f in ('instrument_token', 'quantity', 'transaction_type', 'order_type', 'product') if f not in payload]
+        if missing:
+            return 400, _error("UDAPI1004", f"Missing fields: {', '.join(missing)}"), {}
+        if int(payload['quantity']) <= 0 or payload['transaction_type'] not in ("BUY", "SELL"):
+            return 400, _error("UDAPI1004", "Invalid quantity or transaction_type"), {}
+        now = time.time()
+        with self.lock:
+            self.order_seq += 1
+            order_id = f"{datetime.now().strftime('%y%m%d')}{self.order_seq:09d}"
+            self.working.add(order_id)
+            self.orders[order_id] = {
+                'order_id': order_id,
+                'instrument_token': payload['instrument_token'],
+                'quantity': int(payload['quantity']),
+                'transaction_type': payload['transaction_type'],
+                'order_type': payload['order_type'],
+                'product': payload['product'],
+                'status': 'open',
+                'average_price': 0.0,
+                'filled_quantity': 0,
+                'order_timestamp': _stamp(now),
+                'exchange_timestamp': None,
+                'tag': payload.get('tag'),
+                '_placed': now,
+            }
+        if not self.profile['fill_ms']:
+            self._settle()
+        return 200, {'status': 'success', 'data': {'order_id': order_id}}, {}
+
+    def _settle(self):
+        """Fills (or rejects) open orders whose fill delay has passed and updates positions."""
+        profile = self.profile
+        due = time.time() - profile['fill_ms'] / 1000
+        with self.lock:
+            for order_id in list(self.working):
+                order = self.orders[order_id]
+                if order['_placed'] > due:
+                    continue
+                self.working.discard(order_id)
+                if profile['reject_rate'] and self.rng.random() < profile['reject_rate']:
+                    order['status'] = 'rejected'
+                    order['status_message'] = "Stand-in rejection"
+                    continue
+                sign = 1 if order['transaction_type'] == "BUY" else -1
+                price = self.source.ltp(order['instrument_token']) * (1 + sign * profile['slippage_bps'] / 10_000)
+                order.update(status='complete', average_price=round(price, 2), filled_quantity=order['quantity'],
+                             exchange_timestamp=_stamp(order['_placed'] + profile['fill_ms'] / 1000))
+                position = self.positions.setdefault(order['instrument_token'], {
+                    'net_quantity': 0, 'buy_value': 0.0, 'sell_value': 0.0, 'product': order['product']})
+                position['net_quantity'] += sign * order['quantity']
+                position['buy_value' if sign > 0 else 'sell_value'] += price * order['quantity']
+
+    def _positions(self):
+        self._settle()
+        with self.lock:
+            data = [{'instrument_token': key, 'product': p['product'], 'net_quantity': p['net_quantity'],
+                     'buy_value': round(p['buy_value'], 2), 'sell_value': round(p['sell_value'], 2),
+                     'last_price': self.source.ltp(key)} for key, p in self.positions.items()]
+        return 200, {'status': 'success', 'data': data}, {}
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like the real API
+            disable_nagle_algorithm = True # Headers and body go out as separate writes
+
+            def _serve(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, payload, extra = standin.handle(method, self.path, self.headers, body)
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in extra.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+# --- Load test ---
+
+def load_test(base_url, concurrency=(1, 4, 16), seconds=5.0, mix=("ltp", "candles", "order"), scheduler=False):
+    """
+    Drives UpstoxClient against `base_url` with N threads per concurrency
+    level for `seconds` each (no retries) and reports throughput and latency
+    per level, to find where errors, 429s or latency start to climb. With
+    `scheduler`, calls go through a default RequestScheduler first.
+    """
+    from upstox_client import UpstoxClient
+    from http_transport import HttpTransport
+    from request_scheduler import RequestScheduler
+    keys = list(Config.INDEX_MAPPINGS.values())
+    today = datetime.now(ZoneInfo(MARKET_TZ))
+    from_date = (today - timedelta(days=5)).strftime('%Y-%m-%d')
+    to_date = today.strftime('%Y-%m-%d')
+    calls = {
+        'ltp': lambda c: c.get_market_ltps(keys),
+        'candles': lambda c: c.get_historical_candles(keys[0], "1minute", from_date, to_date),
+        'order': lambda c: c.place_order("NSE_FO|12345", 15, "BUY"),
+        'positions': lambda c: c.get_positions(),
+    }
+    results = []
+    for workers in concurrency:
+        transport = HttpTransport(pool_size=workers, max_retries=0)
+        client = UpstoxClient("load-test", transport=transport, base_url=base_url,
+                              scheduler=RequestScheduler() if scheduler else None)
+        stop = time.perf_counter() + seconds
+
+        def worker(offset):
+            i = offset
+            while time.perf_counter() < stop:
+                calls[mix[i % len(mix)]](client)
+                i += 1
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        stats = transport.stats()
+        total = sum(s['calls'] for s in stats.values())
+        errors = sum(s['errors'] for s in stats.values())
+        results.append({
+            'concurrency': workers,
+            'requests': total,
+            'rps': round(total / elapsed, 1),
+            'error_pct': round(100.0 * errors / total, 2) if total else 0.0,
+            'latency_ms': {endpoint: {'p50': round(s['p50'] * 1000, 1), 'p95': round(s['p95'] * 1000, 1)}
+                           for endpoint, s in stats.items()},
+        })
+        transport.close()
+    return results
+
+if __name__ == "__main__":
+    # Serve:      python upstox_standin.py --port 8085 --profile realistic --seed 42
+    #             (then UPSTOX_BASE_URL=http://127.0.0.1:8085/v2 python main_cloud.py)
+    # Load test:  python upstox_standin.py --profile realistic --load-test --concurrency 1,8,32
+    parser = argparse.ArgumentParser(description="Local Upstox API stand-in for end-to-end and load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--profile", default="fast", choices=sorted(PROFILES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, help="override the profile's median latency")
+    parser.add_argument("--error-rate", type=float, help="override the profile's 5xx share")
+    parser.add_argument("--load-test", action="store_true", help="run a load test against the stand-in and exit")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated thread counts for --load-test")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each --load-test level")
+    parser.add_argument("--mix", default="ltp,candles,order", help="calls cycled by each --load-test thread")
+    parser.add_argument("--scheduler", action="store_true", help="send --load-test calls through the RequestScheduler")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.load_test:
+        # Failed calls are counted in the report; one log line each would drown it
+        for name in ("UpstoxClient", "HttpTransport", "RequestScheduler"):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+    overrides = {k: v for k, v in (('latency_ms', args.latency_ms), ('error_rate', args.error_rate)) if v is not None}
+    with UpstoxStandIn(args.host, 0 if args.load_test else args.port, profile=args.profile, seed=args.seed,
+                       **overrides) as standin:
+        if args.load_test:
+            levels = [int(n) for n in args.concurrency.split(",")]
+            for row in load_test(standin.base_url, levels, args.seconds, tuple(args.mix.split(",")), args.scheduler):
+                print(json.dumps(row))
+            print(json.dumps(standin.stats()))
+        else:
+            standin.logger.info(f"Upstox stand-in ({args.profile}) listening on {standin.base_url}")
+            try:
+                standin.thread.join()
+            except KeyboardInterrupt:
+                pass